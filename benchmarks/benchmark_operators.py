@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""Benchmark the key operators with synthetic chunks.
+
+The results are saved as JSON, and could be compared with a baseline
+produced by a previous run to catch performance regressions in CI:
+
+    python benchmarks/benchmark_operators.py -o baseline.json
+    python benchmarks/benchmark_operators.py -o current.json -b baseline.json
+"""
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+from time import perf_counter, strftime
+
+import numpy as np
+import click
+
+from chunkflow.chunk import Chunk
+from chunkflow.lib.cartesian_coordinate import Cartesian
+
+
+# registered benchmark cases: name ==> function
+CASES = {}
+# the cases creating chunks with their own data type
+DTYPE_FREE_CASES = set()
+
+
+def case(name: str, dtype_free: bool = False):
+    """register a benchmark case.
+
+    The case function takes the chunk size, data type and a temporary
+    directory. It returns a function without argument to be timed,
+    and optionally a function to clean up after every run.
+    """
+    def decorator(func):
+        CASES[name] = func
+        if dtype_free:
+            DTYPE_FREE_CASES.add(name)
+        return func
+    return decorator
+
+
+@case('inference-identity')
+def inference_identity(size: tuple, dtype: str, tempdir: str):
+    from chunkflow.flow.divid_conquer.inferencer import Inferencer
+    input_patch_size = Cartesian(16, 128, 128)
+    patch_overlap = Cartesian(4, 32, 32)
+    stride = input_patch_size - patch_overlap
+    # align the chunk size with the patches
+    size = tuple(p + max(s - p, 0) // t * t
+        for s, p, t in zip(size, input_patch_size, stride))
+    image = Chunk.create(size=size, dtype=dtype)
+    inferencer = Inferencer(None, None, input_patch_size,
+        num_output_channels=3,
+        output_patch_overlap=patch_overlap,
+        input_size=size,
+        framework='identity',
+        batch_size=4,
+        dtype='float32')
+    return lambda: inferencer(image)
+
+
+def _blend_output_patches(size: tuple, accumulation_dtype: str):
+    from chunkflow.flow.divid_conquer.inferencer import Inferencer
+    input_patch_size = Cartesian(16, 128, 128)
+    patch_overlap = Cartesian(4, 32, 32)
+    batch_size = 4
+    image = Chunk.create(size=size, dtype=np.float32)
+    inferencer = Inferencer(None, None, input_patch_size,
+        num_output_channels=3,
+        output_patch_overlap=patch_overlap,
+        framework='identity',
+        batch_size=batch_size,
+        dtype='float32',
+        accumulation_dtype=accumulation_dtype)
+    inferencer._update_parameters_for_input_chunk(image)
+    buffer = inferencer._get_output_buffer(image).array
+    # the output patches of the convnet are multiplied by the patch mask
+    output_patches = np.random.rand(batch_size, 3, *input_patch_size).astype(
+        np.float32) * inferencer.patch_inferencer.output_patch_mask_numpy
+    patch_indices = np.arange(len(inferencer.output_patch_slices_list))
+
+    def run():
+        for i in range(0, len(patch_indices), batch_size):
+            batch_indices = patch_indices[i:i + batch_size]
+            inferencer._blend_output_patches(buffer,
+                output_patches[:len(batch_indices)], batch_indices)
+    return run, lambda: buffer.fill(0)
+
+
+@case('blend-patches', dtype_free=True)
+def blend_patches(size: tuple, dtype: str, tempdir: str):
+    return _blend_output_patches(size, 'float32')
+
+
+@case('blend-patches-uint16', dtype_free=True)
+def blend_patches_uint16(size: tuple, dtype: str, tempdir: str):
+    return _blend_output_patches(size, 'uint16')
+
+
+@case('mask')
+def mask(size: tuple, dtype: str, tempdir: str):
+    from cloudvolume import CloudVolume
+    from chunkflow.flow.mask import MaskOperator
+    factor = (1, 4, 4)
+    mask_size = tuple(s // f for s, f in zip(size, factor))
+    mask_array = np.random.randint(0, 2, size=mask_size, dtype=np.uint8)
+    volume_path = 'file://' + os.path.join(tempdir, 'mask')
+    CloudVolume.from_numpy(mask_array.transpose(), vol_path=volume_path,
+        resolution=factor[::-1], chunk_size=(64, 64, 16),
+        layer_type='image')
+    operator = MaskOperator(volume_path, 0, 0)
+    image = Chunk.create(size=size, dtype=dtype, voxel_size=(1, 1, 1))
+    return lambda: operator([image.clone()])
+
+
+@case('downsample')
+def downsample(size: tuple, dtype: str, tempdir: str):
+    import tinybrain
+    image = Chunk.create(size=size, dtype=dtype)
+    return lambda: tinybrain.downsample_with_averaging(image.array, (2, 2, 2))
+
+
+@case('connected-components', dtype_free=True)
+def connected_components(size: tuple, dtype: str, tempdir: str):
+    probability_map = Chunk.create(size=size, dtype=np.float32)
+    return lambda: probability_map.connected_component(threshold=0.5)
+
+
+@case('mesh', dtype_free=True)
+def mesh(size: tuple, dtype: str, tempdir: str):
+    from chunkflow.flow.mesh import MeshOperator
+    seg = Chunk.create(size=size, dtype=np.float32)
+    seg = (seg < 0.5).astype(np.uint32)
+    operator = MeshOperator('file://' + os.path.join(tempdir, 'mesh'), 'obj')
+    return lambda: operator(seg)
+
+
+@case('quantize', dtype_free=True)
+def quantize(size: tuple, dtype: str, tempdir: str):
+    from chunkflow.chunk.affinity_map import AffinityMap
+    affs = AffinityMap(np.random.rand(3, *size).astype(np.float32))
+    return lambda: affs.quantize()
+
+
+def _create_precomputed(size: tuple, dtype: str, tempdir: str):
+    from cloudvolume import CloudVolume
+    image = Chunk.create(size=size, dtype=dtype)
+    volume_path = 'file://' + os.path.join(tempdir, 'precomputed')
+    CloudVolume.from_numpy(image.array.transpose(), vol_path=volume_path,
+        chunk_size=(64, 64, 16), layer_type='image')
+    return image, volume_path
+
+
+@case('save-precomputed')
+def save_precomputed(size: tuple, dtype: str, tempdir: str):
+    from chunkflow.flow.save_precomputed import SavePrecomputedOperator
+    image, volume_path = _create_precomputed(size, dtype, tempdir)
+    operator = SavePrecomputedOperator(volume_path, 0, upload_log=False)
+    operator.volume.progress = False
+    return lambda: operator(image)
+
+
+@case('load-precomputed')
+def load_precomputed(size: tuple, dtype: str, tempdir: str):
+    from chunkflow.flow.load_precomputed import LoadPrecomputedOperator
+    image, volume_path = _create_precomputed(size, dtype, tempdir)
+    operator = LoadPrecomputedOperator(volume_path)
+    return lambda: operator(image.bbox)
+
+
+@case('save-h5')
+def save_h5(size: tuple, dtype: str, tempdir: str):
+    image = Chunk.create(size=size, dtype=dtype)
+    file_name = os.path.join(tempdir, 'chunk.h5')
+    return lambda: image.to_h5(file_name), lambda: os.remove(file_name)
+
+
+@case('load-h5')
+def load_h5(size: tuple, dtype: str, tempdir: str):
+    image = Chunk.create(size=size, dtype=dtype)
+    file_name = os.path.join(tempdir, 'chunk.h5')
+    image.to_h5(file_name)
+    return lambda: Chunk.from_h5(file_name)
+
+
+@case('save-zarr')
+def save_zarr(size: tuple, dtype: str, tempdir: str):
+    import zarr
+    image = Chunk.create(size=size, dtype=dtype)
+    store = os.path.join(tempdir, 'chunk.zarr')
+
+    def run():
+        za = zarr.open(store, mode='w', shape=image.shape,
+            chunks=(16, 64, 64), dtype=image.dtype)
+        za[:] = image.array
+    return run, lambda: shutil.rmtree(store)
+
+
+@case('load-zarr')
+def load_zarr(size: tuple, dtype: str, tempdir: str):
+    import zarr
+    image = Chunk.create(size=size, dtype=dtype)
+    store = os.path.join(tempdir, 'chunk.zarr')
+    za = zarr.open(store, mode='w', shape=image.shape,
+        chunks=(16, 64, 64), dtype=image.dtype)
+    za[:] = image.array
+    return lambda: zarr.open(store, mode='r')[:]
+
+
+def run_case(name: str, size: tuple, dtype: str, repeat: int) -> dict:
+    tempdir = tempfile.mkdtemp()
+    try:
+        functions = CASES[name](size, dtype, tempdir)
+        if callable(functions):
+            functions = (functions, None)
+        run, cleanup = functions
+
+        durations = []
+        # the first run is a warm up
+        for idx in range(repeat + 1):
+            start = perf_counter()
+            run()
+            if idx > 0:
+                durations.append(perf_counter() - start)
+            if cleanup is not None:
+                cleanup()
+    finally:
+        shutil.rmtree(tempdir)
+
+    voxel_num = int(np.prod(size))
+    seconds = float(np.median(durations))
+    return {
+        'case': name,
+        'size': list(size),
+        'dtype': dtype,
+        'repeat': repeat,
+        'seconds': seconds,
+        'min_seconds': float(np.min(durations)),
+        'megavoxels_per_second': voxel_num / seconds / 1e6,
+    }
+
+
+def result_key(result: dict) -> str:
+    size = 'x'.join(str(s) for s in result['size'])
+    return f"{result['case']}/{size}/{result['dtype']}"
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """find the cases slower than the baseline.
+
+    Returns:
+        list of str: the description of regressions.
+    """
+    baseline = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[key]['seconds']
+        print(f'{key}: {ratio:.2f} times of baseline')
+        if ratio > 1. + tolerance:
+            regressions.append(
+                f"{key} takes {result['seconds']:.4f} seconds, " +
+                f"baseline is {baseline[key]['seconds']:.4f} seconds.")
+    return regressions
+
+
+@click.command()
+@click.option('--case', '-c', 'cases', type=click.Choice(list(CASES.keys())),
+    multiple=True, default=None, help='benchmark cases. default is all.')
+@click.option('--size', '-s', 'sizes', type=click.INT, nargs=3, multiple=True,
+    default=((32, 256, 256), (64, 512, 512)), help='chunk sizes in z,y,x.')
+@click.option('--dtype', '-d', 'dtypes', multiple=True,
+    type=click.Choice(['uint8', 'float32']), default=('uint8', 'float32'),
+    help='data types of the synthetic image chunks.')
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3,
+    help='number of timed runs of every case. The median is reported.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+    default='benchmark.json', help='output JSON file.')
+@click.option('--baseline', '-b', type=click.Path(exists=True, dir_okay=False),
+    default=None, help='the JSON file of a previous run to compare with.')
+@click.option('--tolerance', '-t', type=click.FLOAT, default=0.2,
+    help='fail if a case is slower than the baseline by this ratio.')
+def main(cases, sizes, dtypes, repeat, output, baseline, tolerance):
+    """Benchmark the operators with synthetic chunks."""
+    if not cases:
+        cases = list(CASES.keys())
+
+    results = []
+    for name in cases:
+        for size in sizes:
+            case_dtypes = ('float32',) if name in DTYPE_FREE_CASES else dtypes
+            for dtype in case_dtypes:
+                result = run_case(name, size, dtype, repeat)
+                print(f"{result_key(result)}: {result['seconds']:.4f} seconds, " +
+                    f"{result['megavoxels_per_second']:.2f} megavoxels/second")
+                results.append(result)
+
+    with open(output, 'w') as file:
+        json.dump({
+            'time': strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'results': results,
+        }, file, indent=2)
+    print(f'saved benchmark results to {output}')
+
+    if baseline is not None:
+        with open(baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, tolerance)
+        if regressions:
+            print('\n'.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
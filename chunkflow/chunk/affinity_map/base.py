@@ -7,13 +7,14 @@ from chunkflow.chunk import Chunk
 
 class AffinityMap(Chunk):
     """
-    a chunk of affinity map. It has x,y,z three channels with single precision.
+    a chunk of affinity map. It has x,y,z three channels with single or 
+    half precision.
     """
     def __init__(self, array, 
             voxel_offset: Cartesian=None, 
             voxel_size: Cartesian=None ):
         assert array.ndim == 4
-        assert np.issubdtype(array.dtype, np.float32)
+        assert array.dtype in (np.float16, np.float32)
         assert array.shape[0] == 3
         super().__init__(array, voxel_offset=voxel_offset, voxel_size=voxel_size)
 
@@ -495,11 +495,12 @@ ends with {cutout_stop}, size is {cutout_size}, voxel size is {voxel_size}.""")
 
     @property
     def is_affinity_map(self) -> bool:
-        return self.array.ndim == 4 and self.shape[0] == 3 and self.array.dtype == np.float32
+        return self.array.ndim == 4 and self.shape[0] == 3 and \
+            self.array.dtype in (np.float16, np.float32)
     
     @property
     def is_probability_map(self) -> bool:
-        return (self.array.dtype == np.float32) and \
+        return (self.array.dtype in (np.float16, np.float32)) and \
             (np.max(self.array) <= 1.) and \
             (np.min(self.array) >= 0.)
 
@@ -537,6 +538,10 @@ ends with {cutout_stop}, size is {cutout_size}, voxel size is {voxel_size}.""")
     def size(self):
         return self.array.size
 
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
     @property
     def slices(self) -> tuple:
         """
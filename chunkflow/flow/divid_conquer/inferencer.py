@@ -3,10 +3,15 @@ __doc__ = """
 ConvNet Inference of an image chunk
 """
 import os
+import json
+import hashlib
+import tempfile
 
 import time
 from warnings import warn
 from typing import Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from tqdm import tqdm
@@ -14,6 +19,7 @@ from tqdm import tqdm
 from chunkflow.lib.cartesian_coordinate import Cartesian, to_cartesian
 
 from .patch.base import PatchInferencerBase
+from .patch_cache import PatchCache
 from chunkflow.chunk import Chunk
 from .transform import TransformSequences
 
@@ -34,43 +40,61 @@ class Inferencer(object):
     large chunk size.
     """
     def __init__(self,
-            convnet_model: Union[str, PatchInferencerBase],
-            convnet_weight_path: str,
+            convnet_model: Union[str, PatchInferencerBase, list],
+            convnet_weight_path: Union[str, list],
             input_patch_size: Union[tuple, list, Cartesian],
             output_patch_size: Union[tuple, list, Cartesian] = None,
             patch_num: Union[tuple, list, Cartesian] = None,
             num_input_channels: int = 1,
-            num_output_channels: int = 3,
+            num_output_channels: Union[int, list] = 3,
             output_patch_overlap: Union[tuple, list, Cartesian] = None,
             output_crop_margin: Union[tuple, list, Cartesian] = None,
             dtype = 'float32',
             framework: str = 'universal',
-            batch_size: int = 1,
+            framework_args: dict = None,
+            batch_size: Union[int, str] = 1,
             bump: str = 'wu',
             input_size: Union[tuple, list, Cartesian] = None,
             mask_output_chunk: bool = True,
             mask_myelin_threshold = None,
             augment: bool = False,
+            num_patch_buffers: int = 1,
+            output_buffer: str = 'ram',
+            scratch_dir: str = None,
+            skip_empty_patches: bool = False,
+            patch_cache_dir: str = None,
+            patch_cache_size: int = 16 * 1024**3,
+            batch_memory_limit: int = None,
+            accumulation_dtype: str = None,
             dry_run: bool = False):
         """convnet inference patch by patch in a chunk
 
         Args:
-            convnet_model (Union[str, PatchInferencerBase]): the path of convnet model
-            convnet_weight_path (str): the path of trained model weights
+            convnet_model (Union[str, PatchInferencerBase, list]): the path of convnet model. A list of models share the same input patches and patch geometry, and the output channels are concatenated in order. Use `split_output_chunk` to get the output of every model.
+            convnet_weight_path (Union[str, list]): the path of trained model weights
             input_patch_size (Union[tuple, list, Cartesian]): input patch size, zyx
             output_patch_size (Union[tuple, list, Cartesian], optional): output patch size. Defaults to the same with input patch size.
             patch_num (Union[tuple, list, Cartesian], optional): number of patches. Defaults to be computed.
-            num_output_channels (int, optional): number of output channels. Defaults to 3.
+            num_output_channels (Union[int, list], optional): number of output channels of every model. Defaults to 3.
             output_patch_overlap (Union[tuple, list, Cartesian], optional): the overlap size of output patch size. Defaults to be half of output patch size.
             output_crop_margin (Union[tuple, list, Cartesian], optional): crop some output patch margin. Defaults to None.
             dtype (str, optional): data type named consistantly with numpy. Defaults to 'float32'.
-            framework (str, optional): ['universal', 'identity', 'pytorch']. Defaults to 'universal'.
-            batch_size (int, optional): batch size in one pass. this parameter seems do not accelarate computation. Defaults to 1.
+            framework (str, optional): ['universal', 'identity', 'pytorch', 'onnxruntime']. Defaults to 'universal'.
+            framework_args (dict, optional): the extra keyword arguments of the patch inferencer, such as the number of threads of onnxruntime. Defaults to None.
+            batch_size (Union[int, str], optional): batch size in one pass. With 'auto', a few batch sizes are benchmarked with a random patch and the one with the most voxels per second is used. The result is cached in the $CHUNKFLOW_CACHE_DIR/batch_size directory (default is ~/.cache/chunkflow/batch_size), keyed by the hash of model files and the patch configuration. Defaults to 1.
             bump (str, optional): bump function. Defaults to 'wu'.
             input_size (Union[tuple, list, Cartesian], optional): input chunk size. Defaults to None.
             mask_output_chunk (bool, optional): normalize on the chunk level rather than patch level. Defaults to True.
             mask_myelin_threshold (_type_, optional): threshold to segment the myelin. Defaults to None.
-            test_time_augmentation (bool, optional): augment the image patch, inference, transform back and blend. Defaults to True.
+            test_time_augmentation (bool, optional): augment the image patch, inference, transform back and blend. The 8 transformed copies of a batch are stacked in one forward pass with 8 times of the batch size, except for the pytorch backend requiring a batch size of 1. Defaults to True.
+            num_patch_buffers (int, optional): number of rotating input patch buffers. With more than one buffer, the input patches are gathered and the output patches are blended in two worker threads, overlapping with the convnet forward pass. The patch inferencer should return a new array for every batch in this mode. Defaults to 1.
+            output_buffer (str, optional): ['ram', 'memmap']. The memmap output buffer is mapped to an anonymous temporary file in the scratch directory, so the output chunk could be larger than RAM, and the finished pages are written back to disk by the operating system. Defaults to 'ram'.
+            scratch_dir (str, optional): the directory of memmap output buffer files. Defaults to the system temporary directory.
+            skip_empty_patches (bool, optional): skip the patches with all zero input, the same as an all zero input chunk. The output of skipped patches is zero rather than the network prediction. Defaults to False.
+            patch_cache_dir (str, optional): the local directory to cache the output patches. The patches along the shared faces of overlapping chunks are reused if the model, global bounding box and input are the same. Defaults to None, no cache.
+            patch_cache_size (int, optional): the maximum bytes of cached output patches. The least recently used patches are evicted. Defaults to 16 GiB.
+            accumulation_dtype (str, optional): ['float32', 'float16', 'uint16']. The data type of the output buffer to accumulate the output patches. With float16 and uint16, the output patches are normalized by the chunk mask while blending. The uint16 buffer is fixed point with a scale of 65535/1.01, and it is converted to float16 in the same memory at the end. The output chunk is float16. Defaults to the same with dtype.
+            batch_memory_limit (int, optional): the maximum bytes of patch buffers to try with automatic batch size. The memory of the convnet itself is not included. Defaults to a quarter of the available memory.
             dry_run (bool, optional): only compute parameters and setup, do not perform any real computation. Defaults to False.
         """
         assert input_size is None or patch_num is None 
@@ -142,38 +166,205 @@ class Inferencer(object):
             self.input_size = None 
             self.output_size = None
         
+        # multiple models share the same input patches
+        model_num = max([len(x) for x in (convnet_model, convnet_weight_path, 
+            num_output_channels) if isinstance(x, (list, tuple))], default=1)
+        if model_num > 1:
+            convnet_model, convnet_weight_path, num_output_channels = (
+                _broadcast(x, model_num) for x in (
+                convnet_model, convnet_weight_path, num_output_channels))
+            # the myelin channel is the last channel of a single model
+            assert mask_myelin_threshold is None
+            self.output_channel_nums = num_output_channels
+            num_output_channels = sum(num_output_channels)
+        else:
+            self.output_channel_nums = [num_output_channels]
+
         self.num_input_channels = num_input_channels
         self.num_output_channels = num_output_channels
         self.mask_output_chunk = mask_output_chunk
         self.output_chunk_mask = None
         self.dtype = dtype        
+        if accumulation_dtype is None:
+            accumulation_dtype = dtype
+        assert accumulation_dtype in ('float32', 'float16', 'uint16')
+        self.accumulation_dtype = np.dtype(accumulation_dtype)
+        if self.accumulation_dtype == np.uint16:
+            # the fixed point scale of the uint16 output buffer. The 
+            # blended values are in [0, 1], leave some room for the 
+            # rounding errors of every patch.
+            self.accumulation_scale = np.iinfo(np.uint16).max / 1.01
+        else:
+            self.accumulation_scale = None
         self.mask_myelin_threshold = mask_myelin_threshold
         self.dry_run = dry_run
-        
-        # allocate a buffer to avoid redundant memory allocation
-        self.input_patch_buffer = np.zeros(
-            (batch_size, self.num_input_channels, *input_patch_size), dtype=dtype)
-        # self.output_patch_buffer = np.zeros(
-        #     (batch_size, num_output_channels, *output_patch_size), 
-        #     dtype=dtype)
 
+        assert output_buffer in ('ram', 'memmap')
+        self.output_buffer = output_buffer
+        if scratch_dir is not None:
+            scratch_dir = os.path.expanduser(scratch_dir)
+        self.scratch_dir = scratch_dir
+        self.skip_empty_patches = skip_empty_patches
+        # the number of patches skipped in the last chunk
+        self.skipped_patch_num = 0
+        # the number of patches reused from cache in the last chunk
+        self.cached_patch_num = 0
+        # the seconds of every convnet forward pass in the last chunk
+        self.batch_latencies = []
+        
+        assert num_patch_buffers >= 1
         self.patch_slices_list = []
         
         if isinstance(convnet_model, str):
             convnet_model = os.path.expanduser(convnet_model)
         if isinstance(convnet_weight_path, str):
             convnet_weight_path = os.path.expanduser(convnet_weight_path)
-        self._prepare_patch_inferencer(framework, convnet_model, convnet_weight_path, bump)
+
+        assert batch_size == 'auto' or isinstance(batch_size, int)
+        if batch_size == 'auto' and (framework == 'pytorch' or dry_run):
+            # the pytorch backend only supports batch size of 1
+            batch_size = 1
+            self.batch_size = batch_size
+        # compute all the transformed patches of test time augmentation 
+        # in one forward pass. It is turned off for the backends requiring 
+        # a batch size of 1.
+        self.stack_transforms = True
+        self._prepare_patch_inferencer(framework, convnet_model, convnet_weight_path, bump,
+            framework_args=framework_args)
 
         if augment:
+            # the transposed patches have the same shape with the others
+            assert input_patch_size[-1] == input_patch_size[-2]
             self.transform_sequences = TransformSequences()
         else:
             self.transform_sequences = None
+
+        if patch_cache_dir is not None or batch_size == 'auto':
+            model_identity = [framework, augment, dtype, 
+                tuple(input_patch_size), tuple(output_patch_size),
+                tuple(output_patch_overlap), num_input_channels, 
+                self.output_channel_nums, sorted((framework_args or {}).items())]
+            paths = []
+            for path in (convnet_model, convnet_weight_path):
+                if isinstance(path, (list, tuple)):
+                    paths.extend(path)
+                else:
+                    paths.append(path)
+            for path in paths:
+                if isinstance(path, str) and os.path.isfile(path):
+                    # the model file could be updated with the same path
+                    model_identity.append(_file_digest(path))
+                else:
+                    model_identity.append(repr(path))
+            model_identity = repr(model_identity)
+
+        if patch_cache_dir is not None:
+            self.patch_cache = PatchCache(patch_cache_dir, 
+                max_size=patch_cache_size, model_identity=model_identity)
+        else:
+            self.patch_cache = None
+        self.patch_cache_keys = {}
+
+        if batch_size == 'auto':
+            batch_size = self._tune_batch_size(model_identity, 
+                num_patch_buffers, memory_limit=batch_memory_limit)
+            self.batch_size = batch_size
+
+        # allocate a buffer to avoid redundant memory allocation
+        self.input_patch_buffers = [np.zeros(
+            (batch_size, self.num_input_channels, *input_patch_size), dtype=dtype)
+            for _ in range(num_patch_buffers)]
+        self.input_patch_buffer = self.input_patch_buffers[0]
+        # self.output_patch_buffer = np.zeros(
+        #     (batch_size, num_output_channels, *output_patch_size), 
+        #     dtype=dtype)
    
     @property
     def compute_device(self):
         return self.patch_inferencer.compute_device
 
+    def _tune_batch_size(self, model_identity: str, num_patch_buffers: int, 
+            memory_limit: int = None, 
+            candidates: tuple = (1, 2, 4, 8, 16, 32, 64)) -> int:
+        """find the batch size with the most voxels per second.
+
+        The candidates are benchmarked in increasing order until the 
+        patch buffers exceed the memory limit, the convnet runs out of 
+        memory or the throughput drops. 
+
+        Returns:
+            int: the best batch size.
+        """
+        cache_dir = os.environ.get('CHUNKFLOW_CACHE_DIR', '~/.cache/chunkflow')
+        cache_dir = os.path.join(os.path.expanduser(cache_dir), 'batch_size')
+        key = hashlib.blake2b(model_identity.encode(), digest_size=20).hexdigest()
+        cache_file = os.path.join(cache_dir, f'{key}.json')
+        if os.path.exists(cache_file):
+            with open(cache_file) as file:
+                calibration = json.load(file)
+            print(f"use calibrated batch size {calibration['batch_size']} in {cache_file}")
+            return calibration['batch_size']
+
+        if memory_limit is None:
+            import psutil
+            memory_limit = psutil.virtual_memory().available // 4
+
+        input_patch_shape = (self.num_input_channels, *self.input_patch_size)
+        input_patch_nbytes = np.prod(input_patch_shape) * np.dtype(self.dtype).itemsize
+        output_patch_nbytes = self.num_output_channels * np.prod(
+            self.output_patch_size) * np.dtype(np.float32).itemsize
+        if self.transform_sequences is None:
+            transform_num = 1
+        else:
+            transform_num = len(self.transform_sequences)
+        if self.stack_transforms and transform_num > 1:
+            # the convnet runs the transformed patches in one batch, keep 
+            # the batch of the convnet in the range of candidates.
+            candidates = tuple(c for c in candidates 
+                if c * transform_num <= candidates[-1]) or candidates[:1]
+
+        throughput = {}
+        for batch_size in candidates:
+            # the rotating input buffers, the transformed input patches, 
+            # the output patches and the masked output patches
+            nbytes = batch_size * (num_patch_buffers * input_patch_nbytes + 
+                transform_num * (input_patch_nbytes + 2 * output_patch_nbytes))
+            if batch_size > candidates[0] and nbytes > memory_limit:
+                break
+
+            input_patch_buffer = np.random.rand(
+                batch_size, *input_patch_shape).astype(self.dtype)
+            try:
+                # the first run is a warm up
+                durations = []
+                for idx in range(4):
+                    start = time.perf_counter()
+                    self._forward(input_patch_buffer)
+                    if idx > 0:
+                        durations.append(time.perf_counter() - start)
+            except (MemoryError, RuntimeError) as err:
+                # the device could run out of memory
+                print(f'stop batch size calibration at {batch_size}: {err}')
+                if len(throughput) == 0:
+                    raise
+                break
+            throughput[batch_size] = batch_size * int(np.prod(
+                self.input_patch_size)) / np.median(durations)
+            print(f'batch size {batch_size}: {throughput[batch_size]:.0f} voxels per second')
+            if throughput[batch_size] < 0.9 * max(throughput.values()):
+                break
+        self.batch_latencies = []
+
+        best_batch_size = max(throughput, key=throughput.get)
+        print(f'use calibrated batch size {best_batch_size}, saved in {cache_file}')
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'w') as file:
+            json.dump({
+                'batch_size': best_batch_size,
+                'throughput': {str(bs): tp for bs, tp in throughput.items()},
+            }, file)
+        return best_batch_size
+
     def __enter__(self):
         return self
 
@@ -203,10 +394,14 @@ class Inferencer(object):
         self._construct_patch_slices_list(input_chunk.voxel_offset)
         self._construct_output_chunk_mask(input_chunk)
 
-    def _prepare_patch_inferencer(self, framework, convnet_model, convnet_weight_path, bump):
+    def _prepare_patch_inferencer(self, framework, convnet_model, convnet_weight_path, bump,
+            framework_args: dict = None):
         
         # allow to pass patch_inferencer directly, if so assign and return
         if framework == 'prebuilt':
+            if isinstance(convnet_model, (list, tuple)):
+                from .patch.ensemble import Ensemble
+                convnet_model = Ensemble(convnet_model)
             self.patch_inferencer = convnet_model
             return
 
@@ -217,12 +412,15 @@ class Inferencer(object):
             # pytorch will not output consistent result if we use batch size > 1
             # https://discuss.pytorch.org/t/solved-inconsistent-results-during-test-using-different-batch-size/2265 
             assert self.batch_size == 1
+            self.stack_transforms = False
             from .patch.pytorch import PyTorch as PatchInferencer
             # currently, we do not support pytorch backend with different
             # input and output patch size and overlap.
         elif framework == 'pytorch-multitask':
             # currently only this type of task support mask in device
             from .patch.pytorch_multitask import PyTorchMultitask as PatchInferencer
+        elif framework == 'onnxruntime':
+            from .patch.onnx_runtime import ONNXRuntime as PatchInferencer
         elif framework == 'identity':
             from .patch.identity import Identity as PatchInferencer
         elif framework == 'universal':
@@ -230,6 +428,24 @@ class Inferencer(object):
         else:
             raise Exception(f'invalid inference backend: {self.framework}')
         
+        if framework_args is None:
+            framework_args = {}
+
+        if isinstance(convnet_model, (list, tuple)):
+            from .patch.ensemble import Ensemble
+            self.patch_inferencer = Ensemble([PatchInferencer(
+                model,
+                weight_path,
+                input_patch_size=self.input_patch_size,
+                output_patch_size=self.output_patch_size,
+                output_patch_overlap=self.output_patch_overlap,
+                num_output_channels=channel_num,
+                dtype=self.dtype,
+                bump=bump,
+                **framework_args) for model, weight_path, channel_num in zip(
+                    convnet_model, convnet_weight_path, self.output_channel_nums)])
+            return
+
         self.patch_inferencer = PatchInferencer(
             convnet_model,
             convnet_weight_path,
@@ -238,7 +454,25 @@ class Inferencer(object):
             output_patch_overlap=self.output_patch_overlap,
             num_output_channels=self.num_output_channels,
             dtype=self.dtype,
-            bump=bump)
+            bump=bump,
+            **framework_args)
+
+    def split_output_chunk(self, output_chunk: Chunk) -> list:
+        """split the output chunk of multiple models.
+
+        Returns:
+            list of Chunk: the output chunk of every model. The arrays are 
+                views of the output chunk.
+        """
+        output_chunks = []
+        start = 0
+        for channel_num in self.output_channel_nums:
+            output_chunks.append(Chunk(
+                output_chunk.array[start : start + channel_num, ...],
+                voxel_offset=output_chunk.voxel_offset,
+                voxel_size=output_chunk.voxel_size))
+            start += channel_num
+        return output_chunks
 
     def _check_alignment(self):
         is_align = tuple((i - o) % s == 0 for i, s, o in zip(
@@ -291,6 +525,232 @@ class Inferencer(object):
                                           slice(ox, ox + output_patch_size[-1]))
                     self.patch_slices_list.append((input_patch_slice, output_patch_slice))
 
+        # the patch starts inside of the input chunk to gather input patches
+        self.input_patch_starts = np.asarray([
+            tuple(s.start - o for s, o in zip(
+                input_patch_slice, input_chunk_offset[-3:]))
+            for input_patch_slice, _ in self.patch_slices_list], dtype=np.int64)
+
+        # the output patch slices inside of the output buffer and the 
+        # corresponding slices inside of the output patch. The output 
+        # patches could be partially cropped by the output crop margin.
+        output_buffer_offset = tuple(o + ocm for o, ocm in zip(
+            input_chunk_offset[-3:], self.output_offset))
+        self.output_patch_slices_list = []
+        for _, output_patch_slice in self.patch_slices_list:
+            buffer_slices = []
+            patch_slices = []
+            for s, o, h in zip(output_patch_slice, output_buffer_offset, 
+                    self.output_size[-3:]):
+                start = max(s.start - o, 0)
+                stop = min(s.stop - o, h)
+                buffer_slices.append(slice(start, stop))
+                patch_slices.append(slice(start + o - s.start, stop + o - s.start))
+            self.output_patch_slices_list.append(
+                (tuple(buffer_slices), tuple(patch_slices)))
+
+    def _gather_input_patches(self, input_windows: np.ndarray, 
+            input_patch_starts: np.ndarray, normalizer: int = None,
+            input_patch_buffer: np.ndarray = None):
+        """gather a batch of input patches to the input patch buffer.
+
+        All the patches are gathered in one fancy indexing operation, and 
+        the integer to float normalization is done while writing the buffer, 
+        so the whole input chunk is never converted to float.
+
+        Args:
+            input_windows (np.ndarray): sliding window view of the input array.
+            input_patch_starts (np.ndarray): patch starts inside of the 
+                input chunk with a shape of (n, 3).
+            normalizer (int): divide the input by this value. Defaults to None.
+            input_patch_buffer (np.ndarray): the buffer to fill. Defaults to 
+                the first input patch buffer.
+
+        Returns:
+            np.ndarray: the input patch buffer.
+        """
+        if input_patch_buffer is None:
+            input_patch_buffer = self.input_patch_buffer
+        patch_num = len(input_patch_starts)
+        zs, ys, xs = input_patch_starts.T
+        patches = input_windows[..., zs, ys, xs, :, :, :]
+        if patches.ndim == 5:
+            # the channel axis is in front of the batch axis
+            patches = np.moveaxis(patches, 0, 1)
+        else:
+            patches = patches[:, np.newaxis, ...]
+
+        buffer = input_patch_buffer[:patch_num, ...]
+        if normalizer is None:
+            np.copyto(buffer, patches, casting='unsafe')
+        else:
+            np.divide(patches, normalizer, out=buffer, 
+                dtype=buffer.dtype, casting='unsafe')
+        return input_patch_buffer
+
+    def _forward(self, input_patch_buffer: np.ndarray) -> np.ndarray:
+        """run the convnet for a batch of input patches.
+
+        The input and output patch is a 5d numpy array with datatype of 
+        float32, the dimensions are batch/channel/z/y/x.
+        The input image should be normalized to [0,1]
+        """
+        if self.transform_sequences is None:
+            start = time.perf_counter()
+            output_patches = self.patch_inferencer(input_patch_buffer)
+            self.batch_latencies.append(time.perf_counter() - start)
+            return output_patches
+        
+        # test time augmentation 
+        input_patches = self.transform_sequences.forward_batch(input_patch_buffer)
+        start = time.perf_counter()
+        if self.stack_transforms:
+            # all the transformed patches are computed in one forward pass.
+            # The result is the same with separate passes since the 
+            # normalization layers use the running statistics in inference.
+            output_patches = self.patch_inferencer(input_patches)
+        else:
+            # one forward pass for every transform to keep the batch size
+            output_patches = np.concatenate([self.patch_inferencer(patches) 
+                for patches in np.split(input_patches, len(self.transform_sequences))])
+        self.batch_latencies.append(time.perf_counter() - start)
+        return self.transform_sequences.backward_batch(output_patches)
+
+    def _infer_patches_overlapped(self, input_windows: np.ndarray, 
+            normalizer: int, output_buffer_array: np.ndarray, 
+            patch_indices: np.ndarray):
+        """gather, forward and blend the patch batches in a pipeline.
+
+        The batches are gathered in a worker thread to the rotating input 
+        patch buffers, and the output patches are blended in another worker 
+        thread, so the convnet forward pass in this thread is not starved.
+        """
+        num_patch_buffers = len(self.input_patch_buffers)
+        batches = [patch_indices[i:i + self.batch_size] for i in 
+            range(0, len(patch_indices), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=1) as gather_executor, \
+                ThreadPoolExecutor(max_workers=1) as blend_executor:
+            def gather(batch_idx: int):
+                return gather_executor.submit(self._gather_input_patches,
+                    input_windows, self.input_patch_starts[batches[batch_idx]], 
+                    normalizer, self.input_patch_buffers[batch_idx % num_patch_buffers])
+
+            gather_futures = deque(gather(batch_idx) for batch_idx in 
+                range(min(num_patch_buffers, len(batches))))
+            blend_futures = deque()
+            for batch_idx in tqdm(range(len(batches)), 
+                    desc='ConvNet inference for patches: '):
+                input_patch_buffer = gather_futures.popleft().result()
+                output_patch = self._forward(input_patch_buffer)
+                
+                # the input patch buffer is free to be filled again
+                next_batch_idx = batch_idx + num_patch_buffers
+                if next_batch_idx < len(batches):
+                    gather_futures.append(gather(next_batch_idx))
+
+                blend_futures.append(blend_executor.submit(
+                    self._blend_output_patches, output_buffer_array, 
+                    output_patch, batches[batch_idx]))
+                # limit the number of output patches waiting for blending
+                while len(blend_futures) > num_patch_buffers:
+                    blend_futures.popleft().result()
+
+            for future in blend_futures:
+                future.result()
+
+    def _blend_output_patches(self, output_buffer_array: np.ndarray, 
+            output_patches: np.ndarray, patch_indices: np.ndarray):
+        """accumulate a batch of output patches to the output buffer in place.
+
+        The output patches were already multiplied by the patch mask in 
+        the patch inferencer.
+
+        Args:
+            output_buffer_array (np.ndarray): the output buffer array.
+            output_patches (np.ndarray): the 5D output patch batch.
+            patch_indices (np.ndarray): the patch indices of the batch.
+        """
+        # only use the required number of channels
+        # the remaining channels are dropped
+        channel_slice = (slice(0, output_buffer_array.shape[0]), )
+        for batch_idx, patch_idx in enumerate(patch_indices):
+            buffer_slices, patch_slices = self.output_patch_slices_list[patch_idx]
+            output_patch = output_patches[(batch_idx, ) + channel_slice + patch_slices]
+            if self.accumulation_dtype != np.float32 and self.mask_output_chunk:
+                # the weights of patch mask could be tiny close to the chunk 
+                # border, so normalize while blending rather than at the end. 
+                # The reduced precision buffer only holds values in [0, 1].
+                output_patch = output_patch * self.output_chunk_mask.array[buffer_slices]
+            if self.accumulation_scale is not None:
+                # the fixed point value wraps around silently if it is out
+                # of range, so check it here rather than at the end.
+                np.testing.assert_array_less(output_patch.max(), 
+                    np.iinfo(np.uint16).max / self.accumulation_scale,
+                    err_msg='output patch should not be greater than 1')
+                # convert to fixed point
+                output_patch = np.rint(output_patch * self.accumulation_scale)
+                output_patch = np.maximum(output_patch, 0).astype(np.uint16)
+            output_buffer_array[channel_slice + buffer_slices] += output_patch
+            if patch_idx in self.patch_cache_keys:
+                self.patch_cache.put(self.patch_cache_keys.pop(patch_idx), 
+                    output_patches[batch_idx])
+
+    def _blend_cached_patches(self, input_windows: np.ndarray, 
+            output_buffer_array: np.ndarray, patch_indices: np.ndarray):
+        """blend the output patches found in the patch cache.
+
+        The cache keys of the other patches are recorded, and their output 
+        patches are saved to the cache while blending.
+
+        Returns:
+            np.ndarray: the indices of the patches not found in the cache.
+        """
+        self.patch_cache_keys = {}
+        missed_indices = []
+        for patch_idx in patch_indices:
+            input_patch_slices, _ = self.patch_slices_list[patch_idx]
+            z, y, x = self.input_patch_starts[patch_idx]
+            key = self.patch_cache.key(input_patch_slices, 
+                input_windows[..., z, y, x, :, :, :])
+            output_patch = self.patch_cache.get(key)
+            if output_patch is None:
+                self.patch_cache_keys[patch_idx] = key
+                missed_indices.append(patch_idx)
+            else:
+                self._blend_output_patches(output_buffer_array, 
+                    output_patch[np.newaxis, ...], (patch_idx,))
+        return np.asarray(missed_indices, dtype=np.int64)
+
+    def _find_nonempty_patches(self, input_windows: np.ndarray, 
+            input_chunk: Chunk, mask: Chunk = None) -> np.ndarray:
+        """find the patches with nonzero input inside of the mask.
+
+        Args:
+            input_windows (np.ndarray): sliding window view of the input array.
+            input_chunk (Chunk): the input chunk.
+            mask (Chunk): a mask with the same or larger voxel size.
+
+        Returns:
+            np.ndarray: the indices of the nonempty patches.
+        """
+        is_nonempty = np.ones(len(self.patch_slices_list), dtype=bool)
+        if self.skip_empty_patches:
+            for idx, (z, y, x) in enumerate(self.input_patch_starts):
+                is_nonempty[idx] = input_windows[..., z, y, x, :, :, :].any()
+        
+        if mask is not None:
+            assert mask.ndim == 3
+            factor = mask.voxel_size // input_chunk.voxel_size
+            for idx in np.flatnonzero(is_nonempty):
+                # the footprint of the output patch in the mask
+                _, output_patch_slice = self.patch_slices_list[idx]
+                footprint = tuple(
+                    slice(max(s.start // f - o, 0), max(-(-s.stop // f) - o, 0))
+                    for s, f, o in zip(output_patch_slice, factor, mask.voxel_offset))
+                is_nonempty[idx] = mask.array[footprint].any()
+        return np.flatnonzero(is_nonempty)
+
     def _construct_output_chunk_mask(self, input_chunk):
         if not self.mask_output_chunk:
             return
@@ -306,7 +766,8 @@ class Inferencer(object):
             #output_mask_array = np.memmap(output_mask_mmap_file, 
             #                                   dtype=self.dtype, mode='w+', 
             #                                   shape=self.output_size)
-            output_mask_array = np.zeros(self.output_size[-3:], self.dtype)
+            # the reciprocal of small weights overflows in float16
+            output_mask_array = np.zeros(self.output_size[-3:], 'float32')
         else:
             output_mask_array = self.output_chunk_mask.array
             output_mask_array.fill(0)
@@ -321,31 +782,64 @@ class Inferencer(object):
         )
         
         assert len(self.patch_slices_list) > 0
-        for _, output_patch_slice in self.patch_slices_list:
-            # accumulate weights using the patch mask in RAM
-            patch_voxel_offset = tuple(s.start for s in output_patch_slice)
-            patch_mask = Chunk(self.patch_inferencer.output_patch_mask_numpy,
-                               voxel_offset=patch_voxel_offset)
-            self.output_chunk_mask.blend(patch_mask)
+        patch_mask = self.patch_inferencer.output_patch_mask_numpy
+        # accumulate weights using the patch mask in RAM
+        for buffer_slices, patch_slices in self.output_patch_slices_list:
+            output_mask_array[buffer_slices] += patch_mask[patch_slices]
 
         # normalize weight, so accumulated inference result multiplies
         # this mask will result in 1
         self.output_chunk_mask.array = 1.0 / self.output_chunk_mask.array
     
+    @property
+    def _output_dtype(self):
+        if self.accumulation_dtype == np.uint16:
+            return np.dtype(np.float16)
+        else:
+            return self.accumulation_dtype
+
+    def _normalize_output_buffer(self, output_buffer: Chunk) -> Chunk:
+        """normalize the accumulated output buffer with the chunk mask.
+
+        The reduced precision buffer was already normalized while blending. 
+        The fixed point buffer is converted to float16 slab by slab, and 
+        the result is written back to the same memory.
+        """
+        if self.accumulation_dtype == np.float32:
+            if self.mask_output_chunk:
+                np.multiply(output_buffer.array, self.output_chunk_mask.array, 
+                    out=output_buffer.array)
+            return output_buffer
+        elif self.accumulation_scale is None:
+            return output_buffer
+
+        output_array = output_buffer.array
+        # float16 has the same item size with uint16
+        result_array = output_array.view(self._output_dtype)
+        for z in range(output_array.shape[-3]):
+            slab = output_array[..., z, :, :].astype(np.float32)
+            slab *= 1. / self.accumulation_scale
+            result_array[..., z, :, :] = slab
+
+        return Chunk(result_array, 
+            voxel_offset=output_buffer.voxel_offset,
+            voxel_size=output_buffer.voxel_size)
+
     def _get_output_buffer(self, input_chunk: Chunk):
         # output_buffer_size = (self.patch_inferencer.num_output_channels, ) + self.output_size
         output_buffer_size = self.output_size
-        #if self.mask_myelin_threshold is None:
-        # a random temporal file. will be removed later.
-        #output_buffer_mmap_file = mktemp(suffix='.dat')
-        ## the memory map is initialized with 0 in default
-        #output_buffer_array = np.memmap(output_buffer_mmap_file, 
-        #                               dtype=self.dtype, mode='w+', 
-        #                               shape=output_buffer_size)
-        ##else:
-        #    # when we use myelin mask, the masking computation will create a full array in RAM!
-        #    # and it will duplicate the array! thus, we should use normal array in this case.
-        output_buffer_array = np.zeros(output_buffer_size, dtype=self.dtype)
+        if self.output_buffer == 'memmap':
+            # the temporary file is anonymous and will be removed after 
+            # the memory map is released. The memory map keeps its own 
+            # file descriptor, so we can close the file here.
+            # the memory map is initialized with 0 in default
+            with tempfile.TemporaryFile(dir=self.scratch_dir) as file:
+                output_buffer_array = np.memmap(file, 
+                    dtype=self.accumulation_dtype, mode='w+', 
+                    shape=output_buffer_size)
+        else:
+            output_buffer_array = np.zeros(output_buffer_size, 
+                dtype=self.accumulation_dtype)
         
         output_voxel_offset = tuple(io + ocso for io, ocso in zip(
             input_chunk.voxel_offset, self.output_offset))
@@ -357,15 +851,19 @@ class Inferencer(object):
         )
         return output_buffer
 
-    def __call__(self, input_chunk: Chunk):
+    def __call__(self, input_chunk: Chunk, mask: Chunk = None):
         """
         args:
             input_chunk (Chunk): input chunk with voxel offset and voxel size 
+            mask (Chunk): a low resolution mask, such as the one from 
+                `MaskOperator.cutout_mask`. The patches outside of the mask 
+                are skipped and the output is zero. 
         """
         assert isinstance(input_chunk, Chunk)
         
         self._update_parameters_for_input_chunk(input_chunk)
         output_buffer = self._get_output_buffer(input_chunk)
+        self.batch_latencies = []
         if not self.mask_output_chunk:
             self._check_alignment()
          
@@ -379,13 +877,17 @@ class Inferencer(object):
 
             return Chunk.create(
                 size=size,
-                dtype = output_buffer.dtype,
+                dtype = self._output_dtype,
                 voxel_offset=output_buffer.voxel_offset,
                 voxel_size=input_chunk.voxel_size,
             )
        
         if np.all(input_chunk == 0):
             print('input is all zero, return zero buffer directly')
+            self.skipped_patch_num = len(self.patch_slices_list)
+            self.cached_patch_num = 0
+            # the zero bits are also zero in float16
+            output_buffer = self._normalize_output_buffer(output_buffer)
             if self.mask_myelin_threshold:
                 assert output_buffer.shape[0] == 4
                 return output_buffer[:-1, ...]
@@ -393,76 +895,50 @@ class Inferencer(object):
                 return output_buffer
         
         if np.issubdtype(input_chunk.dtype, np.integer):
-            # normalize to 0-1 value range
-            dtype_max = np.iinfo(input_chunk.dtype).max
-            input_chunk = input_chunk.astype(self.dtype)
-            input_chunk /= dtype_max
-
-        # chunk_time_start = time.time()
-
-        # iterate the offset list
-        for i in tqdm(range(0, len(self.patch_slices_list), self.batch_size),
-                      desc='ConvNet inference for patches: '):
-            # start = time.time()
-
-            batch_slices = self.patch_slices_list[i:i + self.batch_size]
-            for batch_idx, slices in enumerate(batch_slices):
-                self.input_patch_buffer[
-                    batch_idx, ...] = input_chunk.cutout(slices[0]).array
-
-            # end = time.time()
-            # print(f'prepare {self.batch_size:d} input patches takes {end-start:.3f} sec')
-            # start = end
-
-            # the input and output patch is a 5d numpy array with
-            # datatype of float32, the dimensions are batch/channel/z/y/x.
-            # the input image should be normalized to [0,1]
-            if self.transform_sequences is None:
-                output_patch = self.patch_inferencer(self.input_patch_buffer)
-            else:
-                # test time augmentation
-                input_patches = self.transform_sequences.forward(self.input_patch_buffer)
-                output_patches = []
-                for input_patch in input_patches:
-                    output_patch = self.patch_inferencer(input_patch)
-                    output_patches.append(output_patch)
-                output_patches = self.transform_sequences.backward(output_patches)
-                # average 
-                output_patch = sum(output_patches) / len(output_patches)
-
-            # end = time.time()
-            # start = end
-
-            for batch_idx, slices in enumerate(batch_slices):
-                # only use the required number of channels
-                # the remaining channels are dropped
-                # the slices[0] is for input patch slice
-                # the slices[1] is for output patch slice
-                offset = tuple(s.start for s in slices[1])
-                output_patch_chunk = Chunk(
-                    output_patch[batch_idx, :, :, :, :],
-                    voxel_offset=offset,
-                    voxel_size=input_chunk.voxel_size)
-
-                ## save some patch for debug
-                #bbox = output_chunk.bbox
-                #if bbox.minpt[-1] < 94066 and bbox.maxpt[-1] > 94066 and \
-                #        bbox.minpt[-2]<81545 and bbox.maxpt[-2]>81545 and \
-                #        bbox.minpt[-3]<17298 and bbox.maxpt[-3]>17298:
-                #    print('save patch: ', output_chunk.bbox)
-                #    output_chunk.to_tif()
-                #    #input_chunk.cutout(slices[0]).to_tif()
-                output_buffer.blend(output_patch_chunk)
-
-            # end = time.time()
-            # print('blend patch takes {:.3f} sec'.format(end - start))
+            # normalize to 0-1 value range while gathering patches
+            normalizer = np.iinfo(input_chunk.dtype).max
+        else:
+            normalizer = None
+        input_windows = np.lib.stride_tricks.sliding_window_view(
+            input_chunk.array, tuple(self.input_patch_size), axis=(-3, -2, -1))
+
+        # compact the batches to only contain the nonempty patches 
+        patch_indices = self._find_nonempty_patches(
+            input_windows, input_chunk, mask=mask)
+        self.skipped_patch_num = len(self.patch_slices_list) - len(patch_indices)
+        if self.skipped_patch_num > 0:
+            print(f'skip {self.skipped_patch_num} empty patches in ' + 
+                f'{len(self.patch_slices_list)} patches.')
+
+        if self.patch_cache is not None:
+            nonempty_patch_num = len(patch_indices)
+            patch_indices = self._blend_cached_patches(
+                input_windows, output_buffer.array, patch_indices)
+            self.cached_patch_num = nonempty_patch_num - len(patch_indices)
+            print(f'reuse {self.cached_patch_num} cached patches in ' +
+                f'{nonempty_patch_num} patches.')
+
+        if len(self.input_patch_buffers) > 1:
+            self._infer_patches_overlapped(input_windows, normalizer, 
+                output_buffer.array, patch_indices)
+        else:
+            # iterate the offset list
+            for i in tqdm(range(0, len(patch_indices), self.batch_size),
+                        desc='ConvNet inference for patches: '):
+                batch_indices = patch_indices[i:i + self.batch_size]
+                self._gather_input_patches(input_windows, 
+                    self.input_patch_starts[batch_indices], normalizer)
+                output_patch = self._forward(self.input_patch_buffer)
+                self._blend_output_patches(
+                    output_buffer.array, output_patch, batch_indices)
         
-        if self.mask_output_chunk:
-            output_buffer *= self.output_chunk_mask
+        output_buffer = self._normalize_output_buffer(output_buffer)
         
         # theoretically, all the value of output_buffer should not be greater than 1
         # we use a slightly higher value here to accomondate numerical precision issue
-        np.testing.assert_array_less(output_buffer, 1.0001,
+        # reduce to the maximum value first to avoid a full size boolean array
+        threshold = 1. + max(1e-4, 2 * np.finfo(output_buffer.dtype).eps)
+        np.testing.assert_array_less(output_buffer.array.max(), threshold,
             err_msg='output buffer should not be greater than 1')
 
         if self.mask_myelin_threshold:
@@ -477,3 +953,18 @@ class Inferencer(object):
             return output_chunk
         else:
             return output_buffer
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _broadcast(value, num: int) -> list:
+    if isinstance(value, (list, tuple)):
+        assert len(value) == num, f'expect {num} values, but got {value}'
+        return list(value)
+    return [value] * num
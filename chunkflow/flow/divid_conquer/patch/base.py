@@ -38,6 +38,7 @@ class PatchInferencerBase(object):
                                          zip(output_patch_size, self.output_patch_overlap))
 
         # prepare patch mask
+        # the patch mask is cached and shared, do not modify it in place
         self.output_patch_mask = PatchMask(output_patch_size, 
                                            output_patch_overlap,
                                            dtype=dtype)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from .base import PatchInferencerBase
+
+
+class Ensemble(PatchInferencerBase):
+    """perform inference for an image patch using multiple models.
+
+    The models share the same input patch, and the output patches
+    are concatenated in the channel axis. All the models should have
+    the same patch size and overlap, so the input patches are gathered
+    only once.
+    """
+    def __init__(self, patch_inferencers: list):
+        assert len(patch_inferencers) > 0
+        first = patch_inferencers[0]
+        for patch_inferencer in patch_inferencers[1:]:
+            assert tuple(patch_inferencer.input_patch_size) == \
+                tuple(first.input_patch_size)
+            assert tuple(patch_inferencer.output_patch_size) == \
+                tuple(first.output_patch_size)
+            assert tuple(patch_inferencer.output_patch_overlap) == \
+                tuple(first.output_patch_overlap)
+
+        super().__init__(first.input_patch_size, first.output_patch_size,
+                         first.output_patch_overlap,
+                         sum(p.num_output_channels for p in patch_inferencers),
+                         dtype=first.output_patch_mask_numpy.dtype)
+        self.patch_inferencers = patch_inferencers
+
+    @property
+    def compute_device(self):
+        return self.patch_inferencers[0].compute_device
+
+    def __call__(self, input_patch: np.ndarray) -> np.ndarray:
+        # every model only output the required number of channels
+        output_patches = [
+            patch_inferencer(input_patch)[:, :patch_inferencer.num_output_channels, ...]
+            for patch_inferencer in self.patch_inferencers]
+        return np.concatenate(output_patches, axis=1)
@@ -0,0 +1,92 @@
+import platform
+
+import numpy as np
+import onnxruntime as ort
+
+from .base import PatchInferencerBase
+
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+class ONNXRuntime(PatchInferencerBase):
+    """perform inference for an image patch using ONNX Runtime in CPU.
+    Parameters
+    ----------
+    convnet_model: the ONNX model file. The weights are included in
+        the model file. If it is None, use convnet_weight_path.
+    convnet_weight_path: the ONNX model file if the convnet_model is None.
+    intra_op_num_threads: number of threads inside of an operator.
+        default is decided by ONNX Runtime.
+    inter_op_num_threads: number of threads to run independent operators
+        in parallel. default is decided by ONNX Runtime.
+    graph_optimization_level: ['disable', 'basic', 'extended', 'all'].
+    optimized_model_path: save the optimized graph to this file, so we
+        can load it directly next time.
+
+    The model takes a 5D input patch with the same data type as the
+    patch buffer, and the first output is the output patch.
+    """
+    def __init__(self, convnet_model: str, convnet_weight_path: str,
+                 input_patch_size: tuple,
+                 output_patch_size: tuple,
+                 output_patch_overlap: tuple,
+                 num_output_channels: int = 1,
+                 dtype: str='float32',
+                 bump: str='wu',
+                 intra_op_num_threads: int = None,
+                 inter_op_num_threads: int = None,
+                 graph_optimization_level: str = 'all',
+                 optimized_model_path: str = None):
+        # To-Do: support zung function
+        assert bump == 'wu'
+        super().__init__(input_patch_size, output_patch_size,
+                         output_patch_overlap, num_output_channels,
+                         dtype=dtype)
+        self.num_output_channels = num_output_channels
+
+        if convnet_model is None:
+            convnet_model = convnet_weight_path
+
+        options = ort.SessionOptions()
+        if intra_op_num_threads is not None:
+            options.intra_op_num_threads = intra_op_num_threads
+        if inter_op_num_threads is not None:
+            options.inter_op_num_threads = inter_op_num_threads
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        options.graph_optimization_level = \
+            GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+        if optimized_model_path is not None:
+            options.optimized_model_filepath = optimized_model_path
+
+        self.session = ort.InferenceSession(convnet_model,
+            sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    @property
+    def compute_device(self):
+        return platform.processor()
+
+    def __call__(self, input_patch):
+        # make sure that the patch is 5d ndarray
+        input_patch = self._reshape_patch_to_5d(input_patch)
+        input_patch = np.ascontiguousarray(input_patch)
+
+        output_patch = self.session.run(
+            [self.output_name], {self.input_name: input_patch})[0]
+
+        output_patch = self._crop_output_patch(output_patch)
+        if output_patch.dtype == np.float32:
+            # the session returns a new array in every run,
+            # so it is safe to apply the patch mask in place.
+            output_patch *= self.output_patch_mask_numpy
+        else:
+            output_patch = np.multiply(output_patch,
+                self.output_patch_mask_numpy, dtype=np.float32)
+        return output_patch
@@ -1,18 +1,19 @@
 #!/usr/bin/env python
-from math import log10
+from functools import lru_cache
+
 import numpy as np
 
 
 class PatchMask(np.ndarray):
-    def __new__(cls, patch_size, overlap, dtype='float32'):
+    def __new__(cls, patch_size, overlap, dtype='float32', bump='wu'):
         assert len(patch_size) == 3
         assert len(overlap) == 3
 
-        mask = make_patch_mask(patch_size, overlap, dtype=dtype)
+        mask = make_patch_mask(patch_size, overlap, dtype=dtype, bump=bump)
         return np.asarray(mask).view(cls)
 
 
-def make_patch_mask(patch_size, overlap, dtype='float32'):
+def make_patch_mask(patch_size, overlap, dtype='float32', bump='wu'):
     """
         _make_mask()
     return:
@@ -20,32 +21,53 @@ def make_patch_mask(patch_size, overlap, dtype='float32'):
         using a bump function. the overlapping borders and corners were
         normalized according to weight accumulation.
         https://en.wikipedia.org/wiki/Bump_function
+
+    The masks are cached and read only, do not modify them in place.
     """
-    bump_map = make_bump_map(patch_size)
-    stride = tuple(p - o for p, o in zip(patch_size, overlap))
-    # use 3x3x3 mask addition to figure out the normalization parameter
-    # this is a simulation of blending
-    base_mask = np.zeros(tuple(f + 2 * s
-                               for (f, s) in zip(patch_size, stride)),
-                         dtype='float64')
-    for nz in range(3):
-        for ny in range(3):
-            for nx in range(3):
-                base_mask[nz*stride[0]:nz*stride[0]+patch_size[0],
-                          ny*stride[1]:ny*stride[1]+patch_size[1],
-                          nx*stride[2]:nx*stride[2]+patch_size[2]] += \
-                    bump_map
-
-    bump_map /= base_mask[stride[0]:stride[0] +
-                          patch_size[0], stride[1]:stride[1] +
-                          patch_size[1], stride[2]:stride[2] + patch_size[2]]
-    
-    np.testing.assert_array_equal(bump_map[
-        overlap[0]:-overlap[0], 
-        overlap[1]:-overlap[1], 
+    return _make_patch_mask(tuple(int(p) for p in patch_size),
+        tuple(int(o) for o in overlap), np.dtype(dtype).name, bump)
+
+
+@lru_cache(maxsize=16)
+def _make_patch_mask(patch_size: tuple, overlap: tuple, dtype: str, bump: str):
+    # To-Do: support zung function
+    assert bump == 'wu'
+
+    # the bump map is the product of the bump along every axis rescaled
+    # to the range of (1, 1e6), that is scale * bz * by * bx + offset.
+    # It is normalized by the blending of 3x3x3 patches. Both the sum of
+    # the products and the number of overlapping patches are separable,
+    # so the blending is simulated per axis rather than in 3D.
+    axis_bumps = []
+    axis_sums = []
+    axis_counts = []
+    for size, ovlp in zip(patch_size, overlap):
+        bump_1d = _make_axis_bump(size)
+        stride = size - ovlp
+        bump_sum = np.zeros(size + 2 * stride, dtype='float64')
+        count = np.zeros(size + 2 * stride, dtype='float64')
+        for n in range(3):
+            bump_sum[n * stride : n * stride + size] += bump_1d
+            count[n * stride : n * stride + size] += 1
+        axis_bumps.append(bump_1d)
+        axis_sums.append(bump_sum[stride : stride + size])
+        axis_counts.append(count[stride : stride + size])
+
+    low = np.prod([b.min() for b in axis_bumps])
+    high = np.prod([b.max() for b in axis_bumps])
+    scale = (1e6 - 1.) / (high - low)
+    offset = 1. - scale * low
+    mask = (scale * _outer(axis_bumps) + offset) / (
+        scale * _outer(axis_sums) + offset * _outer(axis_counts))
+
+    np.testing.assert_array_equal(mask[
+        overlap[0]:-overlap[0],
+        overlap[1]:-overlap[1],
         overlap[2]:-overlap[2]], 1)
 
-    return bump_map.astype(dtype)
+    mask = mask.astype(dtype)
+    mask.flags.writeable = False
+    return mask
 
 
 def make_bump_map(patch_size):
@@ -66,3 +88,13 @@ def make_bump_map(patch_size):
     #bump_map[bump_map < threshold] = threshold
 
     return np.asarray(bump_map, dtype=np.float64)
+
+
+def _make_axis_bump(size: int):
+    x = (np.arange(size) + 1.0) / (size + 1.0) * 2.0 - 1.0
+    return np.exp(-1.0 / (1.0 - x * x))
+
+
+def _outer(axis_arrays: list):
+    az, ay, ax = axis_arrays
+    return az[:, None, None] * np.outer(ay, ax)[None, :, :]
@@ -1,5 +1,9 @@
 # from .inference_engine import InferenceEngine
 # import imp
+import os
+import platform
+
+import numpy as np
 import torch
 from .base import PatchInferencerBase
 from chunkflow.lib import load_source
@@ -23,6 +27,16 @@ class PyTorch(PatchInferencerBase):
     loading model. This is useful for loading some models trained using
     old version pytorch (<=0.4.0). You can also define `pre_process` 
     and `post_process` function to insert your own customized processing.
+
+    The performance options could be passed by `--framework-args`:
+    inference_mode: use `torch.inference_mode` rather than `torch.no_grad`.
+    channels_last: convert the model and input to channels_last_3d format.
+    jit: ['compile', 'trace']. compile the model using `torch.compile` or 
+        trace it using TorchScript. The model is compiled or traced with 
+        the first real batch, so no other input shape is frozen.
+    num_threads: number of intra-op threads in CPU. default is the number 
+        of cores assigned to this process.
+    bfloat16: run the model in bfloat16 in CPU.
     """
     def __init__(self, convnet_model: str, convnet_weight_path: str,
                  input_patch_size: tuple, 
@@ -30,20 +44,38 @@ class PyTorch(PatchInferencerBase):
                  output_patch_overlap: tuple,
                  num_output_channels: int = 1, 
                  dtype: str='float32',
-                 bump: str='wu'):
+                 bump: str='wu',
+                 inference_mode: bool = True,
+                 channels_last: bool = False,
+                 jit: str = None,
+                 num_threads: int = None,
+                 bfloat16: bool = False):
         # To-Do: support zung function
         assert bump == 'wu'
+        assert jit in (None, 'compile', 'trace')
         super().__init__(input_patch_size, output_patch_size, 
                          output_patch_overlap, num_output_channels, 
                          dtype=dtype)
 
         self.num_output_channels = num_output_channels
+        self.inference_mode = inference_mode
+        self.channels_last = channels_last
+        # the patch mask is cached and read only, copy it as a tensor
+        self.output_patch_mask = torch.from_numpy(
+            np.array(self.output_patch_mask))
         if torch.cuda.is_available():
             self.is_gpu = True
             # put mask to gpu
-            self.output_patch_mask = torch.from_numpy(self.output_patch_mask).cuda()
+            self.output_patch_mask = self.output_patch_mask.cuda()
         else:
             self.is_gpu = False
+            if num_threads is None and hasattr(os, 'sched_getaffinity'):
+                # only use the cores assigned to this worker process
+                num_threads = len(os.sched_getaffinity(0))
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+        # bfloat16 is only used in cpu
+        self.bfloat16 = bfloat16 and not self.is_gpu
 
         net_source = load_source(convnet_model)
 
@@ -81,10 +113,24 @@ class PyTorch(PatchInferencerBase):
             self.post_process = net_source.post_process
         else:
             self.post_process = self._identity
+
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last_3d)
+        if self.bfloat16:
+            self.model = self.model.to(torch.bfloat16)
+
+        if jit == 'compile':
+            # the model is compiled in the first run
+            self.model = torch.compile(self.model)
+        # the model is traced with the first input batch
+        self.trace = jit == 'trace'
     
     @property
     def compute_device(self):
-        return torch.cuda.get_device_name(0)
+        if self.is_gpu:
+            return torch.cuda.get_device_name(0)
+        else:
+            return platform.processor()
 
     def _pre_process(self, input_patch):
         input_patch = torch.from_numpy(input_patch)
@@ -95,18 +141,41 @@ class PyTorch(PatchInferencerBase):
     def _identity(self, patch):
         return patch
 
+    def _to_model_input(self, input_patch):
+        net_input = self.pre_process(input_patch)
+        if self.channels_last:
+            net_input = net_input.contiguous(
+                memory_format=torch.channels_last_3d)
+        if self.bfloat16:
+            net_input = net_input.to(torch.bfloat16)
+        return net_input
+
     def __call__(self, input_patch):
         # make sure that the patch is 5d ndarray
         input_patch = self._reshape_patch_to_5d(input_patch)
 
-        with torch.no_grad():
-            net_input = self.pre_process(input_patch)
+        if self.trace:
+            # the inference tensors could not be used in tracing
+            with torch.no_grad():
+                self.model = torch.jit.trace(
+                    self.model, self._to_model_input(input_patch))
+            self.trace = False
+
+        if self.inference_mode:
+            grad_mode = torch.inference_mode()
+        else:
+            grad_mode = torch.no_grad()
+
+        with grad_mode:
+            net_input = self._to_model_input(input_patch)
             # the network input and output should be dict
             net_output = self.model(net_input)
 
             # get the required output patch from network 
             # The processing depends on network model and application
             output_patch = self.post_process(net_output)
+            if self.bfloat16:
+                output_patch = output_patch.float()
 
             # mask in gpu/cpu
             output_patch = self._crop_output_patch(output_patch)
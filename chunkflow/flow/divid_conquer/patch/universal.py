@@ -19,6 +19,7 @@ class Universal(PatchInferencerBase):
     You can make some customized processing in your model file.
     You need to define a class called `PatchInferencer`.
     The constructor inputs are `model_weight_file`, `patch_mask`.
+    The `patch_mask` is a writable copy owned by the plugin.
     You should define a `__call__` function to process the `input_patch`,
     and the output the `output_patch` after masking. 
 
@@ -43,9 +44,11 @@ class Universal(PatchInferencerBase):
         net_source = load_source(convnet_model)
 
         assert hasattr(net_source, "PatchInferencer")
+        # the patch mask is cached and read only, 
+        # so the plugin gets a writable copy.
         self.patch_inferencer = net_source.PatchInferencer(
             convnet_weight_path, 
-            self.output_patch_mask,)
+            np.array(self.output_patch_mask),)
             
             # this feature is not working correctly for now.
             #crop_output_patch_margin=self.crop_margin)
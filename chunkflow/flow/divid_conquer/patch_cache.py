@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+__doc__ = """
+On-disk cache of output patches shared by overlapping chunks.
+"""
+import hashlib
+
+import numpy as np
+
+from chunkflow.lib.cache import DiskCache
+
+
+class PatchCache(DiskCache):
+    """least recently used cache of output patches in a local directory.
+
+    Neighboring chunks overlap with each other, so the patches along the
+    shared faces are the same. The output patches are saved as npy files
+    named by the hash of the model identity, the global bounding box and
+    the content of the input patch.
+    """
+    def __init__(self, directory: str, max_size: int = 16 * 1024**3,
+            model_identity: str = ''):
+        """
+        Args:
+            directory (str): the local directory of cached patches.
+            max_size (int): the maximum total bytes of cached patches.
+            model_identity (str): the description of the model and patch
+                configuration. The patches of different models never match.
+        """
+        super().__init__(directory, max_size=max_size)
+        self.model_identity = model_identity.encode()
+
+    def key(self, bbox: tuple, input_patch: np.ndarray) -> str:
+        """
+        Args:
+            bbox (tuple of slice): the global slices of the input patch.
+            input_patch (np.ndarray): the input patch.
+        """
+        digest = hashlib.blake2b(self.model_identity, digest_size=20)
+        digest.update(repr(tuple((s.start, s.stop) for s in bbox)).encode())
+        digest.update(repr((input_patch.dtype.str, input_patch.shape)).encode())
+        digest.update(np.ascontiguousarray(input_patch).data)
+        return digest.hexdigest()
@@ -28,13 +28,12 @@ class Lazy(TransformBase):
         return arr
 
 class FlipLR(TransformBase):
+    """flip the x axis. The result is a view of the input array."""
     def __init__(self) -> None:
         super().__init__()
 
     def _flip(self, arr: np.ndarray):
-        for z in range(arr.shape[-3]):
-            arr[...,z,:,:] = np.fliplr(arr[...,z,:,:])
-        return arr
+        return np.flip(arr, axis=-1)
 
     def forward(self, arr: np.ndarray):
         return self._flip(arr)
@@ -44,13 +43,12 @@ class FlipLR(TransformBase):
 
 
 class FlipUD(TransformBase):
+    """flip the y axis. The result is a view of the input array."""
     def __init__(self) -> None:
         super().__init__()
     
     def _flip(self, arr: np.ndarray):
-        for z in range(arr.shape[-3]):
-            arr[...,z,:,:] = np.flipud(arr[...,z,:,:])
-        return arr
+        return np.flip(arr, axis=-2)
 
     def forward(self, arr: np.ndarray):
         return self._flip(arr)
@@ -59,13 +57,12 @@ class FlipUD(TransformBase):
         return self._flip(arr)
 
 class FlipZ(TransformBase):
+    """flip the z axis. The result is a view of the input array."""
     def __init__(self) -> None:
         super().__init__()
 
     def _flip(self, arr: np.ndarray):
-        for x in range(arr.shape[-1]):
-            arr[..., :, :, x] = np.flipud(arr[..., :, :, x])
-        return arr
+        return np.flip(arr, axis=-3)
     
     def forward(self, arr: np.ndarray):
         return self._flip(arr)
@@ -134,26 +131,63 @@ class TransformSequences:
         assert len(self.transform_sequences) == 8
         print(f'get {len(self.transform_sequences)} transformation sequences.')
         
+    def __len__(self):
+        return len(self.transform_sequences)
+
+    def _forward_sequence(self, arr: np.ndarray, transform_sequence: tuple):
+        for transform in transform_sequence:
+            arr = transform.forward(arr)
+        return arr
+
+    def _backward_sequence(self, arr: np.ndarray, transform_sequence: tuple):
+        # the inverse transforms are applied in the reverse order
+        for transform in transform_sequence[::-1]:
+            arr = transform.backward(arr)
+        return arr
+
     def forward(self, arr: np.ndarray):
-        transformed_arrays = []
-        for transform_sequence in self.transform_sequences:
-            tmp = np.copy(arr)
-            for transform in transform_sequence:
-                tmp = transform.forward(tmp)
-            transformed_arrays.append(tmp)
-
-        return transformed_arrays
+        return [np.copy(self._forward_sequence(arr, transform_sequence)) 
+            for transform_sequence in self.transform_sequences]
     
     def backward(self, transformed_arrays: List[np.ndarray]):
         assert len(transformed_arrays) == len(self.transform_sequences)
-        inversed_arrays = []
-        for idx, transform_sequence in enumerate(self.transform_sequences):
-            arr = np.copy(transformed_arrays[idx])
-            for transform in transform_sequence:
-                arr = transform.backward(arr)
-            inversed_arrays.append(arr)
-        
-        return inversed_arrays
+        return [np.copy(self._backward_sequence(arr, transform_sequence)) 
+            for arr, transform_sequence in zip(
+                transformed_arrays, self.transform_sequences)]
+
+    def forward_batch(self, arr: np.ndarray) -> np.ndarray:
+        """stack all the transformed copies along the batch axis.
+
+        Args:
+            arr (np.ndarray): 5D array with dimension of batch/channel/z/y/x.
+                The x and y size should be the same for transpose.
+        Returns:
+            np.ndarray: the transformed batch with a batch size 
+                multiplied by the number of transform sequences.
+        """
+        assert arr.ndim == 5
+        return np.concatenate([
+            self._forward_sequence(arr, transform_sequence) 
+            for transform_sequence in self.transform_sequences], axis=0)
+
+    def backward_batch(self, arr: np.ndarray) -> np.ndarray:
+        """inverse the transforms of a stacked batch and average them.
+
+        Args:
+            arr (np.ndarray): 5D array produced from the output of `forward_batch`.
+        Returns:
+            np.ndarray: the averaged batch with the original batch size.
+        """
+        assert arr.ndim == 5
+        assert arr.shape[0] % len(self) == 0
+        arrs = arr.reshape(len(self), arr.shape[0] // len(self), *arr.shape[1:])
+        # the inverse transforms are views, so they are added directly
+        result = np.copy(self._backward_sequence(
+            arrs[0], self.transform_sequences[0]))
+        for arr, transform_sequence in zip(arrs[1:], self.transform_sequences[1:]):
+            result += self._backward_sequence(arr, transform_sequence)
+        result /= len(self)
+        return result
 
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import os
+import importlib
 from pathlib import Path
 from time import time
-from typing import Generator, List, Tuple
+from typing import Generator, List, Tuple, Union
 from collections import defaultdict
 from copy import deepcopy
 
@@ -12,42 +13,58 @@ import click
 import json
 from tqdm import tqdm
 
-import zarr
-import tinybrain
-
 from chunkflow.lib.flow import *
-from cloudvolume import CloudVolume
-from cloudvolume.lib import Vec
-from cloudvolume import Skeleton 
-from cloudfiles import CloudFiles
-
-from chunkflow.lib.aws.sqs_queue import SQSQueue
-from chunkflow.lib.cartesian_coordinate import Cartesian, BoundingBox, BoundingBoxes
-from chunkflow.lib.synapses import Synapses
-
-from chunkflow.chunk import Chunk
-from chunkflow.chunk.image import Image
-from chunkflow.chunk.affinity_map import AffinityMap
-from chunkflow.chunk.segmentation import Segmentation
-from chunkflow.flow.divid_conquer.inferencer import Inferencer
-from chunkflow.point_cloud import PointCloud
-from chunkflow.volume import PrecomputedVolume
-
-# import operator functions
-from .load_precomputed import LoadPrecomputedOperator
-from .downsample_upload import DownsampleUploadOperator
-from .log_summary import load_log, print_log_statistics
-from .mask import MaskOperator
-from .mesh import MeshOperator
-from .mesh_manifest import MeshManifestOperator
-from .napari import NapariOperator
-from .neuroglancer import NeuroglancerOperator
-from .plugin import Plugin
-from .load_pngs import load_png_images
-from .save_precomputed import SavePrecomputedOperator
-from .save_pngs import SavePNGsOperator
-from .setup_env import setup_environment
-from .view import ViewOperator
+
+# The heavy modules, such as cloudvolume and the inferencer, are imported 
+# inside of the commands, so starting the command line is fast. The 
+# following names are still available as attributes of this module.
+_LAZY_NAMES = {
+    'zarr': ('zarr', None),
+    'tinybrain': ('tinybrain', None),
+    'CloudVolume': ('cloudvolume', 'CloudVolume'),
+    'Vec': ('cloudvolume.lib', 'Vec'),
+    'Skeleton': ('cloudvolume', 'Skeleton'),
+    'CloudFiles': ('cloudfiles', 'CloudFiles'),
+    'SQSQueue': ('chunkflow.lib.aws.sqs_queue', 'SQSQueue'),
+    'Cartesian': ('chunkflow.lib.cartesian_coordinate', 'Cartesian'),
+    'BoundingBox': ('chunkflow.lib.cartesian_coordinate', 'BoundingBox'),
+    'BoundingBoxes': ('chunkflow.lib.cartesian_coordinate', 'BoundingBoxes'),
+    'Synapses': ('chunkflow.lib.synapses', 'Synapses'),
+    'Chunk': ('chunkflow.chunk', 'Chunk'),
+    'Image': ('chunkflow.chunk.image', 'Image'),
+    'AffinityMap': ('chunkflow.chunk.affinity_map', 'AffinityMap'),
+    'Segmentation': ('chunkflow.chunk.segmentation', 'Segmentation'),
+    'Inferencer': ('chunkflow.flow.divid_conquer.inferencer', 'Inferencer'),
+    'PointCloud': ('chunkflow.point_cloud', 'PointCloud'),
+    'PrecomputedVolume': ('chunkflow.volume', 'PrecomputedVolume'),
+    # operator functions
+    'LoadPrecomputedOperator': ('chunkflow.flow.load_precomputed', 'LoadPrecomputedOperator'),
+    'DownsampleUploadOperator': ('chunkflow.flow.downsample_upload', 'DownsampleUploadOperator'),
+    'load_log': ('chunkflow.flow.log_summary', 'load_log'),
+    'print_log_statistics': ('chunkflow.flow.log_summary', 'print_log_statistics'),
+    'MaskOperator': ('chunkflow.flow.mask', 'MaskOperator'),
+    'MeshOperator': ('chunkflow.flow.mesh', 'MeshOperator'),
+    'MeshManifestOperator': ('chunkflow.flow.mesh_manifest', 'MeshManifestOperator'),
+    'NapariOperator': ('chunkflow.flow.napari', 'NapariOperator'),
+    'NeuroglancerOperator': ('chunkflow.flow.neuroglancer', 'NeuroglancerOperator'),
+    'Plugin': ('chunkflow.flow.plugin', 'Plugin'),
+    'load_png_images': ('chunkflow.flow.load_pngs', 'load_png_images'),
+    'SavePrecomputedOperator': ('chunkflow.flow.save_precomputed', 'SavePrecomputedOperator'),
+    'SavePNGsOperator': ('chunkflow.flow.save_pngs', 'SavePNGsOperator'),
+    'setup_environment': ('chunkflow.flow.setup_env', 'setup_environment'),
+    'ViewOperator': ('chunkflow.flow.view', 'ViewOperator'),
+}
+
+
+def __getattr__(name: str):
+    """import the heavy names at the first access. See PEP 562."""
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f'module {__name__} has no attribute {name}')
+    module_name, attr = _LAZY_NAMES[name]
+    module = importlib.import_module(module_name)
+    value = module if attr is None else getattr(module, attr)
+    globals()[name] = value
+    return value
 
 # print(f'importing modules takes {time() - ping} seconds.')
 
@@ -63,6 +80,7 @@ from .view import ViewOperator
     help='volume size or dimension.')
 @generator
 def create_bbox(start: tuple, stop: tuple, size: tuple):
+    from chunkflow.lib.cartesian_coordinate import Cartesian, BoundingBox
     assert stop is not None or size is not None
     if stop is None:
         stop = Cartesian.from_collection(start) + Cartesian.from_collection(size)
@@ -123,6 +141,8 @@ def generate_tasks(
         task_index_start: tuple, task_index_stop: tuple, 
         disbatch: bool, use_https: bool):
     """Generate a batch of tasks."""
+    from chunkflow.lib.aws.sqs_queue import SQSQueue
+    from chunkflow.lib.cartesian_coordinate import BoundingBox, BoundingBoxes
     if mip is None:
         mip = state['mip']
     assert mip >=0 
@@ -258,6 +278,7 @@ def skip_task_by_file(tasks: Generator, prefix: str, suffix: str,
 @operator
 def skip_task_by_blocks_in_volume(tasks, volume_path: str, mip: int, use_https: bool):
     """If all blocks in bounding box exist in volume, skip this task."""
+    from chunkflow.volume import PrecomputedVolume
     vol = PrecomputedVolume.from_cloudvolume_path(
         volume_path, mip=mip, use_https=use_https, bounded=True)
     for task in tasks:
@@ -406,6 +427,8 @@ def setup_env(volume_start, volume_stop, volume_size, volume_path,
               queue_name, visibility_timeout, thumbnail, encoding, voxel_size, 
               overwrite_info):
     """Setup convolutional net inference environment."""
+    from chunkflow.lib.aws.sqs_queue import SQSQueue
+    from .setup_env import setup_environment
     bboxes = setup_environment(
         state['dry_run'], volume_start, volume_stop, volume_size, volume_path, 
         max_ram_size, output_patch_size, input_patch_size, channel_num, dtype, 
@@ -496,6 +519,9 @@ def create_info(tasks,input_chunk_name: str, volume_path: str, channel_num: int,
                 layer_type: str, data_type: str, encoding: str, voxel_size: tuple, 
                 voxel_offset: tuple, volume_size: tuple, block_size: tuple, factor: tuple, max_mip: int):
     """Create attrsdata for Neuroglancer Precomputed volume."""
+    from cloudvolume import CloudVolume
+    from cloudvolume.lib import Vec
+    from chunkflow.lib.cartesian_coordinate import Cartesian
     
     for task in tasks:
         if task is not None:
@@ -568,6 +594,7 @@ def create_info(tasks,input_chunk_name: str, volume_path: str, channel_num: int,
 @generator
 def fetch_task_from_file(file_path: str, job_index: int, slurm_job_array: bool, granularity: int):
     """Fetch task from a file containing bounding boxes."""
+    from chunkflow.lib.cartesian_coordinate import BoundingBox
     if(slurm_job_array):
         job_index = int(os.environ['SLURM_ARRAY_TASK_ID'])
     assert job_index is not None
@@ -598,6 +625,8 @@ def fetch_task_from_file(file_path: str, job_index: int, slurm_job_array: bool,
 @generator
 def fetch_task_from_sqs(queue_name, visibility_timeout, num, retry_times):
     """Fetch task from queue."""
+    from chunkflow.lib.aws.sqs_queue import SQSQueue
+    from chunkflow.lib.cartesian_coordinate import BoundingBox
     # This operator is actually a generator,
     # it replaces old tasks to a completely new tasks and loop over it!
     queue = SQSQueue(queue_name, 
@@ -652,7 +681,7 @@ def aggregate_skeleton_fragments(tasks, name, input_name, prefix, fragments_path
 
 @main.command('create-chunk')
 @click.option('--size', '-s', type=click.INT, nargs=3,
-    default=Cartesian(64, 64, 64), help='the size of created chunk')
+    default=(64, 64, 64), help='the size of created chunk')
 @click.option('--dtype', '-d',
     type=click.Choice(
         ['uint8', 'uint32', 'uint16', 'uint64', 'float32', 'float64']),
@@ -668,6 +697,7 @@ def aggregate_skeleton_fragments(tasks, name, input_name, prefix, fragments_path
 @operator
 def create_chunk(tasks, size, dtype, pattern, voxel_offset, voxel_size, output_chunk_name):
     """Create a fake chunk for easy test."""
+    from chunkflow.chunk import Chunk
     print(f'creating chunk: {output_chunk_name}')
     for task in tasks:
         if task is not None:
@@ -702,6 +732,8 @@ def load_synapses(tasks, name: str, file_path: str, suffix: str,
         c_order: bool, resolution: tuple, remove_outside: bool, 
         set_bbox: bool, output_name: str):
     """Load synapses formated as JSON or HDF5."""
+    from chunkflow.lib.cartesian_coordinate import BoundingBox
+    from chunkflow.lib.synapses import Synapses
     for task in tasks:
         if task is not None:
             start = time()
@@ -757,6 +789,7 @@ def load_synapses(tasks, name: str, file_path: str, suffix: str,
 @operator
 def save_points(tasks, input_name: str, file_path: str):
     """Save synapses as HDF5 file."""
+    from chunkflow.point_cloud import PointCloud
     for task in tasks:
         if task is not None:
             points = task[input_name]
@@ -895,6 +928,8 @@ def load_pngs(tasks: dict, path_prefix: str,
                 voxel_offset: tuple, voxel_size: tuple, 
                 digit_num: int, chunk_size: tuple, dtype: str):
     """Read a serials of png files."""
+    from chunkflow.lib.cartesian_coordinate import Cartesian, BoundingBox
+    from .load_pngs import load_png_images
     cutout_offset = Cartesian.from_collection(cutout_offset)
     voxel_offset = Cartesian.from_collection(voxel_offset)
     voxel_size = Cartesian.from_collection(voxel_size)
@@ -936,6 +971,7 @@ def load_pngs(tasks: dict, path_prefix: str,
 def read_tif(tasks, name: str, file_name: str, voxel_offset: tuple,
              voxel_size: tuple, dtype: str, output_chunk_name: str):
     """Read tiff files."""
+    from chunkflow.chunk import Chunk
     for task in tasks:
         if task is not None:
             start = time()
@@ -1010,6 +1046,7 @@ def load_h5(tasks, name: str, file_name: str, dataset_path: str,
             cutout_stop: tuple, cutout_size: tuple, set_bbox: bool,
             remove_empty: bool, output_chunk_name: str):
     """Read HDF5 files."""
+    from chunkflow.chunk import Chunk
     for task in tasks:
         if task is not None:
             start = time()
@@ -1088,6 +1125,8 @@ help = 'create an empty file if the input is None.'
 def save_h5(tasks, input_name: str, file_name: str, chunk_size: tuple, 
         compression: str, with_offset: bool, voxel_size: tuple, dtype: str, touch: bool):
     """Save chunk to HDF5 file."""
+    from chunkflow.lib.synapses import Synapses
+    from chunkflow.chunk import Chunk
     for task in tasks:
         if task is not None:
             data = task[input_name]
@@ -1126,6 +1165,7 @@ def save_h5(tasks, input_name: str, file_name: str, chunk_size: tuple,
 @operator
 def save_pngs(tasks, name, input_chunk_name, dtype, output_path):
     """Save as 2D PNG images."""
+    from .save_pngs import SavePNGsOperator
     operator = SavePNGsOperator(
         output_path=output_path, 
         dtype=dtype)
@@ -1194,6 +1234,14 @@ def delete_var(tasks, var_names: str):
     'the section ids json file should named blackout_section_ids.json. default is False.')
 @click.option('--use-https/--use-credential', default=False,
     help='if we read from a public dataset in cloud storage, it is required to use https.')
+@click.option('--block-cache-size', type=MemorySizeParam, default=None,
+    help='the memory size of cached blocks, such as 4G. ' +
+    'The overlapping regions of neighboring chunks are only downloaded once. ' +
+    'default is None, no block cache.')
+@click.option('--block-cache-dir', type=str, default=None,
+    help='the local directory to cache blocks in disk. default is None, no disk cache.')
+@click.option('--block-cache-disk-size', type=MemorySizeParam, default='64G',
+    help='the maximum size of blocks cached in disk.')
 @click.option(
     '--output-chunk-name', '-o',
     type=str, default=DEFAULT_CHUNK_NAME, 
@@ -1206,12 +1254,25 @@ def load_precomputed(tasks, name: str, volume_path: str, mip: int,
         chunk_start: tuple, chunk_size: tuple,
         expand_margin_size: tuple,
         fill_missing: bool, validate_mip: int, blackout_sections: bool,
-        use_https: bool, output_chunk_name: str):
+        use_https: bool, block_cache_size: int, block_cache_dir: str,
+        block_cache_disk_size: int, output_chunk_name: str):
     """Cutout chunk from volume."""
+    from cloudvolume.lib import Vec
+    from chunkflow.lib.cartesian_coordinate import BoundingBox
+    from chunkflow.lib.cache import BlockCache
+    from .load_precomputed import LoadPrecomputedOperator
     if mip is None:
         mip = state['mip']
     assert mip >= 0
 
+    if block_cache_size is not None or block_cache_dir is not None:
+        block_cache = BlockCache(
+            max_memory=0 if block_cache_size is None else block_cache_size,
+            disk_dir=block_cache_dir,
+            max_disk_size=block_cache_disk_size)
+    else:
+        block_cache = None
+
     operator = LoadPrecomputedOperator(
         volume_path,
         mip=mip,
@@ -1220,6 +1281,7 @@ def load_precomputed(tasks, name: str, volume_path: str, mip: int,
         blackout_sections=blackout_sections,
         use_https=use_https,
         dry_run=state['dry_run'],
+        block_cache=block_cache,
         name=name)
 
     for task in tasks:
@@ -1244,9 +1306,14 @@ def load_precomputed(tasks, name: str, volume_path: str, mip: int,
                 bbox = bbox.adjust(expand_margin_size)
 
             start = time()
+            if block_cache is not None:
+                stats = block_cache.stats
             # assert output_chunk_name not in task
             task[output_chunk_name] = operator(bbox)
             task['log']['timer'][name] = time() - start
+            if block_cache is not None:
+                task['log']['block_cache'] = {key: value - stats[key]
+                    for key, value in block_cache.stats.items()}
             task['cutout_volume_path'] = volume_path
         yield task
 
@@ -1265,6 +1332,8 @@ def load_precomputed(tasks, name: str, volume_path: str, mip: int,
     help='output name of oid2skel. Note that it is a dict to map object ID to skeleton.')
 @operator
 def load_skeleton(tasks, fname: str, offset: Tuple, voxel_offset: Tuple, voxel_size: Tuple, output_name: str):
+    from cloudvolume import Skeleton
+    from chunkflow.lib.cartesian_coordinate import Cartesian
     if offset is None and voxel_offset is not None:
         assert voxel_size is not None
         voxel_offset = Cartesian.from_collection(voxel_offset)
@@ -1339,6 +1408,8 @@ def save_swc(tasks, input_name: str, output_prefix: str):
 @operator
 def load_npy(tasks, file_name: str, voxel_offset: Tuple, voxel_size: Tuple,
         output_name: str):
+    from chunkflow.lib.cartesian_coordinate import Cartesian
+    from chunkflow.chunk import Chunk
     for task in tasks:
         if task is not None:
             assert file_name.endswith('.npy')
@@ -1368,6 +1439,9 @@ def load_npy(tasks, file_name: str, voxel_offset: Tuple, voxel_size: Tuple,
 def load_zarr(tasks, store: str, path: str, chunk_start: tuple, voxel_size: tuple, 
         chunk_size: tuple, driver: str, output_chunk_name: str):
     """Load Zarr arrays."""
+    import zarr
+    from chunkflow.lib.cartesian_coordinate import Cartesian, BoundingBox
+    from chunkflow.chunk import Chunk
     if driver in ['NestedDirectoryStore', 'local'] :
         store = zarr.NestedDirectoryStore(store)
     elif driver in ['n5', 'N5FSStore']:
@@ -1432,6 +1506,7 @@ def load_zarr(tasks, store: str, path: str, chunk_start: tuple, voxel_size: tupl
 @operator
 def save_zarr(tasks, store: str, shape: tuple, input_chunk_name: str):
     """Load Zarr arrays."""
+    import zarr
     
     if os.path.exists(store):
         za = zarr.open(store, mode='w')
@@ -1471,6 +1546,7 @@ def evaluate_segmenation(tasks, segmentation_chunk_name,
                          groundtruth_chunk_name, output):
     """Evaluate segmentation by split/merge error.
     """
+    from chunkflow.chunk.segmentation import Segmentation
     for task in tasks:
         if task is not None:
             seg = Segmentation(task[segmentation_chunk_name])
@@ -1488,6 +1564,9 @@ def evaluate_segmenation(tasks, segmentation_chunk_name,
     help='downsample factor in zyx. The default is 2x2x2.')
 @operator
 def downsample(tasks, input_chunk_name: str, output_chunk_name: str, factor: tuple):
+    import tinybrain
+    from chunkflow.lib.cartesian_coordinate import Cartesian
+    from chunkflow.chunk import Chunk
     for task in tasks:
         if task is not None:
             chunk = task[input_chunk_name]
@@ -1529,6 +1608,7 @@ def downsample(tasks, input_chunk_name: str, output_chunk_name: str, factor: tup
 def downsample_upload(tasks, name, input_chunk_name, volume_path, 
                       factor, chunk_mip, start_mip, stop_mip, fill_missing):
     """Downsample chunk and upload to volume."""
+    from .downsample_upload import DownsampleUploadOperator
     if chunk_mip is None:
         chunk_mip = state['mip']
 
@@ -1577,6 +1657,7 @@ def gaussian_filter(tasks, name, input_chunk_name, sigma):
 @generator
 def log_summary(log_dir, output_size):
     """Compute the statistics of large scale run."""
+    from .log_summary import load_log, print_log_statistics
     df = load_log(log_dir)
     print_log_statistics(df, output_size=output_size)
 
@@ -1629,6 +1710,7 @@ def normalize_contrast(tasks,
         lower_clip_fraction: float, upper_clip_fraction: float, 
         minval: int, maxval: int, per_section: bool):
     """Normalize the section contrast using precomputed histograms."""
+    from chunkflow.chunk.image import Image
     
     for task in tasks:
         if task is not None:
@@ -1706,6 +1788,7 @@ def plugin(tasks, name: str, input_names: str, output_names: str, file: str, arg
     The custom python file should contain a callable named "exec" such that 
     a call of `exec(chunk, args)` can be made to operate on the chunk.
     """
+    from .plugin import Plugin
     operator = Plugin(file, name=name)
 
     for task in tasks:
@@ -1790,9 +1873,11 @@ def copy_var(tasks, from_name: str, to_name: str, deep_copy: bool):
 @click.option('--name', type=str, default='inference', 
               help='name of this operator')
 @click.option('--convnet-model', '-m',
-              type=str, default=None, help='convnet model path or type.')
+              type=str, default=None, help='convnet model path or type. ' + 
+              'Multiple models with the same patch size are separated by comma.')
 @click.option('--convnet-weight-path', '-w',
-              type=str, default=None, help='convnet weight path')
+              type=str, default=None, help='convnet weight path. ' +
+              'The weights of multiple models are separated by comma.')
 @click.option('--input-patch-size', '-s',
               type=click.INT, nargs=3, required=True, help='input patch size')
 @click.option('--output-patch-size', '-z', type=click.INT, nargs=3, default=None, 
@@ -1806,15 +1891,28 @@ def copy_var(tasks, from_name: str, to_name: str, deep_copy: bool):
 @click.option('--num-input-channels', 
               type=click.INT, default=1, help='number of input channels')
 @click.option('--num-output-channels', '-c',
-              type=click.INT, default=3, help='number of output channels')
+              type=str, default='3', help='number of output channels. ' +
+              'The numbers of multiple models are separated by comma, such as 3,1,1.')
 @click.option('--dtype', '-d', type=click.Choice(['float32', 'float16']),
               default='float32', help="""Even if we perform inference using float16, 
                     the result will still be converted to float32.""")
+@click.option('--accumulation-dtype', type=click.Choice(['float32', 'float16', 'uint16']),
+              default=None, help='data type of the output buffer to blend the patches. ' +
+              'float16 and uint16 (fixed point) halve the memory, and the output is float16. ' +
+              'default is the same with dtype.')
 @click.option('--framework', '-f',
-              type=click.Choice(['universal', 'identity', 'pytorch']),
+              type=click.Choice(['universal', 'identity', 'pytorch', 'onnxruntime']),
               default='universal', help='inference framework')
+@click.option('--framework-args', type=str, default=None,
+              help='keyword arguments of the inference framework, such as ' +
+              'intra_op_num_threads=8;inter_op_num_threads=2 for onnxruntime.')
 @click.option('--batch-size', '-b',
-              type=click.INT, default=1, help='mini batch size of input patch.')
+              type=BatchSizeParam, default=1, 
+              help='mini batch size of input patch. auto will benchmark a few batch sizes ' +
+              'and use the fastest one. The result is cached for the model and patch size.')
+@click.option('--batch-memory-limit', type=MemorySizeParam, default=None,
+              help='maximum memory of patch buffers in batch size calibration, such as 8G. ' +
+              'default is a quarter of the available memory.')
 @click.option('--bump', type=click.Choice(['wu', 'zung']), default='wu',
               help='bump function type (only support wu now!).')
 @click.option('--mask-output-chunk/--no-mask-output-chunk', default=False,
@@ -1824,19 +1922,68 @@ def copy_var(tasks, from_name: str, to_name: str, deep_copy: bool):
               help='mask myelin if netoutput have myelin channel.')
 @click.option('--augment/--no-augment',
     default=False, help='transform the input patch and transform back the output patch')
+@click.option('--num-patch-buffers', type=click.IntRange(min=1), default=1,
+    help='number of rotating input patch buffers. With more than one buffer, ' +
+    'gathering input patches and blending output patches overlap with the convnet.')
+@click.option('--output-buffer', type=click.Choice(['ram', 'memmap']), default='ram',
+    help='allocate the output buffer in RAM or as a memory map of a temporary file. ' +
+    'The memory map works for output chunks larger than RAM.')
+@click.option('--scratch-dir', type=click.Path(file_okay=False, exists=True), 
+    default=None, help='directory of the memory map files. ' + 
+    'default is the system temporary directory.')
+@click.option('--skip-empty-patches/--no-skip-empty-patches', default=False,
+    help='skip the patches with all zero input. The output is zero. default is False.')
+@click.option('--mask-volume-path', type=str, default=None,
+    help='skip the patches outside of this mask volume. default is None.')
+@click.option('--mask-mip', type=click.INT, default=5, help='mip level of the mask')
+@click.option('--patch-cache-dir', type=click.Path(file_okay=False), default=None,
+    help='local directory to cache the output patches, so the overlapping ' +
+    'patches of neighboring chunks are reused. default is None, no cache.')
+@click.option('--patch-cache-size', type=MemorySizeParam, default='16G',
+    help='maximum size of the patch cache, such as 16G. ' + 
+    'The least recently used patches are evicted.')
 @click.option('--input-chunk-name', '-i',
               type=str, default='chunk', help='input chunk name')
 @click.option('--output-chunk-name', '-o',
-              type=str, default='chunk', help='output chunk name')
+              type=str, default='chunk', help='output chunk name. ' + 
+              'The outputs of multiple models are separated by comma.')
 @operator
 def inference(
     tasks, name: str, convnet_model: str, convnet_weight_path: str,
     input_patch_size: tuple, output_patch_size: tuple, output_patch_overlap: tuple, output_crop_margin: tuple, patch_num: int, num_input_channels: int,
-    num_output_channels: int, dtype: str, framework: str, batch_size: int, 
-    bump: str, mask_output_chunk: bool,
-              mask_myelin_threshold: float, augment: bool,
+    num_output_channels: str, dtype: str, accumulation_dtype: str, 
+    framework: str, framework_args: str,
+    batch_size: Union[int, str], batch_memory_limit: int, bump: str, mask_output_chunk: bool,
+              mask_myelin_threshold: float, augment: bool, num_patch_buffers: int,
+              output_buffer: str, scratch_dir: str, skip_empty_patches: bool,
+              mask_volume_path: str, mask_mip: int,
+              patch_cache_dir: str, patch_cache_size: int,
               input_chunk_name, output_chunk_name):
-    """Perform convolutional network inference for chunks."""
+    """Perform convolutional network inference for chunks.
+
+    Multiple models share the same input patches, and the outputs are
+    saved as separate chunks.
+    """
+    from chunkflow.flow.divid_conquer.inferencer import Inferencer
+    if convnet_model is not None and ',' in convnet_model:
+        convnet_model = convnet_model.split(',')
+    if convnet_weight_path is not None and ',' in convnet_weight_path:
+        convnet_weight_path = convnet_weight_path.split(',')
+    num_output_channels = [int(c) for c in num_output_channels.split(',')]
+    if len(num_output_channels) == 1:
+        num_output_channels = num_output_channels[0]
+    output_chunk_names = output_chunk_name.split(',')
+
+    if framework_args is not None:
+        from chunkflow.lib.utils import str_to_dict
+        framework_args = str_to_dict(framework_args)
+
+    if mask_volume_path is not None:
+        from .mask import MaskOperator
+        mask_operator = MaskOperator(mask_volume_path, mask_mip, state['mip'])
+    else:
+        mask_operator = None
+
     with Inferencer(
         convnet_model,
         convnet_weight_path,
@@ -1848,25 +1995,59 @@ def inference(
         output_crop_margin=output_crop_margin,
         patch_num=patch_num,
         framework=framework,
+        framework_args=framework_args,
         dtype=dtype,
+        accumulation_dtype=accumulation_dtype,
         batch_size=batch_size,
+        batch_memory_limit=batch_memory_limit,
         bump=bump,
         augment=augment,
+        num_patch_buffers=num_patch_buffers,
+        output_buffer=output_buffer,
+        scratch_dir=scratch_dir,
+        skip_empty_patches=skip_empty_patches,
+        patch_cache_dir=patch_cache_dir,
+        patch_cache_size=patch_cache_size,
         mask_output_chunk=mask_output_chunk,
         mask_myelin_threshold=mask_myelin_threshold,
         dry_run=state['dry_run']) as inferencer:
         
+        if len(output_chunk_names) > 1:
+            assert len(output_chunk_names) == len(inferencer.output_channel_nums), \
+                'the number of output chunk names should be the same with models.'
+
         for task in tasks:
             if task is not None:
                 if 'log' not in task:
                     task['log'] = {'timer': {}}
                 start = time()
 
-                task[output_chunk_name] = inferencer(
-                    task[input_chunk_name])
+                input_chunk = task[input_chunk_name]
+                if mask_operator is not None:
+                    mask = mask_operator.cutout_mask(
+                        input_chunk.bbox, input_chunk.voxel_size)
+                else:
+                    mask = None
+                output_chunk = inferencer(input_chunk, mask=mask)
+                if len(output_chunk_names) > 1:
+                    for output_name, model_output_chunk in zip(output_chunk_names, 
+                            inferencer.split_output_chunk(output_chunk)):
+                        task[output_name] = model_output_chunk
+                else:
+                    task[output_chunk_name] = output_chunk
 
                 task['log']['timer'][name] = time() - start
                 task['log']['compute_device'] = inferencer.compute_device
+                task['log']['patch_num'] = len(inferencer.patch_slices_list)
+                task['log']['skipped_patch_num'] = inferencer.skipped_patch_num
+                if patch_cache_dir is not None:
+                    task['log']['cached_patch_num'] = inferencer.cached_patch_num
+                if len(inferencer.batch_latencies) > 0:
+                    task['log']['model_latency'] = {
+                        'batch_num': len(inferencer.batch_latencies),
+                        'mean': float(np.mean(inferencer.batch_latencies)),
+                        'max': float(np.max(inferencer.batch_latencies)),
+                    }
             yield task
 
 
@@ -1918,6 +2099,7 @@ def mask(tasks, name, input_names: str, output_names: str, volume_path: str,
     """Mask the chunk. The mask could be in higher mip level and we
     will automatically upsample it to the same mip level with chunk.
     """
+    from .mask import MaskOperator
     if output_names is None:
         output_names = input_names
         
@@ -1963,6 +2145,9 @@ def mask(tasks, name, input_names: str, output_names: str, volume_path: str,
 def mask_out_objects(tasks, input_chunk_name, output_chunk_name,
                      dust_size_threshold: int, selected_obj_ids: List[int]):
     """Mask out objects in a segmentation chunk."""
+    from cloudfiles import CloudFiles
+    from chunkflow.chunk import Chunk
+    from chunkflow.chunk.segmentation import Segmentation
     if isinstance(selected_obj_ids, str) and selected_obj_ids.endswith('.json'):
         # assume that ids is a json file in the storage path
         json_storage = CloudFiles(os.path.dirname(selected_obj_ids))
@@ -2003,6 +2188,7 @@ def mask_out_objects(tasks, input_chunk_name, output_chunk_name,
 def crop_margin(tasks, name: str, margin_size: tuple, crop_bbox: bool, 
                 input_chunk_name: str, output_chunk_name: str):
     """Crop the margin of chunk."""
+    from chunkflow.lib.cartesian_coordinate import Cartesian, BoundingBox
     for task in tasks:
         if task is not None:
             start = time()
@@ -2046,6 +2232,7 @@ def crop_margin(tasks, name: str, margin_size: tuple, crop_bbox: bool,
 def mesh(tasks, name, input_chunk_name, mip, voxel_size, output_path, output_format,
          simplification_factor, max_simplification_error, skip_ids: str, manifest, shard):
     """Perform meshing for segmentation chunk."""
+    from .mesh import MeshOperator
     if mip is None:
         mip = state['mip']
 
@@ -2082,6 +2269,7 @@ def mesh(tasks, name, input_chunk_name, mip, voxel_size, output_path, output_for
 def mesh_manifest(prefix: str, 
         disbatch: bool, digits: int, volume_path: str):
     """Generate mesh manifest files."""
+    from .mesh_manifest import MeshManifestOperator
     operator = MeshManifestOperator(volume_path)
     if prefix:
         operator(prefix, digits)
@@ -2111,6 +2299,7 @@ def mesh_manifest(prefix: str,
 @operator
 def download_mesh(tasks, volume_path: str, input: str, start_rank: int,
         stop_rank: int, out_pre: str, out_format: str):
+    from cloudvolume import CloudVolume
     vol = CloudVolume(volume_path, green_threads=True)
 
     for task in tasks:
@@ -2157,6 +2346,7 @@ def download_mesh(tasks, volume_path: str, input: str, start_rank: int,
 @operator
 def napari(tasks, name, voxel_size, inputs):
     """Visualize the chunk using neuroglancer."""
+    from .napari import NapariOperator
     operator = NapariOperator(
         name=name, voxel_size=voxel_size)
     for task in tasks:
@@ -2177,6 +2367,7 @@ def napari(tasks, name, voxel_size, inputs):
 @operator
 def neuroglancer(tasks, name, voxel_size, port, inputs):
     """Visualize the chunk using neuroglancer."""
+    from .neuroglancer import NeuroglancerOperator
     operator = NeuroglancerOperator(name=name, port=port, voxel_size=voxel_size)
     for task in tasks:
         if task is not None:
@@ -2194,6 +2385,7 @@ def neuroglancer(tasks, name, voxel_size, port, inputs):
 @operator
 def quantize(tasks, input_chunk_name: str, output_chunk_name: str, mode: str):
     """Transorm the last channel to uint8."""
+    from chunkflow.chunk.affinity_map import AffinityMap
     for task in tasks:
         if task is not None:
             chk = task[input_chunk_name]
@@ -2230,13 +2422,26 @@ def quantize(tasks, input_chunk_name: str, output_chunk_name: str, mode: str):
     help='number of processes. default is 1 and is serial.')
 @click.option('--fill-missing/--no-fill', default=False,
     help='save blocks with all zeros or not. Default is not.')
+@click.option('--staging-dir', type=str, default=None,
+    help='the local directory to stage the partial blocks in chunk edges. ' +
+    'The blocks are merged and uploaded once all the pieces are staged. ' +
+    'default is None, the partial blocks are written directly.')
+@click.option('--flush/--no-flush', default=False,
+    help='merge the remaining staged partial blocks with the existing data ' +
+    'after the tasks of this process. Every process flushing its own blocks ' +
+    'reads, modifies and writes them, so the default is not flushing, and ' +
+    'flush-precomputed should run once after all the tasks are done.')
+@click.option('--num-threads', type=click.INT, default=None,
+    help='number of threads to upload blocks. default is the number of cores.')
 @operator
 def save_precomputed(tasks, name: str, volume_path: str, 
         input_chunk_name: str, mip: int, upload_log: bool, 
         create_thumbnail: bool, intensity_threshold: float,
         parallel: int,
-        fill_missing: bool):
+        fill_missing: bool, staging_dir: str, flush: bool,
+        num_threads: int):
     """Save chunk to volume."""
+    from .save_precomputed import SavePrecomputedOperator
     if mip is None:
         mip = state['mip']
 
@@ -2248,6 +2453,8 @@ def save_precomputed(tasks, name: str, volume_path: str,
         name=name,
         parallel=parallel,
         fill_missing=fill_missing,
+        staging_dir=staging_dir,
+        num_threads=num_threads,
     )
 
     for task in tasks:
@@ -2263,6 +2470,43 @@ def save_precomputed(tasks, name: str, volume_path: str,
 
         yield task
 
+    if flush:
+        operator.flush()
+
+
+@main.command('flush-precomputed')
+@click.option('--name', type=str, default='flush-precomputed', help='name of this operator')
+@click.option('--volume-path', '-v', type=str, required=True, help='volume path')
+@click.option('--mip', '-m',
+    type=click.INT, default=None, help="mip level to write")
+@click.option('--staging-dir', type=str, required=True,
+    help='the local directory of the staged partial blocks of save-precomputed.')
+@click.option('--num-threads', type=click.INT, default=None,
+    help='number of threads to upload blocks. default is the number of cores.')
+@operator
+def flush_precomputed(tasks, name: str, volume_path: str, mip: int, 
+        staging_dir: str, num_threads: int):
+    """Upload the staged partial blocks of save-precomputed.
+
+    The remaining partial blocks are merged with the existing data in 
+    the volume. Run it once after all the tasks of save-precomputed.
+    """
+    from .save_precomputed import SavePrecomputedOperator
+    if mip is None:
+        mip = state['mip']
+
+    operator = SavePrecomputedOperator(
+        volume_path,
+        mip,
+        upload_log=False,
+        name=name,
+        staging_dir=staging_dir,
+        num_threads=num_threads,
+    )
+    for task in tasks:
+        yield task
+    operator.flush()
+
 
 @main.command('threshold')
 @click.option('--name', type=str, default='threshold', 
@@ -2312,6 +2556,7 @@ def channel_voting(tasks, input_chunk_name, output_chunk_name):
 @operator
 def view(tasks, name, image_chunk_name, segmentation_chunk_name):
     """Visualize the chunk using cloudvolume view in browser."""
+    from .view import ViewOperator
     operator = ViewOperator(name=name)
     for task in tasks:
         if task is not None:
@@ -2320,6 +2565,9 @@ def view(tasks, name, image_chunk_name, segmentation_chunk_name):
         yield task
 
 
+__all__ = [name for name in globals() if not name.startswith('_')] + \
+    list(_LAZY_NAMES.keys())
+
 
 if __name__ == '__main__':
     main()
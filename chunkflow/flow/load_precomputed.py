@@ -8,6 +8,7 @@ from chunkflow.lib.cartesian_coordinate import BoundingBox, Cartesian
 from chunkflow.chunk.validate import validate_by_template_matching
 from tinybrain import downsample_with_averaging
 from chunkflow.chunk import Chunk
+from chunkflow.lib.cache import BlockCache
 from .base import OperatorBase
 
 
@@ -21,7 +22,12 @@ class LoadPrecomputedOperator(OperatorBase):
                  use_https: bool = False,
                  dry_run: bool = False,
                  verbose: bool = False,
+                 block_cache: BlockCache = None,
                  name: str = 'cutout'):
+        """
+        block_cache: cache the downloaded blocks, so the overlapping regions
+            of neighboring chunks are only downloaded once.
+        """
         super().__init__(name=name)
         self.volume_path = volume_path
         self.mip = mip
@@ -29,6 +35,7 @@ class LoadPrecomputedOperator(OperatorBase):
         self.validate_mip = validate_mip
         self.blackout_sections = blackout_sections
         self.dry_run = dry_run
+        self.block_cache = block_cache
        
         if blackout_sections:
             stor = CloudFiles(volume_path)
@@ -65,11 +72,15 @@ class LoadPrecomputedOperator(OperatorBase):
 
         print(f'cutout ZYX_{chunk_slices} from {self.volume_path}')
 
-        # always reverse the indexes since cloudvolume use x,y,z indexing
-        chunk = self.vol[chunk_slices[::-1]]
-        chunk = np.asarray(chunk)
-        # the cutout is fortran ordered, so need to transpose and make it C order
-        chunk = chunk.transpose()
+        if self.block_cache is not None:
+            # the blocks are assembled in C order
+            chunk = self.block_cache.cutout(self.vol, bbox)
+        else:
+            # always reverse the indexes since cloudvolume use x,y,z indexing
+            chunk = self.vol[chunk_slices[::-1]]
+            chunk = np.asarray(chunk)
+            # the cutout is fortran ordered, so need to transpose and make it C order
+            chunk = chunk.transpose()
 
         # we can delay this transpose later
         # actually we do not need to make it contiguous
@@ -47,15 +47,7 @@ class MaskOperator(OperatorBase):
         assert len(chunks)>0
 
         voxel_size = chunks[0].voxel_size
-
-        mask_voxel_size = Cartesian.from_collection(
-            self.mask_vol.resolution[::-1]
-        )
-        factor = mask_voxel_size // voxel_size
-        # factor = tuple(m//c for m, c in zip(self.mask_vol.resolution[::-1], chunk.voxel_size))
-        for m, c in zip(mask_voxel_size, voxel_size): 
-            assert m >= c
-            assert m % c == 0
+        factor = self._get_factor(voxel_size)
 
         mask_in_high_mip = self._read_mask_in_high_mip(chunks[0].bbox, factor)
 
@@ -83,6 +75,37 @@ class MaskOperator(OperatorBase):
         return chunks
 
 
+    @property
+    def mask_voxel_size(self) -> Cartesian:
+        return Cartesian.from_collection(self.mask_vol.resolution[::-1])
+
+    def _get_factor(self, voxel_size: Cartesian) -> Cartesian:
+        """the mask voxel size should be divisible by the chunk voxel size"""
+        mask_voxel_size = self.mask_voxel_size
+        factor = mask_voxel_size // voxel_size
+        # factor = tuple(m//c for m, c in zip(self.mask_vol.resolution[::-1], chunk.voxel_size))
+        for m, c in zip(mask_voxel_size, voxel_size): 
+            assert m >= c
+            assert m % c == 0
+        return factor
+
+    def cutout_mask(self, chunk_bbox, voxel_size: Cartesian) -> Chunk:
+        """cutout the mask covering a chunk without upsampling it.
+
+        Args:
+            chunk_bbox (BoundingBox): the bounding box of the chunk.
+            voxel_size (Cartesian): the voxel size of the chunk.
+        
+        Returns:
+            Chunk: the boolean mask in the mask mip level.
+        """
+        factor = self._get_factor(voxel_size)
+        mask = self._read_mask_in_high_mip(chunk_bbox, factor)
+        voxel_offset = tuple(s.start // f for s, f in zip(
+            chunk_bbox.slices[-3:], factor))
+        return Chunk(mask, voxel_offset=voxel_offset, 
+            voxel_size=self.mask_voxel_size)
+
     def _read_mask_in_high_mip(self, chunk_bbox, factor):
         """
         chunk_bbox: the bounding box of the chunk in lower mip level
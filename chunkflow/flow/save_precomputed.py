@@ -11,6 +11,7 @@ from cloudfiles import CloudFiles
 from chunkflow.lib.cartesian_coordinate import BoundingBox
 from chunkflow.lib.igneous.tasks import downsample_and_upload
 from chunkflow.chunk import Chunk
+from chunkflow.volume import AlignedSaver
 
 from .base import OperatorBase
 #from .downsample_upload import DownsampleUploadOperator
@@ -24,7 +25,16 @@ class SavePrecomputedOperator(OperatorBase):
                  create_thumbnail: bool = False,
                  fill_missing: bool = False,
                  parallel: int = 1,
+                 staging_dir: str = None,
+                 num_threads: int = None,
                  name: str = 'save-precomputed'):
+        """
+        staging_dir: the local directory to stage the partial blocks in the
+            chunk edges. The partial blocks are merged and uploaded by the
+            task completing the block or by flush. default is None, the
+            partial blocks are read, modified and written in storage.
+        num_threads: the number of threads to upload the blocks.
+        """
         super().__init__(name=name)
         
         self.upload_log = upload_log
@@ -47,6 +57,8 @@ class SavePrecomputedOperator(OperatorBase):
             delete_black_uploads=True,
             parallel=parallel,
             progress=True)
+        self.saver = AlignedSaver(self.volume, staging_dir=staging_dir,
+            num_threads=num_threads)
 
         if upload_log:
             log_path = os.path.join(volume_path, 'log')
@@ -67,9 +79,7 @@ class SavePrecomputedOperator(OperatorBase):
         start = time.time()
         chunk = self._auto_convert_dtype(chunk, self.volume)
         
-        # transpose czyx to xyzc order
-        arr = np.transpose(chunk.array)
-        self.volume[chunk.slices[::-1]] = arr
+        self.saver.save(chunk.array, chunk.bbox)
         
         if self.create_thumbnail:
             self._create_thumbnail(chunk)
@@ -81,6 +91,10 @@ class SavePrecomputedOperator(OperatorBase):
         if self.upload_log:
             self._upload_log(log, chunk.bbox)
 
+    def flush(self):
+        """upload the staged partial blocks."""
+        self.saver.flush()
+
     def _auto_convert_dtype(self, chunk, volume):
         """convert the data type to fit volume datatype"""
         if np.issubdtype(volume.dtype, np.floating) and np.issubdtype(chunk.dtype, np.uint8):
@@ -33,12 +33,7 @@ class SQSQueue(object):
             only sent to a few servers. Normally, we should set fetch wait time to use long poll. 
             checkout the AWS `documentation <https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/sqs-long-polling.html#sqs-short-long-polling-differences>`_
         """
-        credentials = aws_credentials()
-        self.client = boto3.client(
-            'sqs',
-            region_name=credentials['AWS_DEFAULT_REGION'],
-            aws_secret_access_key=credentials['AWS_SECRET_ACCESS_KEY'],
-            aws_access_key_id=credentials['AWS_ACCESS_KEY_ID'])
+        self.client = self._create_client()
 
         self.queue_name = queue_name
         
@@ -61,6 +56,25 @@ class SQSQueue(object):
         self.fetch_wait_time_seconds = fetch_wait_time_seconds
         self.retry_times = retry_times
     
+    def _create_client(self):
+        credentials = aws_credentials()
+        return boto3.client(
+            'sqs',
+            region_name=credentials['AWS_DEFAULT_REGION'],
+            aws_secret_access_key=credentials['AWS_SECRET_ACCESS_KEY'],
+            aws_access_key_id=credentials['AWS_ACCESS_KEY_ID'])
+
+    def __getstate__(self):
+        # the boto3 client can not be pickled, 
+        # so we recreate it in another process.
+        state = self.__dict__.copy()
+        del state['client']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.client = self._create_client()
+
     def _exist(self, queue_name):
         resp = self.client.list_queues(QueueNamePrefix=queue_name)
         if 'QueueUrls' in resp:
@@ -0,0 +1,290 @@
+__doc__ = """
+Least recently used caches in memory and local disk.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from cloudvolume.exceptions import OutOfBoundsError
+
+from .cartesian_coordinate import BoundingBox, Cartesian
+
+
+class DiskCache(object):
+    """least recently used cache of arrays in a local directory.
+
+    The arrays are saved as npy files named by the keys. The least recently
+    used files are evicted when the total size is over the limit. The files
+    are written atomically, so the cache could be shared by multiple processes.
+    """
+    def __init__(self, directory: str, max_size: int = 16 * 1024**3):
+        """
+        Args:
+            directory (str): the local directory of cached arrays.
+            max_size (int): the maximum total bytes of cached arrays.
+        """
+        directory = os.path.expanduser(directory)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        self.nbytes = sum(entry.stat().st_size for entry in self._entries())
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory)
+            if entry.name.endswith('.npy')]
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, f'{key}.npy')
+
+    def get(self, key: str):
+        """
+        Returns:
+            np.ndarray or None: the cached array.
+        """
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            # mark as recently used
+            os.utime(path)
+        except (FileNotFoundError, ValueError, EOFError):
+            # the file could be evicted by another process
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def put(self, key: str, array: np.ndarray):
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as file:
+            np.save(file, array)
+        path = self._path(key)
+        try:
+            # the overwritten file is not counted twice
+            self.nbytes -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, path)
+        self.nbytes += os.path.getsize(path)
+        if self.nbytes > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """remove the least recently used arrays until the total size
+        is under 90% of the limit."""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        self.nbytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.nbytes <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.nbytes -= size
+
+
+class BlockCache(object):
+    """least recently used cache of volume blocks.
+
+    The blocks are keyed by (layer path, mip, block grid index), and are
+    saved in a bounded memory tier and an optional local disk tier. The
+    cutouts are assembled from the cached blocks, and only the missing
+    blocks are downloaded, so the overlapping regions of neighboring
+    chunks are only downloaded once.
+    """
+    def __init__(self, max_memory: int = 1024**3, disk_dir: str = None,
+            max_disk_size: int = 64 * 1024**3):
+        """
+        Args:
+            max_memory (int): the maximum bytes of blocks in memory.
+            disk_dir (str): the local directory of the disk tier.
+                default is None, no disk tier.
+            max_disk_size (int): the maximum bytes of blocks in disk.
+        """
+        self.max_memory = max_memory
+        self.blocks = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        if disk_dir is not None:
+            self.disk = DiskCache(disk_dir, max_size=max_disk_size)
+        else:
+            self.disk = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+        }
+
+    def _disk_key(self, key: tuple) -> str:
+        return hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+
+    def _put_in_memory(self, key: tuple, block: np.ndarray):
+        with self.lock:
+            if key in self.blocks:
+                self.nbytes -= self.blocks.pop(key).nbytes
+            self.blocks[key] = block
+            self.nbytes += block.nbytes
+            while self.nbytes > self.max_memory and len(self.blocks) > 0:
+                _, evicted = self.blocks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def get(self, key: tuple):
+        """
+        Returns:
+            np.ndarray or None: the cached block.
+        """
+        with self.lock:
+            block = self.blocks.get(key)
+            if block is not None:
+                self.blocks.move_to_end(key)
+                self.memory_hits += 1
+                return block
+
+        if self.disk is not None:
+            block = self.disk.get(self._disk_key(key))
+            if block is not None:
+                self.disk_hits += 1
+                self._put_in_memory(key, block)
+                return block
+
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, block: np.ndarray):
+        self._put_in_memory(key, block)
+        if self.disk is not None:
+            self.disk.put(self._disk_key(key), block)
+
+    def cutout(self, vol, bbox: BoundingBox, num_threads: int = None) -> np.ndarray:
+        """cutout a region from the cached blocks.
+
+        The missing blocks are grouped into runs of consecutive blocks along
+        the x axis, and every run is downloaded in one request, so the cached
+        blocks are never downloaded again.
+
+        Args:
+            vol (CloudVolume): the volume at the mip level of cutout.
+            bbox (BoundingBox): the region in z,y,x order.
+            num_threads (int): the number of threads to download the runs.
+                default is the number of available cores.
+
+        Returns:
+            np.ndarray: the C order array with channel, z, y, x dimensions.
+                The region outside of an unbounded volume is filled with zero.
+        """
+        block_size = Cartesian.from_collection(vol.chunk_size[::-1])
+        volume_bbox = _volume_bounding_box(vol)
+        region = bbox.intersection(volume_bbox)
+        if vol.bounded and region != bbox:
+            raise OutOfBoundsError(
+                f'requested bounding box {bbox} is out of volume bounds {volume_bbox}')
+
+        array = np.zeros((vol.num_channels, *bbox.shape), dtype=vol.dtype)
+        if np.any(np.asarray(region.shape) <= 0):
+            return array
+
+        runs = []
+        previous_missing = None
+        for idx, block_bbox in _block_grid(volume_bbox, block_size, region):
+            key = (vol.cloudpath, vol.mip, idx)
+            block = self.get(key)
+            if block is not None:
+                _copy_block(block, block_bbox, array, bbox)
+                continue
+            if previous_missing is not None and \
+                    previous_missing[:2] == idx[:2] and \
+                    previous_missing[2] + 1 == idx[2]:
+                runs[-1].append((key, block_bbox))
+            else:
+                runs.append([(key, block_bbox)])
+            previous_missing = idx
+
+        def _download(run: list):
+            run_bbox = run[0][1].union(run[-1][1])
+            data = np.asarray(vol[run_bbox.slices[::-1]]).transpose()
+            for key, block_bbox in run:
+                block = np.ascontiguousarray(
+                    data[_relative_slices(block_bbox, run_bbox.start)])
+                self.put(key, block)
+                _copy_block(block, block_bbox, array, bbox)
+
+        if num_threads is None:
+            num_threads = _default_num_threads()
+        if vol.parallel != 1:
+            # do not nest the threads inside of the processes of CloudVolume
+            num_threads = 1
+        if len(runs) <= 1 or num_threads == 1:
+            for run in runs:
+                _download(run)
+        else:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                # consume the results to raise the errors in threads
+                list(executor.map(_download, runs))
+        return array
+
+
+def _default_num_threads() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    else:
+        return os.cpu_count()
+
+
+def _volume_bounding_box(vol) -> BoundingBox:
+    # from xyz to zyx
+    return BoundingBox.from_bbox(vol.bounds).inverse_order()
+
+
+def _block_grid(volume_bbox: BoundingBox, block_size: Cartesian,
+        region: BoundingBox) -> list:
+    """the storage blocks overlapping with a region inside of the volume.
+
+    Returns:
+        list of (tuple, BoundingBox): the block grid index and the
+            bounding box of block cropped by the volume bounds.
+    """
+    grid_offset = volume_bbox.start
+    grid_start = (region.start - grid_offset) // block_size
+    grid_stop = (region.stop - grid_offset - 1) // block_size + 1
+    blocks = []
+    for idx in np.ndindex(*(grid_stop - grid_start)):
+        idx = grid_start + Cartesian.from_collection(idx)
+        block_start = grid_offset + idx * block_size
+        block_stop = Cartesian.from_collection(np.minimum(
+            block_start + block_size, volume_bbox.stop))
+        blocks.append((idx.tuple, BoundingBox(block_start, block_stop)))
+    return blocks
+
+
+def _relative_slices(bbox: BoundingBox, offset: Cartesian) -> tuple:
+    """the slices of a bounding box in an array starting from offset,
+    including the channel dimension."""
+    return (slice(None),) + tuple(slice(start - o, stop - o)
+        for start, stop, o in zip(bbox.start, bbox.stop, offset))
+
+
+def _copy_block(block: np.ndarray, block_bbox: BoundingBox,
+        array: np.ndarray, bbox: BoundingBox):
+    overlap = block_bbox.intersection(bbox)
+    array[_relative_slices(overlap, bbox.start)] = \
+        block[_relative_slices(overlap, block_bbox.start)]
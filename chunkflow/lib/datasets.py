@@ -0,0 +1,86 @@
+__doc__ = """
+Process-wide registry of opened datasets.
+
+Opening a dataset reads its metadata, and the decoded chunks are cached
+in the dataset handle. The handles are registered by their specification,
+so every task in a worker reuses them.
+"""
+import json
+import threading
+
+
+_datasets = {}
+_tensorstore_contexts = {}
+_lock = threading.Lock()
+
+
+def open_dataset(key: tuple, opener: callable):
+    """open a dataset only once in the process.
+
+    Args:
+        key (tuple): the hashable specification of dataset.
+        opener (callable): open the dataset if it is not registered.
+
+    Returns:
+        the registered dataset handle.
+    """
+    with _lock:
+        if key not in _datasets:
+            _datasets[key] = opener()
+        return _datasets[key]
+
+
+def clear_datasets():
+    """close all the registered datasets."""
+    with _lock:
+        _datasets.clear()
+        _tensorstore_contexts.clear()
+
+
+def open_tensorstore(spec: dict, cache_size: int = None):
+    """open a tensorstore dataset with a shared cache pool.
+
+    Args:
+        spec (dict): the tensorstore specification without context.
+        cache_size (int): the total bytes limit of the cache pool. The
+            datasets with the same limit share the cache pool.
+    """
+    import tensorstore as ts
+
+    def _open():
+        if cache_size not in _tensorstore_contexts:
+            context = {}
+            if cache_size is not None:
+                context['cache_pool'] = {'total_bytes_limit': cache_size}
+            _tensorstore_contexts[cache_size] = ts.Context(context)
+        return ts.open(spec, context=_tensorstore_contexts[cache_size]).result()
+
+    key = ('tensorstore', json.dumps(spec, sort_keys=True), cache_size)
+    return open_dataset(key, _open)
+
+
+def open_zarr(store_path: str, path: str = None, mode: str = 'r',
+        n5: bool = False, **storage_options):
+    """open a Zarr or N5 array.
+
+    Args:
+        store_path (str): the local directory or remote url of the store.
+        path (str): the array path inside of the store.
+        mode (str): 'r' for read only, 'r+' for read and write.
+        n5 (bool): the store is N5 or not.
+        storage_options: the options of remote N5 store, such as anon=True.
+    """
+    import zarr
+
+    def _open():
+        if not n5:
+            store = store_path
+        elif '://' in store_path:
+            store = zarr.N5FSStore(store_path, **storage_options)
+        else:
+            store = zarr.N5Store(store_path)
+        return zarr.open(store, mode=mode, path=path)
+
+    key = ('zarr', store_path, path, mode, n5,
+        tuple(sorted(storage_options.items())))
+    return open_dataset(key, _open)
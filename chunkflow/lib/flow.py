@@ -1,21 +1,71 @@
+import os
 import sys
-from typing import Union
+import json
+import resource
+import threading
+import traceback
+import multiprocessing
+from queue import Queue, Empty
+from time import time, thread_time
+from itertools import count
+from collections import OrderedDict, deque
+from typing import Union, Iterable
 
 from functools import update_wrapper, wraps
 
 import click
-from .cartesian_coordinate import Cartesian
 
 
 class CartesianParamType(click.ParamType):
     name = 'Cartesian'
     
     def convert(self, value: Union[list, tuple], param, ctx):
+        # cartesian_coordinate imports cloudvolume, which is slow to import
+        from .cartesian_coordinate import Cartesian
         assert len(value) == 3
         return Cartesian.from_collection(value)        
 
 CartesianParam = CartesianParamType()
 
+
+class MemorySizeParamType(click.ParamType):
+    """memory size in bytes, such as 32G, 512M or 1048576."""
+    name = 'MemorySize'
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+    def convert(self, value: Union[str, int], param, ctx):
+        if isinstance(value, int):
+            return value
+        text = value.strip().upper().rstrip('B').rstrip('I')
+        multiplier = 1
+        if text and text[-1] in self.units:
+            multiplier = self.units[text[-1]]
+            text = text[:-1]
+        try:
+            return int(float(text) * multiplier)
+        except ValueError:
+            self.fail(f'{value} is not a valid memory size.', param, ctx)
+
+MemorySizeParam = MemorySizeParamType()
+
+
+class BatchSizeParamType(click.ParamType):
+    """a positive integer or auto."""
+    name = 'BatchSize'
+
+    def convert(self, value: Union[str, int], param, ctx):
+        if value == 'auto' or isinstance(value, int):
+            return value
+        try:
+            value = int(value)
+        except ValueError:
+            self.fail(f'{value} is not an integer or auto.', param, ctx)
+        if value < 1:
+            self.fail(f'{value} is not a positive integer.', param, ctx)
+        return value
+
+BatchSizeParam = BatchSizeParamType()
+
 # global dict to hold the operators and parameters
 state = {'operators': {}}
 DEFAULT_CHUNK_NAME = 'chunk'
@@ -49,34 +99,579 @@ def default_none(ctx, _, value):
               help='dry run or real run. default is real run.')
 @click.option('--verbose/--quiet', default=False, 
     help='show more information or not. default is False.')
-def main(mip, dry_run, verbose):
+@click.option('--pipeline-depth', type=click.IntRange(min=0), default=0,
+    help='run every operator in its own thread and buffer this number of tasks ' +
+    'between neighboring operators. default is 0 and operators run in serial.')
+@click.option('--workers', type=click.IntRange(min=1), default=1,
+    help='number of worker processes. The tasks from the first operator, ' +
+    'such as generate-tasks or fetch-task-from-sqs, are distributed to the workers ' +
+    'and every worker runs the remaining operators. default is 1 without worker process.')
+@click.option('--max-memory', type=MemorySizeParam, default=None,
+    help='memory budget of the chunks in the tasks in flight, such as 32G. ' +
+    'The upstream operators block when the budget is exceeded. ' +
+    'It is split evenly across the worker processes. default is no limit.')
+@click.option('--auto-delete-var/--no-auto-delete-var', default=False,
+    help='delete the task variables right after the last operator using them. ' +
+    'The variables are found from the input and output name options of operators. ' +
+    'default is False.')
+@click.option('--trace', type=click.Path(dir_okay=False, writable=True), 
+    default=None, help='record the time, memory and task variable sizes of ' + 
+    'every operator and save them to a Chrome trace file, such as out.json. ' +
+    'It could be viewed in chrome://tracing or https://ui.perfetto.dev')
+def main(mip, dry_run, verbose, pipeline_depth, workers, max_memory, 
+        auto_delete_var, trace):
     """Compose operators and create your own pipeline."""
     
     state['mip'] = mip
     state['dry_run'] = dry_run
     state['verbose'] = verbose
+    state['pipeline_depth'] = pipeline_depth
+    state['workers'] = workers
+    state['max_memory'] = max_memory
+    state['auto_delete_var'] = auto_delete_var
+    state['trace'] = trace
     if dry_run:
         print('\nYou are using dry-run mode, will not do the work!')
 
 
 @main.result_callback()
-def process_commands(operators, mip, dry_run, verbose):
+def process_commands(operators, mip, dry_run, verbose, pipeline_depth, workers, 
+        max_memory, auto_delete_var, trace):
     """This result callback is invoked with an iterable of all 
     the chained subcommands. As in this example each subcommand 
     returns a function we can chain them together to feed one 
     into the other, similar to how a pipe on unix works.
+
+    With a positive pipeline depth, every operator is evaluated in 
+    its own thread, so the next task could be loaded while the 
+    current one is in inference and the previous one is uploading.
     """
     # It turns out that a tuple will not work correctly!
     stream = [get_initial_task(), ]
 
-    # Pipe it through all stream operators.
-    for operator in operators:
-        stream = operator(stream)
+    if auto_delete_var:
+        delete_vars = plan_variable_deletion(operators)
+        if verbose:
+            for operator, var_names in zip(operators, delete_vars):
+                if var_names:
+                    print(f'delete {sorted(var_names)} after {operator_name(operator)}')
+    else:
+        delete_vars = None
+
+    tracer = None if trace is None else Tracer()
+    try:
+        if workers > 1 and len(operators) > 1:
+            # the first operator produces tasks for the worker processes
+            stream = chain_operators(stream, operators[:1], pipeline_depth,
+                delete_vars=None if delete_vars is None else delete_vars[:1],
+                tracer=tracer)
+            run_in_worker_processes(stream, operators[1:], workers, 
+                pipeline_depth=pipeline_depth, verbose=verbose, 
+                max_memory=max_memory, 
+                delete_vars=None if delete_vars is None else delete_vars[1:],
+                tracer=tracer)
+            return
+
+        accountant = None if max_memory is None else MemoryAccountant(max_memory)
+
+        # Pipe it through all stream operators.
+        stream = chain_operators(stream, operators, pipeline_depth, 
+            accountant=accountant, delete_vars=delete_vars, tracer=tracer)
+
+        # Evaluate the stream and throw away the items.
+        for task in stream:
+            if accountant is not None:
+                accountant.release(task)
+    finally:
+        if tracer is not None:
+            tracer.save(trace)
+            print(f'saved {len(tracer.events)} trace events to {trace}')
+
+
+def chain_operators(stream: Iterable, operators: list, pipeline_depth: int = 0,
+        accountant: 'MemoryAccountant' = None, delete_vars: list = None,
+        tracer: 'Tracer' = None):
+    """pipe the task stream through operators.
+    
+    The consumer of the returned stream should release every task 
+    from the memory accountant after it is done.
+
+    Args:
+        delete_vars (list): the task variable names to delete after 
+            every operator. See :func:`plan_variable_deletion`.
+        tracer (Tracer): record a span for every task of every operator.
+    """
+    for idx, operator in enumerate(operators):
+        if tracer is not None:
+            stream = tracer.trace(operator, stream)
+        else:
+            stream = operator(stream)
         # task = next(stream)
+        if delete_vars is not None and delete_vars[idx]:
+            stream = delete_task_vars(stream, delete_vars[idx])
+        if accountant is not None:
+            stream = accountant.account(stream)
+        if pipeline_depth > 0:
+            stream = prefetch(stream, pipeline_depth)
+    return stream
+
+
+# the task variables used by the operator closures, but not named by options
+RESERVED_TASK_VARS = {'bbox', 'bbox_index', 'bbox_num', 'log', 'queue', 
+    'task_handle', 'cutout_volume_path', 'output_volume_path'}
+# the options naming the task variables read or written by an operator
+READ_VAR_OPTIONS = ('input_chunk_name', 'input_name', 'input_names', 'inputs', 
+    'input', 'image_chunk_name', 'segmentation_chunk_name', 
+    'groundtruth_chunk_name', 'multiplier_name', 'from_name', 'var_names')
+WRITE_VAR_OPTIONS = ('output_chunk_name', 'output_name', 'output_names', 
+    'to_name', 'output')
+# the operators could access any task variable
+OPAQUE_OPERATORS = {'debug'}
+
+
+def operator_name(operator) -> str:
+    return getattr(operator, 'name', getattr(operator, '__name__', 'operator'))
+
+
+def _option_var_names(kwargs: dict, options: tuple) -> set:
+    var_names = set()
+    for option in options:
+        value = kwargs.get(option)
+        if isinstance(value, str):
+            var_names.update(name for name in value.split(',') if name)
+    return var_names
+
+
+def plan_variable_deletion(operators: list) -> list:
+    """Find the task variables to delete after every operator.
+
+    The variables read and written by an operator are found from its 
+    name options, such as `--input-chunk-name` and `--output-names`. 
+    A variable is deleted right after an operator if no following 
+    operator reads it before overwriting it. The reserved variables, 
+    such as bbox and log, are never deleted. An operator without known 
+    options, such as debug, could read any variable, so all the 
+    variables are kept alive until it finishes.
+
+    Args:
+        operators (list): the operators created by the commands.
+
+    Returns:
+        list of set: the variable names to delete after every operator.
+    """
+    # None means that the operator could access any variable
+    accesses = []
+    for operator in operators:
+        kwargs = getattr(operator, 'kwargs', None)
+        if kwargs is None or operator_name(operator) in OPAQUE_OPERATORS:
+            accesses.append(None)
+        else:
+            reads = _option_var_names(kwargs, READ_VAR_OPTIONS)
+            writes = _option_var_names(kwargs, WRITE_VAR_OPTIONS)
+            accesses.append((reads - RESERVED_TASK_VARS, 
+                writes - RESERVED_TASK_VARS))
+
+    delete_vars = []
+    for idx, access in enumerate(accesses):
+        var_names = set()
+        if access is not None:
+            for var_name in access[0] | access[1]:
+                if _is_dead_after(var_name, accesses[idx+1:]):
+                    var_names.add(var_name)
+        delete_vars.append(var_names)
+    return delete_vars
+
+
+def _is_dead_after(var_name: str, accesses: list) -> bool:
+    """the variable is not read by the following operators before overwritten."""
+    for access in accesses:
+        if access is None:
+            return False
+        reads, writes = access
+        if var_name in reads:
+            return False
+        if var_name in writes:
+            return True
+    return True
+
+
+def delete_task_vars(stream: Iterable, var_names: set):
+    """delete the variables from every task in the stream."""
+    for task in stream:
+        if task is not None:
+            for var_name in var_names:
+                task.pop(var_name, None)
+        yield task
+
+
+def task_var_nbytes(task: dict) -> dict:
+    """the number of bytes of every chunk and array in a task."""
+    if task is None:
+        return {}
+    # both Chunk and numpy array have nbytes
+    return {key: value.nbytes for key, value in task.items() 
+        if hasattr(value, 'nbytes')}
+
+
+def task_nbytes(task: dict) -> int:
+    """the number of bytes of the chunks and arrays in a task."""
+    return sum(task_var_nbytes(task).values())
+
+
+def _max_rss() -> int:
+    """the peak resident set size of this process in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the unit is kilobytes in Linux and bytes in macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Tracer(object):
+    """Record a span for every task processed by every operator.
+
+    A span starts when the operator receives a task and stops when it 
+    yields the task, so the time spent in the upstream operators is 
+    excluded. Every span records the wall time, the CPU time of the 
+    operator thread, the bytes of task variables in and out and the 
+    increase of peak RSS. The spans are saved as complete events of 
+    the Chrome trace format.
+    """
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def trace(self, operator, stream: Iterable):
+        """apply the operator to the stream and record the spans."""
+        name = operator_name(operator)
+        # the span starts from the last received task. For generators 
+        # without input, it starts from the resuming of generator.
+        span = {}
+
+        def start(task):
+            span['start'] = time()
+            span['cpu'] = thread_time()
+            span['rss'] = _max_rss()
+            span['bytes_in'] = task_var_nbytes(task)
+
+        def receive():
+            for task in stream:
+                start(task)
+                yield task
+
+        start(None)
+        for task in operator(receive()):
+            self.add_span(name, span, task)
+            yield task
+            start(None)
+
+    def add_span(self, name: str, span: dict, task: dict):
+        stop = time()
+        args = {
+            'cpu_time': thread_time() - span['cpu'],
+            'max_rss_delta': _max_rss() - span['rss'],
+            'bytes_in': span['bytes_in'],
+            'bytes_out': task_var_nbytes(task),
+        }
+        if task is None:
+            args['skipped'] = True
+        elif 'bbox' in task and hasattr(task['bbox'], 'string'):
+            args['bbox'] = task['bbox'].string
+        event = {
+            'name': name,
+            'cat': 'operator',
+            'ph': 'X',
+            # the unit is microsecond
+            'ts': span['start'] * 1e6,
+            'dur': (stop - span['start']) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def save(self, file_path: str):
+        with open(file_path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, 
+                file)
+
+
+class MemoryAccountant(object):
+    """Track the memory of the tasks in flight and enforce a budget.
+
+    The size of a task is measured after every operator. If the total 
+    size of the tasks in flight exceeds the budget, the operator 
+    blocks until the downstream operators finish some tasks. The oldest 
+    task in flight never blocks, so the pipeline always makes progress.
+
+    Every task is tracked by a unique token outside of the task. The 
+    operators keep the task order, so a task skipped, dropped, copied or 
+    replaced by an operator is the oldest one yielded by the upstream 
+    operator but not by this operator yet.
+
+    This only takes effect with a positive pipeline depth, since a 
+    serial chain only holds one task at a time.
+
+    Args:
+        budget (int): the memory budget in bytes.
+    """
+    def __init__(self, budget: int):
+        assert budget > 0
+        self.budget = budget
+        # task token ==> number of bytes in the order of the tasks
+        self.task_nbytes = OrderedDict()
+        self.condition = threading.Condition()
+        self.tokens = count()
+        # the (token, task) pairs yielded by the last accounted operator 
+        # and not consumed by the downstream yet. A skipped task is None.
+        # The task is referenced, so its id could not be reused.
+        self.yielded_tasks = deque()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.task_nbytes.values())
+
+    def _is_oldest(self, key: int) -> bool:
+        return next(iter(self.task_nbytes)) == key
+
+    def _consume(self, upstream: deque, task: dict) -> int:
+        """match a task with the upstream tasks and release the upstream 
+        tasks skipped or dropped. The lock should be held.
+
+        Returns:
+            int: the token of task. None for a skipped task.
+        """
+        if task is None:
+            if len(upstream) > 0:
+                entry = upstream.popleft()
+                if entry is not None:
+                    # the oldest upstream task was skipped
+                    self.task_nbytes.pop(entry[0], None)
+            return None
+
+        if any(entry is not None and entry[1] is task for entry in upstream):
+            while True:
+                token, upstream_task = upstream.popleft() or (None, None)
+                if upstream_task is task:
+                    return token
+                if token is not None:
+                    # the upstream task was dropped
+                    self.task_nbytes.pop(token, None)
+        elif len(upstream) > 0 and upstream[0] is not None:
+            # a copy or a new task replaced the oldest upstream task
+            return upstream.popleft()[0]
+        else:
+            return next(self.tokens)
+
+    def update(self, token: int, task: dict):
+        """measure the task size and block if the budget is exceeded."""
+        if task is None:
+            return
+        with self.condition:
+            self.task_nbytes[token] = task_nbytes(task)
+            # the size of a task could also shrink
+            self.condition.notify_all()
+            self.condition.wait_for(
+                lambda: self._is_oldest(token) or self.nbytes <= self.budget)
+
+    def release(self, task: dict):
+        """release a finished task from the end of the chain.
+        
+        A skipped task is None, and it was already released by the 
+        operator skipping it.
+        """
+        with self.condition:
+            if task is None:
+                if len(self.yielded_tasks) > 0 and self.yielded_tasks[0] is None:
+                    self.yielded_tasks.popleft()
+                return
+            self.task_nbytes.pop(self._consume(self.yielded_tasks, task), None)
+            self.condition.notify_all()
+
+    def account(self, stream: Iterable):
+        """measure every task of an operator output stream.
+
+        The operators should be accounted from upstream to downstream, 
+        so it returns the stream without waiting for the first task.
+        """
+        upstream = self.yielded_tasks
+        yielded = deque()
+        self.yielded_tasks = yielded
+
+        def measure():
+            for task in stream:
+                with self.condition:
+                    token = self._consume(upstream, task)
+                    yielded.append(None if task is None else (token, task))
+                self.update(token, task)
+                yield task
+        return measure()
+
+
+# the message to stop a worker process
+_STOP_WORKER = '__stop_worker__'
+
+
+def _worker_process(operators: list, task_queue, result_queue, pipeline_depth: int,
+        max_memory: int, delete_vars: list, tracer: Tracer):
+    """run the operators in a worker process and report the task logs."""
+    pid = os.getpid()
+    accountant = None if max_memory is None else MemoryAccountant(max_memory)
+    if tracer is not None:
+        # the events forked from the parent process are reported by the parent
+        tracer = Tracer()
+    stream = iter(task_queue.get, _STOP_WORKER)
+    stream = chain_operators(stream, operators, pipeline_depth, 
+        accountant=accountant, delete_vars=delete_vars, tracer=tracer)
+    try:
+        for task in stream:
+            if accountant is not None:
+                accountant.release(task)
+            if task is not None:
+                result_queue.put(('log', pid, task.get('log')))
+    except BaseException:
+        result_queue.put(('error', pid, traceback.format_exc()))
+    finally:
+        if tracer is not None:
+            result_queue.put(('trace', pid, tracer.events))
+        result_queue.put(('done', pid, None))
+
+
+def run_in_worker_processes(stream: Iterable, operators: list, workers: int, 
+        pipeline_depth: int = 0, verbose: bool = False, max_memory: int = None,
+        delete_vars: list = None, tracer: Tracer = None):
+    """Distribute the tasks to a pool of worker processes.
+
+    The worker processes are forked, so the operators do not need to be 
+    pickled and the imported modules are shared with the parent process.
+    Every worker process runs the same chain of operators.
+
+    Args:
+        stream (Iterable): the task stream to distribute.
+        operators (list): the operators to run in every worker.
+        workers (int): the number of worker processes.
+        pipeline_depth (int): the pipeline depth inside every worker.
+        verbose (bool): print the task logs or not.
+        max_memory (int): the total memory budget of all the workers in bytes.
+        delete_vars (list): the task variable names to delete after every operator.
+        tracer (Tracer): collect the trace events of the workers.
+    """
+    context = multiprocessing.get_context('fork')
+    task_queue = context.Queue(maxsize=workers)
+    result_queue = context.Queue()
+    if max_memory is not None:
+        max_memory = max(max_memory // workers, 1)
+    processes = [context.Process(
+        target=_worker_process, 
+        args=(operators, task_queue, result_queue, pipeline_depth, 
+            max_memory, delete_vars, tracer),
+        daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    feed_errors = []
+
+    def feed():
+        try:
+            for task in stream:
+                # skipped tasks do not need to be sent
+                if task is not None:
+                    task_queue.put(task)
+        except BaseException as err:
+            # the error is raised after the workers stop
+            feed_errors.append(err)
+        finally:
+            for _ in processes:
+                task_queue.put(_STOP_WORKER)
+
+    # feed the tasks in a thread, so the logs are reported during feeding
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    task_num = 0
+    finished_pids = set()
+    errors = []
+    while len(finished_pids) < workers:
+        try:
+            kind, pid, content = result_queue.get(timeout=1)
+        except Empty:
+            # a killed worker never reports that it is done
+            for process in processes:
+                if process.pid not in finished_pids and \
+                        not process.is_alive() and process.exitcode != 0:
+                    finished_pids.add(process.pid)
+                    errors.append(f'exit code {process.exitcode}')
+                    print(f'worker {process.pid} died with exit code {process.exitcode}')
+            continue
+
+        if kind == 'log':
+            task_num += 1
+            if verbose:
+                print(f'worker {pid} finished a task with log: {content}')
+        elif kind == 'trace':
+            with tracer.lock:
+                tracer.events.extend(content)
+        elif kind == 'error':
+            errors.append(content)
+            print(f'worker {pid} failed: \n{content}')
+        elif kind == 'done':
+            finished_pids.add(pid)
+
+    for process in processes:
+        process.join()
+    print(f'{workers} workers finished {task_num} tasks.')
+    if feed_errors:
+        raise feed_errors[0]
+    if errors:
+        raise RuntimeError(f'{len(errors)} worker processes failed.')
+
+
+class _StageError(object):
+    """wrap the exception raised in a pipeline stage thread."""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_STREAM_END = object()
+
+
+def prefetch(stream: Iterable, depth: int):
+    """Evaluate a task stream in a background thread.
+
+    The upstream operators keep producing tasks until `depth` tasks 
+    are buffered in a bounded queue, then they block until the 
+    downstream operator consumes one of them.
+
+    Args:
+        stream (Iterable): the task stream of an operator.
+        depth (int): the maximum number of buffered tasks.
+
+    Yields:
+        the tasks in the same order with the input stream.
+    """
+    assert depth > 0
+    queue = Queue(maxsize=depth)
+
+    def produce():
+        try:
+            for task in stream:
+                queue.put(task)
+        except BaseException as err:
+            queue.put(_StageError(err))
+        else:
+            queue.put(_STREAM_END)
 
-    # Evaluate the stream and throw away the items.
-    for _ in stream:
-        pass
+    # daemon thread will not block the exit of main thread 
+    # if the downstream operator stopped early.
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        task = queue.get()
+        if task is _STREAM_END:
+            break
+        elif isinstance(task, _StageError):
+            raise task.error
+        yield task
+    thread.join()
 
 
 def operator(func):
@@ -88,6 +683,15 @@ def operator(func):
     def wrapper(*args, **kwargs):
         def operator(stream):
             return func(stream, *args, **kwargs)
+        # the parameters are used to plan the deletion of task variables
+        # the operator is named by the command typed by users, such as 
+        # copy-var, rather than the function name.
+        ctx = click.get_current_context(silent=True)
+        if ctx is not None and ctx.info_name is not None:
+            operator.name = ctx.info_name
+        else:
+            operator.name = wrapper.__name__.replace('_', '-')
+        operator.kwargs = kwargs
         return operator
 
     return wrapper
@@ -1,6 +1,4 @@
 
-import zarr
-
 import boto3
 from botocore import UNSIGNED
 from botocore.client import Config
@@ -8,6 +6,7 @@ s3 = boto3.client('s3', config=Config(signature_version=UNSIGNED))
 
 from chunkflow.chunk import Chunk
 from chunkflow.lib.cartesian_coordinate import BoundingBox, Cartesian
+from chunkflow.lib.datasets import open_zarr
 
 def execute(bbox: BoundingBox, 
         n5_dir: str = None, 
@@ -21,8 +20,8 @@ def execute(bbox: BoundingBox,
     if isinstance(voxel_size, tuple):
         voxel_size = Cartesian.from_collection(voxel_size)
 
-    fsstore = zarr.N5FSStore(n5_dir, anon=True)
-    img_zarr = zarr.open(fsstore, path=group_path)
+    # the store is only opened once in the process
+    img_zarr = open_zarr(n5_dir, path=group_path, n5=True, anon=True)
     img_arr = img_zarr[bbox.slices]
 
     img_chk = Chunk(img_arr, 
@@ -1,7 +1,7 @@
 import numpy as np
 from chunkflow.chunk import Chunk
 from chunkflow.lib.cartesian_coordinate import BoundingBox, Cartesian
-import tensorstore as ts
+from chunkflow.lib.datasets import open_tensorstore
 
 
 def execute(bbox: BoundingBox, driver: str=None, kvstore: str=None, cache: int=None, 
@@ -13,17 +13,13 @@ def execute(bbox: BoundingBox, driver: str=None, kvstore: str=None, cache: int=N
             'driver': kv_driver,
             'path': path
         }
-    dataset_future = ts.open({
+    # the dataset and the cache pool are shared across tasks, so the
+    # decoded chunks are reused by the adjacent bounding boxes.
+    dataset = open_tensorstore({
         'driver': driver,
         'kvstore': kvstore,
-        'context': {
-            'cache_pool': {
-                'total_bytes_limit': cache,
-            }
-        },
         'recheck_cached_data': 'open',
-    })
-    dataset = dataset_future.result()
+    }, cache_size=cache)
 
     slices = bbox.slices
     arr = dataset[slices[0], slices[1], slices[2]].read().result()
@@ -1,7 +1,11 @@
 from __future__ import annotations
 import os
+import fcntl
+import tempfile
 from typing import Union, List
 from abc import ABC, abstractmethod, abstractproperty
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import cached_property
 from dataclasses import dataclass
 
@@ -9,12 +13,337 @@ import numpy as np
 from tqdm import tqdm
 
 from cloudvolume import CloudVolume
+from cloudvolume.exceptions import OutOfBoundsError, AlignmentError
 from chunkflow.lib.utils import str_to_dict
+from chunkflow.lib.cache import BlockCache, _default_num_threads, \
+    _volume_bounding_box, _block_grid, _relative_slices
+from chunkflow.lib.datasets import open_zarr
 from .lib.cartesian_coordinate import \
     BoundingBox, Cartesian, BoundingBoxes, PhysicalBoudingBox
 from .chunk import Chunk
 
 
+def _block_aligned_slabs(volume_bbox: BoundingBox, block_size: Cartesian,
+        region: BoundingBox, num: int) -> list:
+    """split a region into at most num slabs along the block boundaries.
+
+    The region is split along the axis with the most blocks, so every slab
+    is one request touching its own storage blocks.
+    """
+    grid_offset = volume_bbox.start
+    grid_start = (region.start - grid_offset) // block_size
+    grid_stop = (region.stop - grid_offset - 1) // block_size + 1
+    block_nums = grid_stop - grid_start
+    axis = int(np.argmax(block_nums))
+    num = max(min(num, block_nums[axis]), 1)
+
+    slabs = []
+    for blocks in np.array_split(np.arange(block_nums[axis]), num):
+        start = list(region.start)
+        stop = list(region.stop)
+        start[axis] = max(start[axis], grid_offset[axis] +
+            (grid_start[axis] + blocks[0]) * block_size[axis])
+        stop[axis] = min(stop[axis], grid_offset[axis] +
+            (grid_start[axis] + blocks[-1] + 1) * block_size[axis])
+        slabs.append(BoundingBox(Cartesian.from_collection(start),
+            Cartesian.from_collection(stop)))
+    return slabs
+
+
+def _map_in_threads(func: callable, items: list, num_threads: int = None):
+    if num_threads is None:
+        num_threads = _default_num_threads()
+    if len(items) <= 1 or num_threads == 1:
+        for item in items:
+            func(item)
+    else:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            # consume the results to raise the errors in threads
+            list(executor.map(func, items))
+
+
+def _is_empty(bbox: BoundingBox) -> bool:
+    return np.any(np.asarray(bbox.shape) <= 0)
+
+
+def parallel_cutout(vol: CloudVolume, bbox: BoundingBox,
+        num_threads: int = None) -> np.ndarray:
+    """cutout a region with block aligned sub-requests in parallel.
+
+    The region is split into at most one slab per thread along the storage
+    block boundaries, and the slabs are fetched and decoded in a thread
+    pool. Every slab is written to a preallocated C order array directly,
+    so there is no extra copy of the whole array to transpose the Fortran
+    order cutout of CloudVolume. If the volume already downloads in
+    multiple processes, the region is fetched in one request.
+
+    Args:
+        vol (CloudVolume): the volume at the mip level of cutout.
+        bbox (BoundingBox): the region in z,y,x order.
+        num_threads (int): the number of threads. default is the number
+            of available cores.
+
+    Returns:
+        np.ndarray: the C order array with channel, z, y, x dimensions.
+            The region outside of an unbounded volume is filled with zero.
+    """
+    volume_bbox = _volume_bounding_box(vol)
+    region = bbox.intersection(volume_bbox)
+    if vol.bounded and region != bbox:
+        raise OutOfBoundsError(
+            f'requested bounding box {bbox} is out of volume bounds {volume_bbox}')
+
+    array = np.zeros((vol.num_channels, *bbox.shape), dtype=vol.dtype)
+    if _is_empty(region):
+        return array
+
+    def _fetch(sub_bbox: BoundingBox):
+        block = np.asarray(vol[sub_bbox.slices[::-1]])
+        # the transpose is a view, the only copy is the assignment
+        array[_relative_slices(sub_bbox, bbox.start)] = block.T
+
+    if num_threads is None:
+        num_threads = _default_num_threads()
+    if vol.parallel != 1:
+        # do not nest the threads inside of the processes of CloudVolume
+        num_threads = 1
+    slabs = _block_aligned_slabs(volume_bbox,
+        Cartesian.from_collection(vol.chunk_size[::-1]), region, num_threads)
+    _map_in_threads(_fetch, slabs, num_threads=num_threads)
+    return array
+
+
+def _aligned_interior(volume_bbox: BoundingBox, block_size: Cartesian,
+        region: BoundingBox) -> BoundingBox:
+    """the largest region of the storage blocks fully covered by a region.
+    The blocks in the volume border are cropped by the volume bounds."""
+    grid_offset = volume_bbox.start
+    start = grid_offset + (region.start - grid_offset - 1) // block_size * \
+        block_size + block_size
+    stop = grid_offset + (region.stop - grid_offset) // block_size * block_size
+    stop = Cartesian.from_collection(np.where(
+        np.asarray(region.stop) == np.asarray(volume_bbox.stop),
+        volume_bbox.stop, stop))
+    return BoundingBox(start, stop)
+
+
+def _shell(region: BoundingBox, interior: BoundingBox) -> list:
+    """the nonempty boxes of a region excluding its interior."""
+    if _is_empty(interior):
+        return [region]
+    boxes = []
+    start = list(region.start)
+    stop = list(region.stop)
+    for axis in range(3):
+        for low, high in ((start[axis], interior.start[axis]),
+                (interior.stop[axis], stop[axis])):
+            box_start = list(start)
+            box_stop = list(stop)
+            box_start[axis] = low
+            box_stop[axis] = high
+            box = BoundingBox(Cartesian.from_collection(box_start),
+                Cartesian.from_collection(box_stop))
+            if not _is_empty(box):
+                boxes.append(box)
+        # the remaining boxes are inside of the interior along this axis
+        start[axis] = interior.start[axis]
+        stop[axis] = interior.stop[axis]
+    return boxes
+
+
+class AlignedSaver(object):
+    """save chunks by storage blocks.
+
+    The blocks fully covered by a chunk are uploaded in block aligned slabs
+    in parallel. The partial blocks in the chunk edges are written to a
+    local staging directory, and are merged and uploaded by the task
+    completing the block, so neighboring tasks do not read-modify-write the
+    same blocks in storage. The remaining partial blocks are merged with
+    the existing data in storage by flush. The staged blocks are locked
+    while staging and merging, so the processes sharing a staging directory
+    could flush concurrently.
+    """
+    def __init__(self, vol: CloudVolume, staging_dir: str = None,
+            num_threads: int = None):
+        """
+        Args:
+            vol (CloudVolume): the volume at the mip level to save.
+            staging_dir (str): the local directory to stage partial blocks.
+                It should be shared by the tasks writing to the same volume.
+                default is None, the partial blocks are written to storage
+                directly.
+            num_threads (int): the number of threads to upload blocks.
+                default is the number of available cores.
+        """
+        self.vol = vol
+        if staging_dir is not None:
+            staging_dir = os.path.join(
+                os.path.expanduser(staging_dir), f'mip{vol.mip}')
+            os.makedirs(staging_dir, exist_ok=True)
+        self.staging_dir = staging_dir
+        if num_threads is None:
+            num_threads = _default_num_threads()
+        self.num_threads = num_threads
+
+    def _upload(self, array: np.ndarray, offset: Cartesian, bbox: BoundingBox):
+        # transpose czyx to xyzc order
+        self.vol[bbox.slices[::-1]] = array[_relative_slices(bbox, offset)].T
+
+    def save(self, array: np.ndarray, bbox: BoundingBox):
+        """
+        Args:
+            array (np.ndarray): the C order array with z,y,x or c,z,y,x
+                dimensions.
+            bbox (BoundingBox): the region of array in z,y,x order. The
+                region outside of the volume is ignored.
+        """
+        if array.ndim == 3:
+            array = array[np.newaxis, ...]
+        volume_bbox = _volume_bounding_box(self.vol)
+        block_size = Cartesian.from_collection(self.vol.chunk_size[::-1])
+        region = bbox.intersection(volume_bbox)
+        if _is_empty(region):
+            return
+
+        interior = _aligned_interior(volume_bbox, block_size, region)
+        edges = _shell(region, interior)
+        if self.staging_dir is None and len(edges) > 0 and \
+                not self.vol.non_aligned_writes:
+            # fail before writing anything
+            raise AlignmentError(
+                f'{region} is not aligned with the storage blocks {block_size}. ' +
+                'use a staging directory or non_aligned_writes=True.')
+
+        if not _is_empty(interior):
+            num_threads = self.num_threads
+            if self.vol.parallel != 1:
+                # do not nest the threads inside of the processes of CloudVolume
+                num_threads = 1
+            slabs = _block_aligned_slabs(volume_bbox, block_size, interior,
+                num_threads)
+            _map_in_threads(lambda slab: self._upload(array, bbox.start, slab),
+                slabs, num_threads=num_threads)
+
+        for edge in edges:
+            if self.staging_dir is None:
+                self._upload(array, bbox.start, edge)
+                continue
+            for idx, block_bbox in _block_grid(volume_bbox, block_size, edge):
+                piece_bbox = block_bbox.intersection(edge)
+                self._stage(idx, block_bbox, piece_bbox,
+                    array[_relative_slices(piece_bbox, bbox.start)])
+
+    def _block_dir(self, idx: tuple) -> str:
+        return os.path.join(self.staging_dir, '_'.join(str(i) for i in idx))
+
+    @contextmanager
+    def _lock(self, block_dir: str):
+        """lock a staged block across processes.
+
+        The lock file is removed with the block, so the lock is acquired
+        again if the locked file was removed while waiting.
+        """
+        lock_path = block_dir + '.lock'
+        while True:
+            file = open(lock_path, 'a')
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            file.close()
+        try:
+            yield
+        finally:
+            # closing the file releases the lock
+            file.close()
+
+    def _remove_block_dir(self, block_dir: str):
+        """remove a staged block and its lock file.
+        The block should be locked."""
+        if os.path.isdir(block_dir):
+            os.rmdir(block_dir)
+        os.remove(block_dir + '.lock')
+
+    def _stage(self, idx: tuple, block_bbox: BoundingBox,
+            piece_bbox: BoundingBox, piece: np.ndarray):
+        block_dir = self._block_dir(idx)
+        with self._lock(block_dir):
+            os.makedirs(block_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=block_dir)
+            with os.fdopen(fd, 'wb') as file:
+                np.save(file, piece)
+            os.replace(temp_path, os.path.join(block_dir,
+                '_'.join(str(s) for s in piece_bbox.start) + '.npy'))
+
+            pieces = self._staged_pieces(block_dir)
+            covered = np.zeros(block_bbox.shape, dtype=bool)
+            for piece_bbox, _ in pieces:
+                covered[_relative_slices(piece_bbox, block_bbox.start)[1:]] = True
+            if np.all(covered):
+                self._merge(block_dir, block_bbox, pieces)
+
+    def _staged_pieces(self, block_dir: str) -> list:
+        pieces = []
+        for entry in os.scandir(block_dir):
+            if not entry.name.endswith('.npy'):
+                continue
+            # only read the header to get the shape
+            shape = np.load(entry.path, mmap_mode='r').shape
+            start = Cartesian.from_collection(
+                [int(s) for s in entry.name[:-4].split('_')])
+            pieces.append((BoundingBox.from_delta(start, shape[-3:]),
+                entry.path))
+        return pieces
+
+    def _merge(self, block_dir: str, block_bbox: BoundingBox,
+            pieces: list, complete: bool = True):
+        """merge the staged pieces of a block and upload it.
+        The block should be locked."""
+        if complete:
+            block = np.zeros((self.vol.num_channels, *block_bbox.shape),
+                dtype=self.vol.dtype)
+        else:
+            block = np.ascontiguousarray(np.asarray(
+                self.vol[block_bbox.slices[::-1]]).T)
+
+        for piece_bbox, path in pieces:
+            block[_relative_slices(piece_bbox, block_bbox.start)] = \
+                np.load(path)
+        self._upload(block, block_bbox.start, block_bbox)
+
+        for _, path in pieces:
+            os.remove(path)
+        self._remove_block_dir(block_dir)
+
+    def flush(self):
+        """merge all the staged partial blocks with the existing data
+        in storage and upload them."""
+        if self.staging_dir is None:
+            return
+        volume_bbox = _volume_bounding_box(self.vol)
+        block_size = Cartesian.from_collection(self.vol.chunk_size[::-1])
+        for entry in os.scandir(self.staging_dir):
+            if not entry.is_dir():
+                continue
+            idx = Cartesian.from_collection(
+                [int(i) for i in entry.name.split('_')])
+            block_start = volume_bbox.start + idx * block_size
+            block_bbox = BoundingBox(block_start,
+                Cartesian.from_collection(np.minimum(
+                    block_start + block_size, volume_bbox.stop)))
+            with self._lock(entry.path):
+                pieces = []
+                if os.path.isdir(entry.path):
+                    pieces = self._staged_pieces(entry.path)
+                if len(pieces) > 0:
+                    self._merge(entry.path, block_bbox, pieces, complete=False)
+                else:
+                    # empty or merged by another process
+                    self._remove_block_dir(entry.path)
+
+
 @dataclass(frozen=True)
 class AbstractVolume(ABC):
 
@@ -45,14 +374,26 @@ class PrecomputedVolume(AbstractVolume):
 
     Args:
         CloudVolume (class): the cloud-volume class
+        block_cache (BlockCache): cache the downloaded blocks for cutout.
+        num_threads (int): the number of threads to fetch the blocks.
+            default is the number of available cores.
+        staging_dir (str): the local directory to stage the partial blocks
+            in save. call flush to upload the remaining staged blocks.
+            See AlignedSaver for details.
     """
     vol: CloudVolume
     filters: List[str]
+    block_cache: BlockCache = None
+    num_threads: int = None
+    staging_dir: str = None
     
     @classmethod
     def from_cloudvolume_path(cls, path: str, *arg, 
             fill_missing: bool=True, 
             filters: List[str] = None,
+            block_cache: BlockCache = None,
+            num_threads: int = None,
+            staging_dir: str = None,
             **kwargs) -> PrecomputedVolume:
         """load from a cloud volume path
         This path could be encoded with keywords.
@@ -68,7 +409,8 @@ class PrecomputedVolume(AbstractVolume):
             filters = filters.split(',')
 
         vol = CloudVolume(path, *arg, fill_missing=fill_missing, **kwargs)
-        return cls(vol, filters)
+        return cls(vol, filters, block_cache=block_cache,
+            num_threads=num_threads, staging_dir=staging_dir)
 
     @classmethod
     def from_numpy(cls, arr: np.ndarray, vol_path: str) -> PrecomputedVolume:
@@ -138,18 +480,18 @@ class PrecomputedVolume(AbstractVolume):
         return self.vol.shape[::-1]
 
     def cutout(self, key: Union[BoundingBox, list]):
-        if isinstance(key, BoundingBox):
-            arr = self.vol[ key.slices[::-1] ]
-            voxel_offset = key.start
-        elif isinstance(key, list):
-            arr = self.vol[key[::-1]]
-            voxel_offset = Cartesian(key[0].start, key[1].start, key[2].start)
-        else:
+        if isinstance(key, list):
+            key = BoundingBox.from_slices(tuple(key))
+        elif not isinstance(key, BoundingBox):
             raise ValueError('we only support BoundingBox or a list of slices')
+        voxel_offset = key.start
 
-        # transpose
-        arr = np.transpose(arr)
-        arr = np.asarray(arr)
+        if self.block_cache is not None:
+            # the blocks are assembled in C order
+            arr = self.block_cache.cutout(
+                self.vol, key, num_threads=self.num_threads)
+        else:
+            arr = parallel_cutout(self.vol, key, num_threads=self.num_threads)
         if arr.ndim == 4 and arr.shape[0] == 1:
             arr = np.squeeze(arr, axis=0)
         chunk = Chunk(arr, voxel_offset=voxel_offset, voxel_size=self.voxel_size) 
@@ -184,12 +526,19 @@ class PrecomputedVolume(AbstractVolume):
         else:
             return chunk
 
+    @cached_property
+    def saver(self) -> AlignedSaver:
+        return AlignedSaver(self.vol, staging_dir=self.staging_dir,
+            num_threads=self.num_threads)
+
     def save(self, chunk: Chunk):
+        """save the chunk by storage blocks."""
         chunk = self._auto_convert_dtype(chunk)
-        
-        # transpose czyx to xyzc order
-        arr = np.transpose(chunk.array)
-        self.vol[chunk.slices[::-1]] = arr
+        self.saver.save(chunk.array, chunk.bbox)
+
+    def flush(self):
+        """upload the staged partial blocks."""
+        self.saver.flush()
 
     def has_all_blocks(self, bbox: BoundingBox) -> bool:
         """the volume has all the blocks inside a bounding box or not
@@ -210,7 +559,226 @@ class PrecomputedVolume(AbstractVolume):
 
 
 
-# class ZarrVolume(AbstractVolume):
+def _split_store_path(path: str, suffix: str) -> tuple:
+    """split the path to the store path ending with suffix and the
+    array path inside of the store."""
+    path = path.rstrip('/')
+    idx = path.find(suffix + '/')
+    if idx < 0:
+        return path, None
+    idx += len(suffix)
+    return path[:idx], path[idx+1:]
+
+
+@dataclass(frozen=True)
+class ZarrVolume(AbstractVolume):
+    """Zarr array with z,y,x or c,z,y,x dimensions.
+
+    The chunks are read and written in parallel, and every thread only
+    touches its own storage blocks.
+
+    Args:
+        array (zarr.Array): the Zarr array.
+        voxel_offset (Cartesian): the global coordinate of the first voxel.
+        voxel_size (Cartesian): the physical size of voxel.
+        num_threads (int): the number of threads to read and write blocks.
+            default is the number of available cores.
+    """
+    array: object
+    voxel_offset: Cartesian = Cartesian(0, 0, 0)
+    voxel_size: Cartesian = Cartesian(1, 1, 1)
+    num_threads: int = None
+
+    _n5 = False
+    _suffix = '.zarr'
+
+    @classmethod
+    def from_path(cls, path: str, mode: str = 'r',
+            voxel_offset: tuple = None, voxel_size: tuple = None,
+            num_threads: int = None):
+        """open an existing array.
+
+        Args:
+            path (str): the store path followed by the array path inside of
+                the store, such as /data/volume.zarr/raw
+            mode (str): 'r' for read only, 'r+' for read and write.
+            voxel_offset (tuple): default is read from the attributes of
+                voxel_offset or offset.
+            voxel_size (tuple): default is read from the attributes of
+                voxel_size or resolution.
+        """
+        store_path, array_path = _split_store_path(path, cls._suffix)
+        # the store handle is reused across tasks
+        array = open_zarr(store_path, path=array_path, mode=mode, n5=cls._n5)
+        attrs = array.attrs.asdict()
+
+        if voxel_size is None:
+            if 'voxel_size' in attrs:
+                voxel_size = attrs['voxel_size']
+            elif 'resolution' in attrs:
+                voxel_size = attrs['resolution']
+            else:
+                voxel_size = (1, 1, 1)
+        voxel_size = Cartesian.from_collection(voxel_size)
+
+        if voxel_offset is None:
+            if 'voxel_offset' in attrs:
+                voxel_offset = attrs['voxel_offset']
+            elif 'offset' in attrs:
+                # this is the physical offset
+                voxel_offset = Cartesian.from_collection(
+                    attrs['offset']) // voxel_size
+            else:
+                voxel_offset = (0, 0, 0)
+        voxel_offset = Cartesian.from_collection(voxel_offset)
+
+        return cls(array, voxel_offset=voxel_offset, voxel_size=voxel_size,
+            num_threads=num_threads)
+
+    @classmethod
+    def from_numpy(cls, arr: np.ndarray, path: str,
+            chunks: tuple = None, voxel_offset: tuple = (0, 0, 0),
+            voxel_size: tuple = (1, 1, 1)):
+        """create an array with the voxel offset and voxel size attributes.
+
+        Args:
+            arr (np.ndarray): the array with z,y,x or c,z,y,x dimensions.
+            path (str): the store path followed by the array path.
+            chunks (tuple): the storage block size.
+        """
+        import zarr
+        store_path, array_path = _split_store_path(path, cls._suffix)
+        store = zarr.N5Store(store_path) if cls._n5 else store_path
+        array = zarr.open(store, mode='w', path=array_path, shape=arr.shape,
+            chunks=chunks, dtype=arr.dtype)
+        array[...] = arr
+        array.attrs['voxel_offset'] = tuple(int(o) for o in voxel_offset)
+        array.attrs['voxel_size'] = tuple(voxel_size)
+        return cls(array,
+            voxel_offset=Cartesian.from_collection(voxel_offset),
+            voxel_size=Cartesian.from_collection(voxel_size))
+
+    @cached_property
+    def bounding_box(self) -> BoundingBox:
+        return BoundingBox.from_delta(self.voxel_offset, self.array.shape[-3:])
+
+    @cached_property
+    def bbox(self):
+        return self.bounding_box
+
+    @cached_property
+    def start(self) -> Cartesian:
+        return self.bounding_box.start
+
+    @cached_property
+    def stop(self) -> Cartesian:
+        return self.bounding_box.stop
+
+    @cached_property
+    def shape(self):
+        return self.array.shape
+
+    @cached_property
+    def dtype(self):
+        return self.array.dtype
+
+    @cached_property
+    def block_size(self) -> Cartesian:
+        return Cartesian.from_collection(self.array.chunks[-3:])
+
+    @cached_property
+    def physical_bounding_box(self) -> PhysicalBoudingBox:
+        return PhysicalBoudingBox(
+            self.start, self.stop, self.voxel_size)
+
+    @cached_property
+    def block_bounding_boxes(self) -> BoundingBoxes:
+        return self.bounding_box.decompose(self.block_size)
+
+    def _array_slices(self, bbox: BoundingBox) -> tuple:
+        slices = _relative_slices(bbox, self.voxel_offset)
+        if self.array.ndim == 3:
+            slices = slices[1:]
+        return slices
+
+    def cutout(self, key: Union[BoundingBox, list]) -> Chunk:
+        if isinstance(key, list):
+            key = BoundingBox.from_slices(tuple(key))
+        elif not isinstance(key, BoundingBox):
+            raise ValueError('we only support BoundingBox or a list of slices')
+
+        arr = np.zeros(self.shape[:-3] + tuple(key.shape), dtype=self.dtype)
+        region = key.intersection(self.bounding_box)
+        if not _is_empty(region):
+            def _read(sub_bbox: BoundingBox):
+                slices = _relative_slices(sub_bbox, key.start)
+                if arr.ndim == 3:
+                    slices = slices[1:]
+                arr[slices] = self.array[self._array_slices(sub_bbox)]
+
+            num_threads = self.num_threads or _default_num_threads()
+            slabs = _block_aligned_slabs(self.bounding_box, self.block_size,
+                region, num_threads)
+            _map_in_threads(_read, slabs, num_threads=num_threads)
+
+        return Chunk(arr, voxel_offset=key.start, voxel_size=self.voxel_size)
+
+    def save(self, chunk: Chunk):
+        """save the chunk by storage blocks in parallel.
+        The region outside of the volume is ignored."""
+        region = chunk.bbox.intersection(self.bounding_box)
+        if _is_empty(region):
+            return
+
+        arr = chunk.array.astype(self.dtype, copy=False)
+        if arr.ndim == 3 and self.array.ndim == 4:
+            arr = arr[np.newaxis, ...]
+
+        def _write(sub_bbox: BoundingBox):
+            slices = _relative_slices(sub_bbox, chunk.voxel_offset)
+            if arr.ndim == 3:
+                slices = slices[1:]
+            self.array[self._array_slices(sub_bbox)] = arr[slices]
+
+        # every slab writes its own storage blocks
+        num_threads = self.num_threads or _default_num_threads()
+        slabs = _block_aligned_slabs(self.bounding_box, self.block_size,
+            region, num_threads)
+        _map_in_threads(_write, slabs, num_threads=num_threads)
+
+    def has_all_blocks(self, bbox: BoundingBox) -> bool:
+        """the volume has all the blocks inside a bounding box or not
+
+        Args:
+            bbox (BoundingBox): region of interest
+
+        Returns:
+            result (bool): result
+        """
+        bbox = bbox.intersection(self.bounding_box)
+        channel_block_num = -(-self.shape[0] // self.array.chunks[0])
+        for idx, _ in _block_grid(self.bounding_box, self.block_size, bbox):
+            if self.array.ndim == 3:
+                chunk_keys = [self.array._chunk_key(idx)]
+            else:
+                chunk_keys = [self.array._chunk_key((c, *idx))
+                    for c in range(channel_block_num)]
+            for chunk_key in chunk_keys:
+                if chunk_key not in self.array.chunk_store:
+                    return False
+        return True
+
+
+@dataclass(frozen=True)
+class N5Volume(ZarrVolume):
+    """N5 dataset with z,y,x or c,z,y,x dimensions.
+
+    The N5 store reverses the dimensions, so the attributes of voxel offset
+    and voxel size are in z,y,x order in the same way with Zarr.
+    """
+    _n5 = True
+    _suffix = '.n5'
+
 
 # class SynapseVolume:
 
@@ -234,6 +802,10 @@ def load_chunk_or_volume(file_path: str, *arg, **kwargs):
     elif file_path.endswith('.npy'):
         arr = np.loads(file_path)
         return Chunk(array=arr)
+    elif '.n5' in file_path:
+        return N5Volume.from_path(file_path, *arg, **kwargs)
+    elif '.zarr' in file_path:
+        return ZarrVolume.from_path(file_path, *arg, **kwargs)
     elif 'file://' in file_path:
         # Neuroglancer Precomputed images
         if '#' in file_path:
@@ -261,7 +833,7 @@ def load_chunk_or_volume(file_path: str, *arg, **kwargs):
             chunk.voxel_size = vol.voxel_size
             return chunk
     else:
-        raise ValueError(f'only .h5 and .npy files are supported, but got {file_path}')
+        raise ValueError(f'only .h5, .npy, .zarr and .n5 files are supported, but got {file_path}')
     
 
 def get_candidate_block_bounding_boxes_with_different_voxel_size(
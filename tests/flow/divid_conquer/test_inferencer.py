@@ -1,3 +1,5 @@
+import json
+
 import pytest
 import numpy as np
 from chunkflow.flow.divid_conquer.inferencer import Inferencer
@@ -167,3 +169,396 @@ def test_non_aligned_input_chunk():
 
     # some of the image voxel is 0, the test can only work with rtol=1
     np.testing.assert_allclose(image, output, rtol=1e-5, atol=1e-5)
+
+
+def test_gather_input_patches():
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    input_size = (20, 150, 170)
+    for num_input_channels, dtype in ((1, np.uint8), (2, np.float32)):
+        shape = input_size if num_input_channels == 1 else \
+            (num_input_channels, *input_size)
+        image = Chunk(np.random.rand(*shape) * 255, 
+            voxel_offset=(3, 5, 7)).astype(dtype)
+        inferencer = Inferencer(None, None, patch_size,
+            output_patch_overlap=patch_overlap,
+            num_input_channels=num_input_channels,
+            num_output_channels=1,
+            framework='identity',
+            batch_size=3)
+        inferencer._update_parameters_for_input_chunk(image)
+        normalizer = 255 if dtype == np.uint8 else None
+        input_windows = np.lib.stride_tricks.sliding_window_view(
+            image.array, patch_size, axis=(-3, -2, -1))
+
+        for i in range(0, len(inferencer.patch_slices_list), 3):
+            buffer = inferencer._gather_input_patches(input_windows,
+                inferencer.input_patch_starts[i:i+3], normalizer)
+            for batch_idx, slices in enumerate(
+                    inferencer.patch_slices_list[i:i+3]):
+                patch = image.cutout(slices[0]).array.astype(np.float32)
+                if normalizer is not None:
+                    patch /= normalizer
+                np.testing.assert_array_equal(
+                    buffer[batch_idx, ...], 
+                    patch.reshape(buffer.shape[1:]))
+
+
+def test_blend_output_patches():
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    input_size = (20, 150, 170)
+    image = Chunk.create(size=input_size, dtype=np.float32, 
+        voxel_offset=(3, 5, 7))
+    inferencer = Inferencer(None, None, patch_size,
+        output_patch_overlap=patch_overlap,
+        output_crop_margin=(2, 20, 20),
+        num_output_channels=2,
+        framework='identity',
+        batch_size=2)
+    inferencer._update_parameters_for_input_chunk(image)
+    output_buffer = inferencer._get_output_buffer(image)
+    expected = output_buffer.clone()
+
+    patch_num = len(inferencer.patch_slices_list)
+    output_patches = np.random.rand(patch_num, 3, *patch_size).astype(np.float32)
+    for i in range(0, patch_num, 2):
+        inferencer._blend_output_patches(output_buffer.array, 
+            output_patches[i:i+2], range(i, min(i+2, patch_num)))
+    for output_patch, (_, output_patch_slice) in zip(
+            output_patches, inferencer.patch_slices_list):
+        patch = Chunk(output_patch[:2], 
+            voxel_offset=tuple(s.start for s in output_patch_slice))
+        expected.blend(patch)
+    np.testing.assert_allclose(output_buffer.array, expected.array, rtol=1e-6)
+
+
+def test_num_patch_buffers():
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    image = Chunk.create(size=(20, 150, 170), dtype=np.uint8, 
+        pattern='random', voxel_offset=(3, 5, 7))
+    outputs = []
+    for num_patch_buffers in (1, 3):
+        with Inferencer(None, None, patch_size,
+                output_patch_overlap=patch_overlap,
+                num_output_channels=2,
+                framework='identity',
+                batch_size=2,
+                augment=True,
+                num_patch_buffers=num_patch_buffers) as inferencer:
+            outputs.append(inferencer(image))
+            # 3x3x4 patches in 18 batches
+            assert len(inferencer.batch_latencies) == 18
+    np.testing.assert_array_equal(outputs[0].array, outputs[1].array)
+
+
+def test_memmap_output_buffer(tmp_path):
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    image = Chunk.create(size=(20, 150, 170), dtype=np.uint8, 
+        pattern='random', voxel_offset=(3, 5, 7))
+    outputs = []
+    for output_buffer in ('ram', 'memmap'):
+        with Inferencer(None, None, patch_size,
+                output_patch_overlap=patch_overlap,
+                num_output_channels=2,
+                framework='identity',
+                output_buffer=output_buffer,
+                scratch_dir=str(tmp_path)) as inferencer:
+            outputs.append(inferencer(image))
+    assert isinstance(outputs[1].array, np.memmap)
+    np.testing.assert_array_equal(outputs[0].array, outputs[1].array)
+    # the temporary file is anonymous
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_skip_empty_patches():
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    # 3x3x3 patches
+    input_size = (20, 160, 160)
+    array = np.random.randint(1, 255, size=input_size, dtype=np.uint8)
+    # the first layer of patches is blank
+    array[:8, ...] = 0
+    image = Chunk(array, voxel_offset=(0, 0, 0), voxel_size=(1, 1, 1))
+    # the mask covers the last column of patches in x axis
+    mask = Chunk(np.zeros((20, 40, 40), dtype=bool), 
+        voxel_offset=(0, 0, 0), voxel_size=(1, 4, 4))
+    mask.array[:, :, 30:] = True
+
+    # the empty patches are computed by default
+    with Inferencer(None, None, patch_size,
+            output_patch_overlap=patch_overlap,
+            num_output_channels=1,
+            framework='identity',
+            batch_size=2) as inferencer:
+        inferencer(image)
+        assert inferencer.skipped_patch_num == 0
+
+    with Inferencer(None, None, patch_size,
+            output_patch_overlap=patch_overlap,
+            num_output_channels=1,
+            framework='identity',
+            batch_size=2,
+            skip_empty_patches=True) as inferencer:
+        output = inferencer(image)
+        assert inferencer.skipped_patch_num == 9
+        np.testing.assert_array_equal(output.array[:, :2, ...], 0)
+        np.testing.assert_allclose(output.array[0, 8:, ...], 
+            array[8:, ...] / 255, rtol=1e-5, atol=1e-5)
+
+        output = inferencer(image, mask=mask)
+        # only 2x3x1 patches are computed
+        assert inferencer.skipped_patch_num == 21
+        np.testing.assert_array_equal(output.array[:, 8:, :, :96], 0)
+        np.testing.assert_allclose(output.array[0, 8:, :, 112:], 
+            array[8:, :, 112:] / 255, rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize('num_patch_buffers', [1, 2])
+def test_onnxruntime(tmp_path, num_patch_buffers):
+    onnx = pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx import helper, TensorProto
+
+    # the model repeats the input as 3 output channels
+    graph = helper.make_graph(
+        [helper.make_node('Concat', ['input', 'input', 'input'], ['output'], axis=1)],
+        'repeat',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, 
+            ['batch', 1, 8, 64, 64])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, 
+            ['batch', 3, 8, 64, 64])])
+    model = helper.make_model(graph, ir_version=8,
+        opset_imports=[helper.make_opsetid('', 13)])
+    model_path = str(tmp_path / 'model.onnx')
+    onnx.save(model, model_path)
+
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    image = Chunk.create(size=(20, 160, 160), dtype='uint8')
+    outputs = []
+    for framework, convnet_model, framework_args in (
+            ('identity', None, None), 
+            ('onnxruntime', model_path, {'intra_op_num_threads': 2})):
+        with Inferencer(convnet_model, None, patch_size,
+                output_patch_overlap=patch_overlap,
+                num_output_channels=3,
+                framework=framework,
+                framework_args=framework_args,
+                batch_size=2,
+                num_patch_buffers=num_patch_buffers) as inferencer:
+            outputs.append(inferencer(image))
+    np.testing.assert_allclose(outputs[0].array, outputs[1].array, rtol=1e-5)
+
+
+def test_patch_cache(tmp_path):
+    patch_size = (8, 64, 64)
+    patch_overlap = (2, 16, 16)
+    array = np.random.randint(1, 255, size=(20, 160, 256), dtype=np.uint8)
+    # two chunks overlapping with one column of patches in x axis
+    chunks = [Chunk(array[..., :160], voxel_offset=(0, 0, 0)),
+        Chunk(array[..., 96:], voxel_offset=(0, 0, 96))]
+    
+    outputs = []
+    for patch_cache_dir in (None, str(tmp_path)):
+        with Inferencer(None, None, patch_size,
+                output_patch_overlap=patch_overlap,
+                num_output_channels=3,
+                framework='identity',
+                batch_size=2,
+                patch_cache_dir=patch_cache_dir) as inferencer:
+            for chunk in chunks:
+                outputs.append(inferencer(chunk))
+            if patch_cache_dir is not None:
+                assert inferencer.cached_patch_num == 9
+    
+    # the cached patches are blended first, so the float summation order differs
+    for output, cached_output in zip(outputs[:2], outputs[2:]):
+        np.testing.assert_allclose(output.array, cached_output.array, rtol=1e-6)
+
+
+def test_auto_batch_size(tmp_path, monkeypatch):
+    monkeypatch.setenv('CHUNKFLOW_CACHE_DIR', str(tmp_path))
+    patch_size = (8, 64, 64)
+    image = Chunk.create(size=(20, 160, 160), dtype='uint8')
+    outputs = []
+    for batch_size in (1, 'auto', 'auto'):
+        with Inferencer(None, None, patch_size,
+                output_patch_overlap=(2, 16, 16),
+                num_output_channels=3,
+                framework='identity',
+                batch_size=batch_size,
+                batch_memory_limit=8 * 1024**2) as inferencer:
+            outputs.append(inferencer(image))
+            batch_size = inferencer.batch_size
+            assert inferencer.input_patch_buffer.shape[0] == batch_size
+    np.testing.assert_allclose(outputs[0].array, outputs[1].array, rtol=1e-6)
+
+    # the calibration is cached
+    cache_files = list((tmp_path / 'batch_size').iterdir())
+    assert len(cache_files) == 1
+    with open(cache_files[0]) as file:
+        calibration = json.load(file)
+    assert calibration['batch_size'] == batch_size
+    assert str(batch_size) in calibration['throughput']
+    # the patch buffers of batch size 16 exceed the memory limit
+    assert max(int(bs) for bs in calibration['throughput']) <= 8
+
+
+def test_augment_batch(tmp_path, monkeypatch):
+    monkeypatch.setenv('CHUNKFLOW_CACHE_DIR', str(tmp_path))
+    patch_size = (8, 64, 64)
+    image = Chunk.create(size=(20, 160, 160), dtype='uint8')
+    outputs = []
+    for stack_transforms in (True, False):
+        with Inferencer(None, None, patch_size,
+                output_patch_overlap=(2, 16, 16),
+                num_output_channels=3,
+                framework='identity',
+                augment=True,
+                batch_size=1) as inferencer:
+            inferencer.stack_transforms = stack_transforms
+            patch_inferencer_class = type(inferencer.patch_inferencer)
+            call = patch_inferencer_class.__call__
+            batch_sizes = set()
+
+            def record(self, input_patch):
+                batch_sizes.add(input_patch.shape[0])
+                return call(self, input_patch)
+            with monkeypatch.context() as context:
+                context.setattr(patch_inferencer_class, '__call__', record)
+                outputs.append(inferencer(image))
+        # the transformed patches are stacked or computed one by one
+        assert batch_sizes == ({8} if stack_transforms else {1})
+    np.testing.assert_allclose(outputs[0].array, outputs[1].array, rtol=1e-6)
+
+    # the stacked batch of the convnet is in the range of candidates
+    with Inferencer(None, None, patch_size,
+            output_patch_overlap=(2, 16, 16),
+            num_output_channels=3,
+            framework='identity',
+            augment=True,
+            batch_size='auto') as inferencer:
+        assert inferencer.batch_size <= 8
+
+
+def test_multiple_models():
+    patch_size = (8, 64, 64)
+    image = Chunk.create(size=(20, 160, 160), dtype='uint8')
+    with Inferencer(None, None, patch_size,
+            output_patch_overlap=(2, 16, 16),
+            num_output_channels=3,
+            framework='identity',
+            batch_size=2) as inferencer:
+        output = inferencer(image)
+
+    with Inferencer([None, None], None, patch_size,
+            output_patch_overlap=(2, 16, 16),
+            num_output_channels=[3, 1],
+            framework='identity',
+            batch_size=2) as inferencer:
+        assert inferencer.num_output_channels == 4
+        outputs = inferencer.split_output_chunk(inferencer(image))
+    assert outputs[0].shape == (3, 20, 160, 160)
+    assert outputs[1].shape == (1, 20, 160, 160)
+    for model_output in outputs:
+        assert model_output.voxel_offset == output.voxel_offset
+        np.testing.assert_array_equal(model_output.array, 
+            output.array[:model_output.shape[0], ...])
+
+
+@pytest.mark.parametrize('mask_output_chunk', [True, False])
+def test_accumulation_dtype(mask_output_chunk):
+    patch_size = (8, 64, 64)
+    image = Chunk.create(size=(20, 160, 160), dtype='uint8', 
+        voxel_offset=(3, 5, 7))
+    outputs = {}
+    for accumulation_dtype in ('float32', 'float16', 'uint16'):
+        with Inferencer(None, None, patch_size,
+                output_patch_overlap=(2, 16, 16),
+                num_output_channels=3,
+                framework='identity',
+                batch_size=2,
+                input_size=image.shape,
+                mask_output_chunk=mask_output_chunk,
+                accumulation_dtype=accumulation_dtype) as inferencer:
+            outputs[accumulation_dtype] = inferencer(image)
+    
+    assert outputs['float16'].dtype == np.float16
+    assert outputs['uint16'].dtype == np.float16
+    for accumulation_dtype in ('float16', 'uint16'):
+        output = outputs[accumulation_dtype]
+        assert output.voxel_offset == outputs['float32'].voxel_offset
+        np.testing.assert_allclose(output.array.astype(np.float32), 
+            outputs['float32'].array, rtol=2e-3, atol=2e-4)
+
+
+@pytest.mark.parametrize('accumulation_dtype', ['float32', 'float16', 'uint16'])
+def test_accumulation_out_of_range(accumulation_dtype):
+    image = Chunk(np.full((20, 160, 160), 1.5, dtype=np.float32))
+    with Inferencer(None, None, (8, 64, 64),
+            output_patch_overlap=(2, 16, 16),
+            num_output_channels=1,
+            framework='identity',
+            input_size=image.shape,
+            accumulation_dtype=accumulation_dtype) as inferencer:
+        with pytest.raises(AssertionError):
+            inferencer(image)
+
+
+@pytest.mark.parametrize('framework_args', [
+    'num_threads=1', 'jit=trace;channels_last=True', 'bfloat16=True'])
+def test_pytorch_cpu(tmp_path, monkeypatch, framework_args):
+    torch = pytest.importorskip('torch')
+    from click.testing import CliRunner
+    from chunkflow.flow.flow import main
+    monkeypatch.setattr(torch.cuda, 'is_available', lambda: False)
+
+    model_path = str(tmp_path / 'model.py')
+    with open(model_path, 'w') as file:
+        file.write('import torch\nInstantiatedModel = torch.nn.Conv3d(1, 1, 1)\n')
+    weight_path = str(tmp_path / 'model.chkpt')
+    torch.save(torch.nn.Conv3d(1, 1, 1).state_dict(), weight_path)
+
+    # the compute device is logged after the inference of every chunk
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        'create-chunk', '--size', '20', '160', '160',
+        'inference', '--convnet-model', model_path, 
+        '--convnet-weight-path', weight_path,
+        '--input-patch-size', '8', '64', '64', 
+        '--output-patch-overlap', '2', '16', '16',
+        '--framework', 'pytorch', '--framework-args', framework_args,
+        '--augment',
+    ])
+    assert result.exit_code == 0, result.output
+
+
+def test_universal_patch_mask(tmp_path):
+    # the plugin modifies its patch mask in place
+    plugin_path = str(tmp_path / 'plugin.py')
+    with open(plugin_path, 'w') as file:
+        file.write(
+            'class PatchInferencer:\n'
+            '    def __init__(self, weight_path, patch_mask):\n'
+            '        patch_mask *= 1\n'
+            '        self.patch_mask = patch_mask\n'
+            '    def __call__(self, input_patch):\n'
+            '        return input_patch * self.patch_mask\n')
+
+    patch_size = (8, 64, 64)
+    image = Chunk.create(size=(20, 160, 160), dtype='uint8')
+    outputs = []
+    for framework, convnet_model in (
+            ('identity', None), ('universal', plugin_path)):
+        with Inferencer(convnet_model, None, patch_size,
+                output_patch_overlap=(2, 16, 16),
+                num_output_channels=1,
+                framework=framework,
+                batch_size=2) as inferencer:
+            outputs.append(inferencer(image))
+            # the cached patch mask is still read only
+            assert not inferencer.patch_inferencer.output_patch_mask.flags.writeable
+    np.testing.assert_allclose(outputs[0].array, outputs[1].array, rtol=1e-6)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from chunkflow.flow.divid_conquer.patch_cache import PatchCache
+
+
+def test_patch_cache(tmp_path):
+    input_patch = np.random.rand(4, 8, 8).astype(np.float32)
+    output_patch = np.random.rand(3, 4, 8, 8).astype(np.float32)
+    bbox = (slice(0, 4), slice(0, 8), slice(0, 8))
+    
+    cache = PatchCache(str(tmp_path), model_identity='model')
+    key = cache.key(bbox, input_patch)
+    assert cache.get(key) is None
+    cache.put(key, output_patch)
+    np.testing.assert_array_equal(cache.get(key), output_patch)
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    # the key depends on the model, bounding box and input
+    assert key != PatchCache(str(tmp_path), model_identity='other').key(
+        bbox, input_patch)
+    assert key != cache.key((slice(4, 8), ) + bbox[1:], input_patch)
+    assert key != cache.key(bbox, input_patch + 1)
+
+    # the least recently used patches are evicted
+    patch_nbytes = cache.nbytes
+    cache = PatchCache(str(tmp_path), max_size=patch_nbytes * 2.5)
+    keys = [cache.key(bbox, input_patch + i) for i in range(3)]
+    cache.put(keys[0], output_patch)
+    cache.put(keys[1], output_patch)
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], output_patch)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+    assert cache.nbytes <= cache.max_size
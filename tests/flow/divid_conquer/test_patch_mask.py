@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import numpy as np
+import pytest
 from scipy.stats import describe
 
 from chunkflow.flow.divid_conquer.patch.patch_mask \
@@ -25,3 +27,33 @@ def test_patch_mask():
     #    os.remove(file_name)
     #with h5py.File(file_name, 'w') as f:
     #    f['/main'] = patch_mask
+
+
+def _make_patch_mask_by_blending(patch_size, overlap):
+    """the patch mask normalized by adding 3x3x3 bump maps."""
+    bump_map = make_bump_map(patch_size)
+    stride = tuple(p - o for p, o in zip(patch_size, overlap))
+    base_mask = np.zeros(tuple(p + 2 * s for p, s in zip(patch_size, stride)))
+    for nz, ny, nx in np.ndindex(3, 3, 3):
+        base_mask[nz*stride[0]:nz*stride[0]+patch_size[0],
+                  ny*stride[1]:ny*stride[1]+patch_size[1],
+                  nx*stride[2]:nx*stride[2]+patch_size[2]] += bump_map
+    return bump_map / base_mask[stride[0]:stride[0]+patch_size[0],
+        stride[1]:stride[1]+patch_size[1], stride[2]:stride[2]+patch_size[2]]
+
+
+@pytest.mark.parametrize('patch_size, overlap', [
+    ((8, 32, 32), (2, 8, 8)),
+    ((20, 64, 64), (4, 16, 16)),
+    ((4, 6, 8), (1, 2, 3)),
+])
+def test_patch_mask_values(patch_size, overlap):
+    patch_mask = PatchMask(patch_size, overlap)
+    assert patch_mask.dtype == np.float32
+    # the mask is cached
+    assert np.shares_memory(patch_mask, PatchMask(patch_size, overlap))
+    np.testing.assert_array_equal(patch_mask[overlap[0]:-overlap[0],
+        overlap[1]:-overlap[1], overlap[2]:-overlap[2]], 1)
+
+    expected = _make_patch_mask_by_blending(patch_size, overlap)
+    np.testing.assert_allclose(patch_mask, expected, rtol=1e-6, atol=1e-12)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from chunkflow.flow.divid_conquer.transform import TransformSequences, FlipLR
+
+
+def test_flip():
+    arr = np.random.rand(2, 3, 4, 5, 6)
+    # only the spatial axis is flipped
+    np.testing.assert_array_equal(FlipLR().forward(arr), arr[..., ::-1])
+
+
+def test_transform_sequences():
+    transform_sequences = TransformSequences(flipz=False)
+    arr = np.random.rand(2, 1, 4, 8, 8).astype(np.float32)
+
+    batch = transform_sequences.forward_batch(arr)
+    assert batch.shape == (16, 1, 4, 8, 8)
+    for idx, transformed in enumerate(transform_sequences.forward(arr)):
+        np.testing.assert_array_equal(batch[idx*2 : idx*2+2], transformed)
+
+    # the inverse transforms recover the original array
+    np.testing.assert_allclose(
+        transform_sequences.backward_batch(batch), arr, rtol=1e-6)
+    for inversed in transform_sequences.backward(
+            transform_sequences.forward(arr)):
+        np.testing.assert_array_equal(inversed, arr)
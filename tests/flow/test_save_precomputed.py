@@ -45,3 +45,34 @@ def test_save_image():
     
     sleep(2)
     shutil.rmtree(tempdir)
+
+
+def test_save_staging(tmp_path):
+    from click.testing import CliRunner
+    from chunkflow.flow.flow import main
+    volume_path = f'file://{tmp_path}/volume'
+    CloudVolume.from_numpy(np.zeros((64, 64, 8), dtype=np.uint8),
+        vol_path=volume_path, chunk_size=(32, 32, 4), layer_type='image')
+    staging_dir = str(tmp_path / 'staging')
+
+    # the chunk does not cover the last blocks in x
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        'create-chunk', '--size', '8', '64', '48', '--pattern', 'random',
+        'save-precomputed', '--volume-path', volume_path, 
+        '--staging-dir', staging_dir,
+    ])
+    assert result.exit_code == 0, result.output
+    vol = CloudVolume(volume_path)
+    # the partial blocks are not flushed by default
+    assert np.all(vol[32:64, :, :] == 0)
+    assert np.any(vol[:32, :, :] > 0)
+
+    result = runner.invoke(main, [
+        'flush-precomputed', '--volume-path', volume_path, 
+        '--staging-dir', staging_dir,
+    ])
+    assert result.exit_code == 0, result.output
+    assert np.any(vol[32:48, :, :] > 0)
+    assert np.all(vol[48:64, :, :] == 0)
+    assert len(list((tmp_path / 'staging' / 'mip0').iterdir())) == 0
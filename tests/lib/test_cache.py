@@ -0,0 +1,94 @@
+import pytest
+import numpy as np
+
+from cloudvolume import CloudVolume
+from cloudvolume.lib import generate_random_string
+from cloudvolume.exceptions import OutOfBoundsError
+
+from chunkflow.lib.cache import BlockCache, DiskCache
+from chunkflow.lib.cartesian_coordinate import BoundingBox, Cartesian
+
+
+def test_block_cache(tmp_path):
+    img = np.random.randint(0, 256, size=(20, 100, 100), dtype=np.uint8)
+    volume_path = f'file://{tmp_path}/volume/' + generate_random_string()
+    vol = CloudVolume.from_numpy(np.transpose(img), vol_path=volume_path,
+        voxel_offset=(10, 20, 30), chunk_size=(32, 32, 8))
+    offset = Cartesian(30, 20, 10)
+
+    cache = BlockCache(max_memory=1024**2, disk_dir=str(tmp_path / 'cache'))
+    bbox = BoundingBox.from_delta(offset + Cartesian(2, 10, 20), (10, 40, 50))
+    arr = cache.cutout(vol, bbox)
+    assert arr.shape == (1, 10, 40, 50)
+    np.testing.assert_array_equal(arr[0], img[2:12, 10:50, 20:70])
+    # 2x2x3 blocks were downloaded
+    assert cache.stats == {'memory_hits': 0, 'disk_hits': 0, 'misses': 12}
+
+    # the overlapping region is assembled from the cached blocks
+    bbox2 = BoundingBox.from_delta(offset + Cartesian(8, 40, 50), (20, 80, 80))
+    # the same with parallel_cutout, the region should be inside of a bounded volume
+    with pytest.raises(OutOfBoundsError):
+        cache.cutout(vol, bbox2)
+    vol = CloudVolume(volume_path, bounded=False)
+    arr = cache.cutout(vol, bbox2)
+    np.testing.assert_array_equal(arr[0, :12, :60, :50], img[8:, 40:, 50:])
+    # out of volume region is filled with zero
+    assert np.all(arr[0, 12:, ...] == 0)
+    assert cache.memory_hits == 2
+    assert cache.misses == 12 + 16
+
+    # the blocks in disk are shared by other caches
+    cache = BlockCache(max_memory=0, disk_dir=str(tmp_path / 'cache'))
+    arr = cache.cutout(vol, bbox)
+    np.testing.assert_array_equal(arr[0], img[2:12, 10:50, 20:70])
+    assert cache.stats == {'memory_hits': 0, 'disk_hits': 12, 'misses': 0}
+    assert len(cache.blocks) == 0
+
+    # the least recently used blocks are evicted from memory
+    cache = BlockCache(max_memory=32*32*8*3)
+    cache.cutout(vol, bbox)
+    assert len(cache.blocks) == 3
+
+
+class _RecordedVolume(object):
+    """record the requested regions of a volume."""
+    def __init__(self, vol):
+        self.vol = vol
+        self.requests = []
+
+    def __getattr__(self, name):
+        return getattr(self.vol, name)
+
+    def __getitem__(self, slices):
+        self.requests.append(BoundingBox.from_slices(slices[::-1]))
+        return self.vol[slices]
+
+
+def test_block_cache_downloads_missing_runs(tmp_path):
+    img = np.random.randint(0, 256, size=(16, 64, 96), dtype=np.uint8)
+    volume_path = f'file://{tmp_path}/volume/' + generate_random_string()
+    vol = CloudVolume.from_numpy(np.transpose(img), vol_path=volume_path,
+        chunk_size=(32, 32, 8))
+    vol = _RecordedVolume(vol)
+
+    cache = BlockCache()
+    # cache the center block column
+    cache.cutout(vol, BoundingBox.from_delta((0, 0, 32), (16, 64, 32)))
+    vol.requests.clear()
+
+    arr = cache.cutout(vol, BoundingBox.from_delta((0, 0, 0), (16, 64, 96)),
+        num_threads=2)
+    np.testing.assert_array_equal(arr[0], img)
+    # the cached blocks inside of the missing blocks are not downloaded again
+    assert len(vol.requests) == 8
+    assert set(vol.requests) == set(
+        BoundingBox.from_delta((z, y, x), (8, 32, 32))
+        for z in (0, 8) for y in (0, 32) for x in (0, 64))
+
+
+def test_disk_cache_overwrite(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put('a', np.zeros(100, dtype=np.uint8))
+    nbytes = cache.nbytes
+    cache.put('a', np.zeros(100, dtype=np.uint8))
+    assert cache.nbytes == nbytes
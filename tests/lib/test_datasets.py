@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import zarr
+
+from chunkflow.lib.datasets import open_dataset, open_zarr, open_tensorstore, \
+    clear_datasets
+
+
+def test_open_dataset():
+    calls = []
+    def _open():
+        calls.append(1)
+        return object()
+
+    dataset = open_dataset(('test', 'dataset'), _open)
+    assert open_dataset(('test', 'dataset'), _open) is dataset
+    assert len(calls) == 1
+
+    clear_datasets()
+    assert open_dataset(('test', 'dataset'), _open) is not dataset
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('n5', [False, True])
+def test_open_zarr(tmp_path, n5):
+    store_path = str(tmp_path / ('volume.n5' if n5 else 'volume.zarr'))
+    store = zarr.N5Store(store_path) if n5 else store_path
+    arr = np.random.rand(16, 32, 32).astype(np.float32)
+    zarr.open(store, mode='w', path='raw', shape=arr.shape,
+        chunks=(8, 16, 16), dtype=arr.dtype)[...] = arr
+
+    array = open_zarr(store_path, path='raw', n5=n5)
+    np.testing.assert_array_equal(array[...], arr)
+    assert open_zarr(store_path, path='raw', n5=n5) is array
+
+
+def test_open_tensorstore(tmp_path):
+    ts = pytest.importorskip('tensorstore')
+    spec = {
+        'driver': 'zarr',
+        'kvstore': {'driver': 'file', 'path': str(tmp_path / 'volume.zarr')},
+        'metadata': {'shape': [8, 8, 8], 'chunks': [4, 4, 4], 'dtype': '<f4'},
+        'create': True,
+    }
+    dataset = open_tensorstore(spec, cache_size=1024**2)
+    assert open_tensorstore(spec, cache_size=1024**2) is dataset
+    assert dataset.shape == (8, 8, 8)
@@ -0,0 +1,267 @@
+import os
+import json
+import threading
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from chunkflow.lib.flow import prefetch, chain_operators, operator, \
+    MemoryAccountant, MemorySizeParam, plan_variable_deletion, \
+    run_in_worker_processes
+from chunkflow.flow.flow import main
+
+
+def test_prefetch():
+    tasks = list(prefetch(iter(range(10)), 2))
+    assert tasks == list(range(10))
+
+    thread_ids = set()
+    def stage(stream):
+        for task in stream:
+            thread_ids.add(threading.get_ident())
+            yield task
+
+    tasks = list(prefetch(stage(prefetch(stage(range(5)), 1)), 1))
+    assert tasks == list(range(5))
+    # every stage runs in its own thread
+    assert len(thread_ids) == 2
+    assert threading.get_ident() not in thread_ids
+
+    def failed_stage(stream):
+        for task in stream:
+            if task == 3:
+                raise ValueError('failed stage')
+            yield task
+
+    with pytest.raises(ValueError):
+        list(prefetch(failed_stage(range(5)), 2))
+
+
+def test_pipeline_depth():
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        '--pipeline-depth', '2',
+        'generate-tasks', '--roi-start', '0', '0', '0',
+        '--chunk-size', '64', '64', '64', '--grid-size', '1', '2', '2',
+        'create-chunk', '--size', '64', '64', '64',
+        'downsample',
+    ])
+    assert result.exit_code == 0, result.output
+    assert result.output.count('executing task') == 4
+
+
+def test_workers():
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        '--workers', '2',
+        'generate-tasks', '--roi-start', '0', '0', '0',
+        '--chunk-size', '64', '64', '64', '--grid-size', '1', '2', '2',
+        'create-chunk', '--size', '64', '64', '64',
+        'downsample',
+    ])
+    assert result.exit_code == 0, result.output
+    assert '2 workers finished 4 tasks.' in result.output
+
+
+def test_workers_error(tmp_path):
+    # the first operator fails in the parent process
+    file_path = str(tmp_path / 'bad.npy')
+    with open(file_path, 'w') as file:
+        file.write('not a numpy file')
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        '--workers', '2',
+        'fetch-task-from-file', '--file-path', file_path, '--job-index', '0',
+        'create-chunk', '--size', '64', '64', '64',
+        'downsample',
+    ])
+    assert isinstance(result.exception, ValueError)
+
+    # an operator fails in the worker processes
+    def fail(stream):
+        for task in stream:
+            raise ValueError('failed operator')
+            yield task
+    with pytest.raises(RuntimeError):
+        run_in_worker_processes([{'log': {}}], [fail], 2)
+
+    # a killed worker never reports that it is done
+    def die(stream):
+        for task in stream:
+            os._exit(1)
+            yield task
+    with pytest.raises(RuntimeError):
+        run_in_worker_processes([{'log': {}}, {'log': {}}], [die], 2)
+
+
+def test_memory_size_param():
+    assert MemorySizeParam.convert('32G', None, None) == 32 * 1024**3
+    assert MemorySizeParam.convert('512m', None, None) == 512 * 1024**2
+    assert MemorySizeParam.convert('1.5KB', None, None) == 1536
+    assert MemorySizeParam.convert('100', None, None) == 100
+
+
+def test_memory_accountant():
+    # every task holds 1000 bytes and the budget is two tasks
+    accountant = MemoryAccountant(2000)
+    max_nbytes = []
+
+    def source(stream):
+        for _ in stream:
+            for _ in range(10):
+                yield {'chunk': np.zeros(1000, dtype=np.uint8)}
+
+    def stage(stream):
+        for task in stream:
+            max_nbytes.append(accountant.nbytes)
+            yield task
+
+    stream = chain_operators([{}], [source, stage, stage], 
+        pipeline_depth=4, accountant=accountant)
+    task_num = 0
+    for task in stream:
+        accountant.release(task)
+        task_num += 1
+    assert task_num == 10
+    # a task is measured after it is created, so the budget could be 
+    # exceeded by at most one task before the upstream blocks.
+    assert max(max_nbytes) <= 3000
+    assert accountant.nbytes == 0
+
+    # a single task larger than the budget still passes through
+    accountant = MemoryAccountant(10)
+    stream = chain_operators([{}], [source, stage], 
+        pipeline_depth=2, accountant=accountant)
+    for task in stream:
+        accountant.release(task)
+    assert accountant.nbytes == 0
+
+
+def test_memory_accountant_replaced_tasks():
+    accountant = MemoryAccountant(10**6)
+
+    def source(stream):
+        for _ in stream:
+            for _ in range(10):
+                yield {'chunk': np.zeros(1000, dtype=np.uint8)}
+
+    def copy(stream):
+        for task in stream:
+            yield None if task is None else dict(task)
+
+    def replace(stream):
+        for task in stream:
+            yield {'chunk': task['chunk'][:500]}
+
+    def skip(stream):
+        for idx, task in enumerate(stream):
+            yield None if idx % 3 == 0 else task
+
+    def drop(stream):
+        for idx, task in enumerate(stream):
+            if idx % 4 != 1:
+                yield task
+
+    for pipeline_depth in (0, 2):
+        stream = chain_operators([{}], 
+            [source, copy, replace, skip, drop, copy], 
+            pipeline_depth=pipeline_depth, accountant=accountant)
+        task_num = 0
+        for task in stream:
+            if task is not None:
+                # the accountant does not add any variable to the task
+                assert list(task.keys()) == ['chunk']
+                task_num += 1
+            accountant.release(task)
+        # 4 tasks are skipped and 2 tasks are dropped
+        assert task_num == 4
+        assert accountant.task_nbytes == {}
+        assert len(accountant.yielded_tasks) == 0
+
+    # a skipped task does not release the other tasks in flight
+    accountant = MemoryAccountant(10**6)
+    stream = chain_operators([{}], [source], accountant=accountant)
+    task = next(stream)
+    accountant.release(None)
+    assert accountant.nbytes == 1000
+    accountant.release(task)
+    assert accountant.nbytes == 0
+
+
+def test_plan_variable_deletion():
+    @operator
+    def process(tasks, input_chunk_name: str, output_chunk_name: str):
+        for task in tasks:
+            yield task
+
+    @operator
+    def debug(tasks):
+        for task in tasks:
+            yield task
+
+    operators = [
+        process(input_chunk_name='bbox', output_chunk_name='image'),
+        process(input_chunk_name='image', output_chunk_name='affs'),
+        process(input_chunk_name='affs', output_chunk_name='seg'),
+        process(input_chunk_name='seg', output_chunk_name='image'),
+    ]
+    assert operators[0].name == 'process'
+    delete_vars = plan_variable_deletion(operators)
+    assert delete_vars == [set(), {'image'}, {'affs'}, {'seg', 'image'}]
+
+    # the variables are kept alive until the debug operator
+    delete_vars = plan_variable_deletion(operators[:2] + [debug()] + operators[2:])
+    assert delete_vars == [set(), set(), set(), {'affs'}, {'seg', 'image'}]
+
+    # delete the variables from tasks
+    task = {'bbox': 1}
+    def fill(stream):
+        for task in stream:
+            task['image'] = 1
+            task['affs'] = 2
+            yield task
+    stream = chain_operators([task], [fill], delete_vars=[{'image'}])
+    assert list(stream) == [{'bbox': 1, 'affs': 2}]
+
+
+def test_auto_delete_var():
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        '--auto-delete-var', '--verbose',
+        'generate-tasks', '--roi-start', '0', '0', '0',
+        '--chunk-size', '64', '64', '64', '--grid-size', '1', '1', '2',
+        'create-chunk', '--size', '64', '64', '64', '-o', 'image',
+        'downsample', '-i', 'image', '-o', 'small',
+        'copy-var', '-f', 'small', '-t', 'chunk',
+    ])
+    assert result.exit_code == 0, result.output
+    assert "delete ['image'] after downsample" in result.output
+    # the operators are named by the commands
+    assert "delete ['chunk', 'small'] after copy-var" in result.output
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_trace(tmp_path, workers):
+    trace = str(tmp_path / 'trace.json')
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        '--trace', trace, '--workers', str(workers),
+        'generate-tasks', '--roi-start', '0', '0', '0',
+        '--chunk-size', '64', '64', '64', '--grid-size', '1', '1', '2',
+        'create-chunk', '--size', '64', '64', '64',
+        'downsample', '-o', 'small',
+    ])
+    assert result.exit_code == 0, result.output
+    with open(trace) as file:
+        events = json.load(file)['traceEvents']
+    names = [event['name'] for event in events]
+    for name in ('generate-tasks', 'create-chunk', 'downsample'):
+        assert names.count(name) == 2
+    for event in events:
+        assert event['ph'] == 'X'
+        assert event['dur'] >= 0
+        if event['name'] == 'downsample':
+            assert event['args']['bytes_in'] == {'chunk': 64**3}
+            assert event['args']['bytes_out'] == {
+                'chunk': 64**3, 'small': 32**3}
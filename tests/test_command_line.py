@@ -2,7 +2,31 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import subprocess
+
+# the maximum time to start the command line interface in seconds
+STARTUP_TIME_THRESHOLD = 2.
 
 
 def test_composable_command_line_interface():
     os.system('./command_line.sh')
+
+
+def test_startup_time():
+    code = '''
+import sys
+from time import time
+start = time()
+import chunkflow.flow.flow
+print(time() - start)
+heavy = ('cloudvolume', 'torch', 'zarr', 'h5py', 'napari', 'neuroglancer',
+    'chunkflow.flow.divid_conquer.inferencer')
+print(','.join(name for name in heavy if name in sys.modules))
+'''
+    output = subprocess.run([sys.executable, '-c', code], 
+        capture_output=True, text=True, check=True).stdout.split('\n')
+    elapsed = float(output[0])
+    assert output[1] == '', f'heavy modules are imported: {output[1]}'
+    assert elapsed < STARTUP_TIME_THRESHOLD, \
+        f'importing the command line takes {elapsed} seconds'
@@ -1,10 +1,16 @@
 import shutil
 
 import numpy as np
+import pytest
 
+from cloudvolume import CloudVolume
+from cloudvolume.exceptions import OutOfBoundsError, AlignmentError
 from cloudvolume.lib import generate_random_string
 from chunkflow.lib.cartesian_coordinate import BoundingBox, Cartesian
-from chunkflow.volume import PrecomputedVolume
+from chunkflow.lib.cache import BlockCache
+from chunkflow.chunk import Chunk
+from chunkflow.volume import PrecomputedVolume, ZarrVolume, N5Volume, \
+    parallel_cutout, AlignedSaver, load_chunk_or_volume, _block_aligned_slabs
 
 
 def test_volume():
@@ -33,4 +39,178 @@ def test_volume():
     assert offset == chunk.voxel_offset
     np.testing.assert_array_equal(chunk, img[4:-4, 64:-64, 64:-64])
 
-    shutil.rmtree('/tmp/test')
\ No newline at end of file
+    shutil.rmtree('/tmp/test')
+
+def test_volume_block_cache(tmp_path):
+    img = np.random.randint(0, 256, size=(36, 448, 448), dtype=np.uint8)
+    volume_path = f'file://{tmp_path}/volume'
+    vol = PrecomputedVolume.from_numpy(img, volume_path)
+    vol = PrecomputedVolume(vol.vol, None, block_cache=BlockCache())
+
+    bbox = BoundingBox.from_delta(Cartesian(4, 64, 64), (28, 320, 320))
+    chunk = vol.cutout(bbox)
+    assert chunk.voxel_offset == bbox.start
+    np.testing.assert_array_equal(chunk, img[4:-4, 64:-64, 64:-64])
+    chunk = vol.cutout(list(bbox.slices))
+    np.testing.assert_array_equal(chunk, img[4:-4, 64:-64, 64:-64])
+    assert vol.block_cache.misses > 0
+    assert vol.block_cache.memory_hits == vol.block_cache.misses
+
+
+def test_parallel_cutout(tmp_path):
+    img = np.random.randint(0, 256, size=(2, 20, 100, 100), dtype=np.uint8)
+    vol = CloudVolume.from_numpy(np.transpose(img),
+        vol_path=f'file://{tmp_path}/volume',
+        voxel_offset=(30, 20, 10), chunk_size=(32, 32, 8))
+
+    bbox = BoundingBox.from_delta(Cartesian(12, 30, 50), (10, 40, 50))
+    for num_threads in (1, 2, 4):
+        arr = parallel_cutout(vol, bbox, num_threads=num_threads)
+        assert arr.flags.c_contiguous
+        np.testing.assert_array_equal(arr, img[:, 2:12, 10:50, 20:70])
+
+    # the requests are block aligned slabs, at most one per thread
+    slabs = _block_aligned_slabs(BoundingBox.from_delta(Cartesian(10, 20, 30),
+        (20, 100, 100)), Cartesian(8, 32, 32), bbox, 2)
+    assert slabs == [
+        BoundingBox(Cartesian(12, 30, 50), Cartesian(22, 70, 94)),
+        BoundingBox(Cartesian(12, 30, 94), Cartesian(22, 70, 100)),
+    ]
+
+    # out of bounds cutout raises error for bounded volume
+    bbox = BoundingBox.from_delta(Cartesian(0, 0, 0), (40, 140, 140))
+    with pytest.raises(OutOfBoundsError):
+        parallel_cutout(vol, bbox)
+
+    # out of volume region is filled with zero
+    vol = CloudVolume(f'file://{tmp_path}/volume', bounded=False)
+    arr = parallel_cutout(vol, bbox)
+    np.testing.assert_array_equal(arr[:, 10:30, 20:120, 30:130], img)
+    assert arr.sum() == img.sum()
+
+
+def _staged_blocks(staging_dir):
+    return [path for path in staging_dir.iterdir() if path.is_dir()]
+
+
+def test_aligned_saver(tmp_path):
+    img = np.zeros((20, 100, 100), dtype=np.uint8)
+    vol = CloudVolume.from_numpy(np.transpose(img),
+        vol_path=f'file://{tmp_path}/volume',
+        voxel_offset=(30, 20, 10), chunk_size=(32, 32, 8))
+    offset = Cartesian(10, 20, 30)
+    saver = AlignedSaver(vol, staging_dir=str(tmp_path / 'staging'),
+        num_threads=4)
+    staging_dir = tmp_path / 'staging' / 'mip0'
+
+    # two chunks splitting the blocks in x
+    expected = np.random.randint(1, 256, size=img.shape, dtype=np.uint8)
+    saver.save(expected[:, :, :40],
+        BoundingBox.from_delta(offset, (20, 100, 40)))
+    # the first block in x is fully covered
+    np.testing.assert_array_equal(
+        np.asarray(vol[30:62, 20:120, 10:30]).T[0], expected[:, :, :32])
+    # the partial blocks are staged
+    assert np.all(np.asarray(vol[62:70, 20:120, 10:30]) == 0)
+    assert len(_staged_blocks(staging_dir)) == 3 * 4
+
+    # the second chunk completes the staged blocks
+    saver.save(expected[:, :, 40:],
+        BoundingBox.from_delta(offset + Cartesian(0, 0, 40), (20, 100, 60)))
+    np.testing.assert_array_equal(
+        np.asarray(vol[30:130, 20:120, 10:30]).T[0], expected)
+    # the lock files are removed with the merged blocks
+    assert len(list(staging_dir.iterdir())) == 0
+
+    # the incomplete blocks are merged with the existing data in flush
+    saver.save(np.zeros((4, 4, 4), dtype=np.uint8),
+        BoundingBox.from_delta(offset + Cartesian(2, 2, 2), (4, 4, 4)))
+    assert len(_staged_blocks(staging_dir)) == 1
+    saver.flush()
+    expected[2:6, 2:6, 2:6] = 0
+    np.testing.assert_array_equal(
+        np.asarray(vol[30:130, 20:120, 10:30]).T[0], expected)
+    assert len(list(staging_dir.iterdir())) == 0
+
+
+def test_aligned_saver_parallel(tmp_path, monkeypatch):
+    img = np.zeros((16, 64, 64), dtype=np.uint8)
+    vol = CloudVolume.from_numpy(np.transpose(img),
+        vol_path=f'file://{tmp_path}/volume', chunk_size=(32, 32, 8))
+    vol.parallel = 2
+    thread_nums = []
+    monkeypatch.setattr('chunkflow.volume._map_in_threads',
+        lambda func, items, num_threads: thread_nums.append(num_threads))
+    # the threads are not nested inside of the processes of CloudVolume
+    AlignedSaver(vol, num_threads=4).save(img, BoundingBox.from_delta(
+        Cartesian(0, 0, 0), img.shape))
+    assert thread_nums == [1]
+
+
+@pytest.mark.parametrize('volume_class', [ZarrVolume, N5Volume])
+def test_zarr_volume(tmp_path, volume_class):
+    img = np.random.randint(0, 256, size=(2, 20, 100, 100), dtype=np.uint8)
+    path = str(tmp_path / f'volume{volume_class._suffix}/raw')
+    volume_class.from_numpy(img, path, chunks=(1, 8, 32, 32),
+        voxel_offset=(10, 20, 30), voxel_size=(40, 4, 4))
+
+    vol = load_chunk_or_volume(path)
+    assert isinstance(vol, volume_class)
+    assert vol.voxel_size == Cartesian(40, 4, 4)
+    assert vol.block_size == Cartesian(8, 32, 32)
+    assert vol.bounding_box == BoundingBox.from_delta(
+        Cartesian(10, 20, 30), (20, 100, 100))
+    # the store handle is reused
+    assert load_chunk_or_volume(path).array is vol.array
+
+    bbox = BoundingBox.from_delta(Cartesian(12, 30, 50), (10, 40, 50))
+    chunk = vol.cutout(bbox)
+    assert chunk.voxel_offset == bbox.start
+    np.testing.assert_array_equal(chunk.array, img[:, 2:12, 10:50, 20:70])
+    # out of volume region is filled with zero
+    chunk = vol.cutout(BoundingBox.from_delta(Cartesian(0, 0, 0), (40, 140, 140)))
+    np.testing.assert_array_equal(chunk.array[:, 10:30, 20:120, 30:130], img)
+    assert chunk.array.sum() == img.sum()
+    assert vol.has_all_blocks(vol.bounding_box)
+
+    vol = volume_class.from_path(path, mode='r+', num_threads=4)
+    chunk = Chunk(np.zeros((2, 10, 40, 50), dtype=np.uint8),
+        voxel_offset=bbox.start)
+    vol.save(chunk)
+    img[:, 2:12, 10:50, 20:70] = 0
+    np.testing.assert_array_equal(vol.array[...], img)
+
+
+def test_aligned_saver_without_staging(tmp_path):
+    img = np.zeros((20, 100, 100), dtype=np.uint8)
+    path = f'file://{tmp_path}/volume'
+    CloudVolume.from_numpy(np.transpose(img), vol_path=path,
+        voxel_offset=(30, 20, 10), chunk_size=(32, 32, 8))
+    bbox = BoundingBox.from_delta(Cartesian(12, 22, 34), (12, 70, 80))
+    arr = np.random.randint(1, 256, size=bbox.shape, dtype=np.uint8)
+
+    # the unaligned chunk fails before writing anything
+    vol = CloudVolume(path, non_aligned_writes=False)
+    with pytest.raises(AlignmentError):
+        AlignedSaver(vol).save(arr, bbox)
+    assert np.all(np.asarray(vol[:, :, :]) == 0)
+
+    vol = CloudVolume(path, non_aligned_writes=True)
+    AlignedSaver(vol, num_threads=2).save(arr, bbox)
+    img[2:14, 2:72, 4:84] = arr
+    np.testing.assert_array_equal(np.asarray(vol[:, :, :]).T[0], img)
+
+
+def test_volume_staging(tmp_path):
+    img = np.random.randint(1, 256, size=(8, 64, 64), dtype=np.uint8)
+    vol = PrecomputedVolume.from_numpy(np.zeros_like(img),
+        f'file://{tmp_path}/volume')
+    vol = PrecomputedVolume(vol.vol, None,
+        staging_dir=str(tmp_path / 'staging'))
+    # the volume keeps one saver, the staged blocks are uploaded in flush
+    vol.save(Chunk(img[:, :, :40]))
+    vol.save(Chunk(img[:4, :, 40:], voxel_offset=(0, 0, 40)))
+    vol.flush()
+    expected = img.copy()
+    expected[4:, :, 40:] = 0
+    np.testing.assert_array_equal(vol.cutout(vol.bounding_box).array, expected)